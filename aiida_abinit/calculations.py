@@ -4,17 +4,16 @@ import io
 import os
 import typing as ty
 
-from pymatgen.io.abinit.abiobjects import structure_to_abivars
-from abipy.abio.inputs import AbinitInput
-from abipy.core.structure import Structure as AbiStructure
-from abipy.data.hgh_pseudos import HGH_TABLE
+import numpy as np
 
 from aiida import orm
 from aiida.common import constants, datastructures, exceptions
 from aiida.engine import CalcJob
 from aiida_pseudo.data.pseudo import Psp8Data, JthXmlData
 
-from aiida_abinit.utils import uppercase_dict, seconds_to_timelimit
+from aiida_abinit.utils import (PhaseProfiler, get_parser_options, get_profiling_options, get_sanitized_structure,
+                                get_staged_pseudo_paths, get_timelimit_seconds, render_abinit_datasets,
+                                render_abinit_input, uppercase_dict, seconds_to_timelimit)
 
 
 class AbinitCalculation(CalcJob):
@@ -25,6 +24,9 @@ class AbinitCalculation(CalcJob):
     _DEFAULT_OUTPUT_EXTENSION = 'out'
     _PSEUDO_SUBFOLDER = './pseudo/'
 
+    # NOTE: need to refine the `abi_sanitize` parameters
+    _SANITIZE_PARAMETERS = {'symprec': 1e-3, 'angle_tolerance': 5, 'primitive': True, 'primitive_standard': False}
+
     _BLOCKED_KEYWORDS = [
         # Structure-related keywords set automatically from the `StructureData``
         'acell',
@@ -49,6 +51,16 @@ class AbinitCalculation(CalcJob):
         'wtk'
     ]
 
+    # Policies for the retrieval of the NetCDF output files through the `NETCDF_RETRIEVAL` setting
+    _NETCDF_RETRIEVAL_POLICIES = ('keep', 'temporary', 'none')
+
+    # Restart files that can be staged from the `parent_calc_folder` with the `PARENT_RESTART_FILES` setting, with the
+    # input variable telling ABINIT to read them
+    _RESTART_FILES = {'WFK': 'irdwfk', 'DEN': 'irdden', 'HIST': None}
+
+    # Multi-dataset keywords set automatically from the `DATASETS` setting
+    _DATASET_KEYWORDS = ['ndtset', 'jdtset', 'udtset']
+
     @classmethod
     def define(cls, spec):
         """Define inputs and outputs of the calculation."""
@@ -89,6 +101,12 @@ class AbinitCalculation(CalcJob):
                              valid_type=(Psp8Data, JthXmlData),
                              help='The pseudopotentials.',
                              dynamic=True)
+        spec.input_namespace('dataset_structures',
+                             valid_type=orm.StructureData,
+                             required=False,
+                             help='Structures of a packed calculation, with the dataset as key, e.g. `ds2`. Datasets '
+                                  'without structure use the `structure` input.',
+                             dynamic=True)
         options = spec.inputs['metadata']['options']
         options['parser_name'].default = 'abinit'
         options['resources'].default = {'num_machines': 1, 'num_mpiprocs_per_machine': 1}
@@ -127,6 +145,10 @@ class AbinitCalculation(CalcJob):
                        message='The SCF minimization cycle did not converge.')
         spec.exit_code(501, 'ERROR_GEOMETRY_CONVERGENCE_NOT_REACHED',
                        message='The ionic minimization cycle did not converge.')
+        spec.exit_code(502, 'ERROR_SCF_DIVERGED',
+                       message='The calculation was stopped by the monitor because its SCF cycle diverged or stalled.')
+        spec.exit_code(503, 'ERROR_RELAXATION_STALLED',
+                       message='The calculation was stopped by the monitor because its relaxation stalled.')
 
         # Outputs
         spec.output('output_parameters',
@@ -141,10 +163,19 @@ class AbinitCalculation(CalcJob):
                     valid_type=orm.TrajectoryData,
                     required=False,
                     help='Trajectory of various output quantities over the calculation if present.')
+        spec.output('output_arrays',
+                    valid_type=orm.ArrayData,
+                    required=False,
+                    help='Forces and stress tensor, whose units are given in `output_parameters`.')
         spec.output('output_bands',
                     valid_type=orm.BandsData,
                     required=False,
                     help='Final electronic bands if present.')
+        spec.output_namespace('output_datasets',
+                              valid_type=orm.Dict,
+                              required=False,
+                              help='Various output quantities of each dataset of a packed calculation.',
+                              dynamic=True)
         spec.default_output_node = 'output_parameters'
 
     def _validate_parameters(self):
@@ -172,34 +203,68 @@ class AbinitCalculation(CalcJob):
                 f'Pseudos: {pseudos_str};\nKinds:{kinds_str}'
             )
 
+    def _validate_datasets(self, datasets: list):
+        """Validate the `DATASETS` setting and the 'dataset_structures' input namespace.
+
+        Check that each dataset is a dictionary without blocked keywords, that the parameters do not already define
+        multiple datasets and that each dataset structure belongs to an existing dataset and has pseudopotentials.
+        """
+        if not isinstance(datasets, (list, tuple)) or not datasets:
+            raise exceptions.InputValidationError('The `DATASETS` setting should be a non-empty list of dictionaries.')
+
+        keyword_intersection = set(self.inputs.parameters.keys()) & set(self._DATASET_KEYWORDS)
+        if keyword_intersection:
+            raise exceptions.InputValidationError(
+                f"Multi-dataset keywords cannot be combined with the `DATASETS` setting: "
+                f"{', '.join(list(keyword_intersection))}"
+            )
+
+        for index, dataset in enumerate(datasets, start=1):
+            if not isinstance(dataset, dict):
+                raise exceptions.InputValidationError(f'Dataset {index} of the `DATASETS` setting is not a dictionary.')
+            keyword_intersection = set(dataset.keys()) & set(self._BLOCKED_KEYWORDS + self._DATASET_KEYWORDS)
+            if keyword_intersection:
+                raise exceptions.InputValidationError(
+                    f"Some blocked input keywords were provided for dataset {index}: "
+                    f"{', '.join(list(keyword_intersection))}"
+                )
+
+        labels = [f'ds{index}' for index in range(1, len(datasets) + 1)]
+        for label, structure in self.inputs.get('dataset_structures', {}).items():
+            if label not in labels:
+                raise exceptions.InputValidationError(f'Dataset structure `{label}` does not match any dataset.')
+            missing_kinds = set(structure.get_kind_names()) - set(self.inputs.pseudos.keys())
+            if missing_kinds:
+                raise exceptions.InputValidationError(
+                    f"No pseudos defined for the kinds of dataset structure `{label}`: {', '.join(missing_kinds)}"
+                )
+
     def _generate_inputdata(self,
                             parameters: orm.Dict,
                             pseudos,
                             structure: orm.StructureData,
-                            kpoints: orm.KpointsData) -> ty.Tuple[str, list]:
+                            kpoints: orm.KpointsData,
+                            native_writer: bool = False) -> ty.Tuple[str, list]:
         """Generate the input file content and list of pseudopotential files to copy.
 
         :param parameters: input parameters Dict
         :param pseudos: pseudopotential input namespace
         :param structure: input structure
         :param kpoints: input kpoints
+        :param native_writer: if True, write the input file with `render_abinit_input` instead of `AbinitInput`
         :returns: input file content, pseudopotential copy list
         """
         local_copy_pseudo_list = []
 
-        # `abipy`` has its own subclass of Pymatgen's `Structure`, so we use that
-        pmg_structure = structure.get_pymatgen()
-        abi_structure = AbiStructure.as_structure(pmg_structure)
-        # NOTE: need to refine the `abi_sanitize` parameters
-        abi_structure = abi_structure.abi_sanitize(symprec=1e-3, angle_tolerance=5,
-            primitive=True, primitive_standard=False)
+        # The sanitized structure and its abivars are cached, as `abi_sanitize` is expensive for large cells
+        abi_structure, structure_abivars = get_sanitized_structure(structure, **self._SANITIZE_PARAMETERS)
 
         for kind in structure.get_kind_names():
             pseudo = pseudos[kind]
             local_copy_pseudo_list.append((pseudo.uuid, pseudo.filename, f'{self._PSEUDO_SUBFOLDER}{pseudo.filename}'))
         # Pseudopotentials _must_ be listed in the same order as 'znucl' in the input file.
         # So, we need to get 'znucl' as abipy will write it then construct the appropriate 'pseudos' string.
-        znucl = structure_to_abivars(abi_structure)['znucl']
+        znucl = structure_abivars['znucl']
         ordered_pseudo_filenames = [pseudos[constants.elements[Z]['symbol']].filename for Z in znucl]
         pseudo_parameters = {
             'pseudos': '"' + ', '.join(ordered_pseudo_filenames) + '"',
@@ -207,9 +272,24 @@ class AbinitCalculation(CalcJob):
         }
 
         input_parameters = parameters.get_dict()
+        input_parameters = {**input_parameters, **pseudo_parameters}
+
+        if native_writer:
+            abivars = dict(input_parameters)
+            try:
+                ngkpt = kpoints.get_kpoints_mesh()[0]
+            except AttributeError:
+                kpt = kpoints.get_kpoints()
+                abivars.update(kptopt=abivars.get('kptopt', 0), kptnrm=abivars.get('kptnrm', 1), kpt=kpt, nkpt=len(kpt))
+            else:
+                shiftk = np.reshape(abivars.get('shiftk', [0.0, 0.0, 0.0]), (-1, 3))
+                abivars.update(ngkpt=ngkpt, kptopt=abivars.get('kptopt', 1), nshiftk=len(shiftk), shiftk=shiftk)
+
+            return render_abinit_input(abivars, structure_abivars), local_copy_pseudo_list
 
         # Use `abipy`` to write the input file
-        input_parameters = {**input_parameters, **pseudo_parameters}
+        from abipy.abio.inputs import AbinitInput
+        from abipy.data.hgh_pseudos import HGH_TABLE
 
         # `AbinitInput` requires a valid pseudo table / list of pseudos, so we give it the `HGH_TABLE`,
         # which should always work. In the end, we do _not_ print these to the input file.
@@ -232,18 +312,136 @@ class AbinitCalculation(CalcJob):
 
         return abi_input.to_string(with_pseudos=False), local_copy_pseudo_list
 
+    def _generate_datasetdata(self, datasets: list, structure: orm.StructureData, dataset_structures) -> str:
+        """Generate the multi-dataset block of the input file of a packed calculation.
+
+        The variables of the main input file are shared by all datasets. Each dataset overrides the parameters given in
+        the `DATASETS` setting and, if present in `dataset_structures`, the structure variables.
+
+        :param datasets: list with the input parameters of each dataset
+        :param structure: input structure, which defines the types of atoms of all datasets
+        :param dataset_structures: mapping of dataset labels (e.g. `ds2`) onto structures
+        :returns: content of the multi-dataset block of the input file
+        """
+        _, structure_abivars = get_sanitized_structure(structure, **self._SANITIZE_PARAMETERS)
+        dataset_abivars = []
+
+        for index, dataset in enumerate(datasets, start=1):
+            abivars = dict(dataset)
+            if f'ds{index}' in dataset_structures:
+                _, abivars_structure = get_sanitized_structure(
+                    dataset_structures[f'ds{index}'], **self._SANITIZE_PARAMETERS
+                )
+                # The `znucl` (and thus the order of the pseudos) is shared by all datasets
+                if list(abivars_structure['znucl']) != list(structure_abivars['znucl']):
+                    raise exceptions.InputValidationError(
+                        f'The structure of dataset {index} does not have the same types of atoms as `structure`.'
+                    )
+                abivars.update({
+                    name: value for name, value in abivars_structure.items() if name not in ['ntypat', 'znucl']
+                })
+            dataset_abivars.append(abivars)
+
+        try:
+            return render_abinit_datasets(dataset_abivars)
+        except ValueError as exception:
+            raise exceptions.InputValidationError(str(exception)) from exception
+
+    def _generate_pseudo_lists(self, local_copy_pseudo_list: list, dirpath: str) -> ty.Tuple[list, list]:
+        """Generate the lists of pseudopotential files to copy and to symlink from a content-addressed remote cache.
+
+        The pseudopotentials recorded as staged to the cache directory on the computer of the calculation, e.g. with the
+        `aiida-abinit stage-pseudos` command, are symlinked when the calculation is uploaded. No transport is opened to
+        stage the others, which are copied instead.
+
+        :param local_copy_pseudo_list: pseudopotential copy list as returned by `_generate_inputdata`
+        :param dirpath: absolute path of the remote cache directory
+        :returns: the pseudopotential copy and symlink lists
+        """
+        computer = self.node.computer
+
+        try:
+            remote_paths = get_staged_pseudo_paths(self.inputs.pseudos.values(), computer, dirpath)
+        except ValueError as exception:
+            raise exceptions.InputValidationError(str(exception)) from exception
+
+        copy_list = []
+        symlink_list = []
+        for pseudo_uuid, filename, target in local_copy_pseudo_list:
+            if pseudo_uuid in remote_paths:
+                symlink_list.append((computer.uuid, remote_paths[pseudo_uuid], target))
+            else:
+                copy_list.append((pseudo_uuid, filename, target))
+
+        if copy_list:
+            filenames = ', '.join(filename for _, filename, _ in copy_list)
+            self.logger.warning(
+                f'pseudopotentials not staged to `{dirpath}` on computer `{computer.label}` are copied: {filenames}'
+            )
+
+        return copy_list, symlink_list
+
+    def _generate_restart_lists(self, parameters: dict, settings: dict) -> ty.Tuple[list, list, dict]:
+        """Generate the lists of restart files to copy or symlink from the `parent_calc_folder`.
+
+        Only the files that ABINIT reads are staged, with their output name in the parent folder (e.g. `aiidao_WFK`)
+        mapped onto the corresponding input name (e.g. `aiidai_WFK`). The `PARENT_RESTART_FILES` setting lists the files
+        to stage, by default the wavefunctions and, when moving ions, the trajectory. Files are symlinked if the parent
+        folder is on the same computer, otherwise they are copied; the `PARENT_FOLDER_SYMLINK` setting overrides this.
+
+        :param parameters: input parameters
+        :param settings: input settings
+        :returns: remote copy list, remote symlink list and the input parameters to read the staged files
+        """
+        parent_folder = self.inputs.parent_calc_folder
+        prefix = self.metadata.options.prefix
+
+        default_restart_files = ['WFK', 'HIST'] if parameters.get('ionmov', 0) > 0 else ['WFK']
+        restart_files = [name.upper() for name in settings.pop('PARENT_RESTART_FILES', default_restart_files)]
+        unknown_files = set(restart_files) - set(self._RESTART_FILES)
+        if unknown_files:
+            raise exceptions.InputValidationError(
+                f"Unknown `PARENT_RESTART_FILES`: {', '.join(sorted(unknown_files))}, should be among: "
+                f"{', '.join(self._RESTART_FILES)}"
+            )
+
+        stage_list = []
+        restart_parameters = {}
+        for name in restart_files:
+            # The wavefunctions and density are written in NetCDF format when `iomode` is 3
+            extension = '.nc' if name == 'HIST' or parameters.get('iomode', 0) == 3 else ''
+            source = os.path.join(parent_folder.get_remote_path(), f'{prefix}o_{name}{extension}')
+            stage_list.append((parent_folder.computer.uuid, source, f'{prefix}i_{name}{extension}'))
+            # ABINIT refuses both `ird*` and `get*` variables for the same file, so explicit parameters take precedence
+            variable = self._RESTART_FILES[name]
+            if variable is not None and not {variable, variable.replace('ird', 'get')} & set(parameters):
+                restart_parameters[variable] = 1
+
+        # Symlink by default if on the same computer, otherwise copy by default
+        same_computer = self.inputs.code.computer.uuid == parent_folder.computer.uuid
+        if settings.pop('PARENT_FOLDER_SYMLINK', same_computer):
+            return [], stage_list, restart_parameters
+
+        return stage_list, [], restart_parameters
+
     def _generate_cmdline_params(self, settings: dict) -> ty.List[str]:
         # The input file has to be the first parameter
         cmdline_params = [self.metadata.options.input_filename]
 
-        # If a max wallclock is set in the `options`, we also set the `--timelimit` param
+        # If a max wallclock is set in the `options`, we also set the `--timelimit` param, with a margin for ABINIT to
+        # write its output files before the scheduler kills it
+        timelimit_margin = settings.pop('TIMELIMIT_MARGIN', None)
         if 'max_wallclock_seconds' in self.metadata.options:
             max_wallclock_seconds = self.metadata.options.max_wallclock_seconds
-            cmdline_params.extend(['--timelimit', seconds_to_timelimit(max_wallclock_seconds)])
-
-        # If a number of OMP threads is set in the options, we set the `--omp-num-threads` param
-        if 'num_omp_threads' in self.metadata.options.resources:
-            omp_num_threads = self.metadata.options.resources['omp_num_threads']
+            try:
+                timelimit = get_timelimit_seconds(max_wallclock_seconds, timelimit_margin)
+            except ValueError as exception:
+                raise exceptions.InputValidationError(str(exception)) from exception
+            cmdline_params.extend(['--timelimit', seconds_to_timelimit(timelimit)])
+
+        # If a number of cores per MPI process is set in the resources, we set the `--omp-num-threads` param
+        if 'num_cores_per_mpiproc' in self.metadata.options.resources:
+            omp_num_threads = self.metadata.options.resources['num_cores_per_mpiproc']
             cmdline_params.extend(['--omp-num-threads', f'{omp_num_threads:d}'])
 
         # Enable verbose mode if requested in the settings
@@ -257,29 +455,59 @@ class AbinitCalculation(CalcJob):
 
         return cmdline_params
 
-    def _generate_retrieve_list(self, parameters: orm.Dict, settings: dict) -> list:
-        """Generate the list of files to retrieve based on the type of calculation requested in the input parameters.
+    def _generate_retrieve_list(self,
+                                parameters: orm.Dict,
+                                settings: dict,
+                                datasets: ty.Optional[list] = None) -> ty.Tuple[list, list]:
+        """Generate the lists of files to retrieve based on the type of calculation requested in the input parameters.
+
+        The NetCDF output files are retrieved according to the `NETCDF_RETRIEVAL` setting: `keep` (default) stores them
+        in the retrieved folder, `temporary` only makes them available to the parser and `none` does not retrieve them.
 
         :param parameters: input parameters
-        :returns: list of files to retreive
+        :param settings: input settings
+        :param datasets: list with the input parameters of each dataset of a packed calculation
+        :returns: list of files to retreive, list of files to retrieve temporarily
         """
         parameters = parameters.get_dict()
         prefix = self.metadata.options.prefix
 
+        netcdf_retrieval = settings.pop('NETCDF_RETRIEVAL', 'keep')
+        if netcdf_retrieval not in self._NETCDF_RETRIEVAL_POLICIES:
+            raise exceptions.InputValidationError(
+                f"Unknown `NETCDF_RETRIEVAL` setting `{netcdf_retrieval}`, should be one of: "
+                f"{', '.join(self._NETCDF_RETRIEVAL_POLICIES)}"
+            )
+
         # Start with the files that should always be retrieved: stdout, .abo, then add manually provided files
         retrieve_list = [f'{prefix}.{postfix}' for postfix in [self._DEFAULT_OUTPUT_EXTENSION]]
         retrieve_list += settings.pop('ADDITIONAL_RETRIEVE_LIST', [])
+        netcdf_list = []
 
         # NOTE: pop here, we don't need this setting anymore
-        if not settings.pop('DRY_RUN', False):
+        dry_run = settings.pop('DRY_RUN', False)
+        # With `autoparal` and `max_ncpus`, ABINIT only prints the proposed parallel configurations, like a dry run
+        if parameters.get('autoparal', 0) != 0 and parameters.get('max_ncpus', 0) > 0:
+            dry_run = True
+        if datasets and not dry_run:
+            # Packed calculations: o_DS<n>_GSR.nc for each dataset; trajectories of packed relaxations are not parsed
+            netcdf_list += [f'{prefix}o_DS{index}_GSR.nc' for index in range(1, len(datasets) + 1)]
+        elif not dry_run:
             # In all cases except for dry runs: o_GSR.nc
-            retrieve_list += [f'{prefix}{postfix}' for postfix in ['o_GSR.nc']]
+            netcdf_list += [f'{prefix}{postfix}' for postfix in ['o_GSR.nc']]
             # When moving ions: o_HIST.nc
             if parameters.get('ionmov', 0) > 0:
-                retrieve_list += [f'{prefix}{postfix}' for postfix in ['o_HIST.nc']]
+                netcdf_list += [f'{prefix}{postfix}' for postfix in ['o_HIST.nc']]
+
+        retrieve_temporary_list = []
+        if netcdf_retrieval == 'keep':
+            retrieve_list += netcdf_list
+        elif netcdf_retrieval == 'temporary':
+            # Files explicitly requested through `ADDITIONAL_RETRIEVE_LIST` are kept
+            retrieve_temporary_list += [filename for filename in netcdf_list if filename not in retrieve_list]
 
         # There may be duplicates from the `ADDITIONAL_RETRIEVE_LIST` setting, so clean up using set()
-        return list(set(retrieve_list))
+        return list(set(retrieve_list)), retrieve_temporary_list
 
     def prepare_for_submission(self, folder):
         """Create the input file(s) from the input nodes.
@@ -291,54 +519,103 @@ class AbinitCalculation(CalcJob):
         # Process the `settings`` so that capitalization isn't an issue
         settings = uppercase_dict(self.inputs.settings.get_dict()) if 'settings' in self.inputs else {}
 
+        # The phases are only profiled if requested, in which case they are stored in the extras of the node
+        try:
+            profiler = PhaseProfiler(get_profiling_options(settings.pop('PROFILING', None)))
+        except ValueError as exception:
+            raise exceptions.InputValidationError(str(exception)) from exception
+
+        with profiler.profile(self.node, 'prepare_for_submission'):
+            return self._prepare_for_submission(folder, settings, profiler)
+
+    def _prepare_for_submission(self, folder, settings: dict, profiler: PhaseProfiler):
+        """Create the input file(s) from the input nodes, see `prepare_for_submission`.
+
+        :param folder: an `aiida.common.folders.Folder` where the plugin should temporarily place all files needed by
+            the calculation.
+        :param settings: input settings, with uppercase keys
+        :param profiler: the `PhaseProfiler` recording the phases
+        :return: `aiida.common.datastructures.CalcInfo` instance
+        """
         # Validate the input parameters and pseudopotentials
-        self._validate_parameters()
-        self._validate_pseudos()
+        with profiler.phase('validate_inputs'):
+            self._validate_parameters()
+            self._validate_pseudos()
+
+        # Packed calculations: the variants of the parameters and structure are written as separate datasets
+        datasets = settings.pop('DATASETS', None)
+        if datasets is not None:
+            self._validate_datasets(datasets)
+
+        # The parser options are only used by the parser, but invalid options are reported before running ABINIT
+        try:
+            get_parser_options(settings.pop('PARSER_OPTIONS', None))
+        except ValueError as exception:
+            raise exceptions.InputValidationError(str(exception)) from exception
 
         # Create lists which specify files to copy and symlink
         local_copy_list = []
         remote_copy_list = []
         remote_symlink_list = []
 
-        # Create the subfolder which will contain the pseudopotential files
+        # Pseudopotentials are either copied for each calculation or symlinked from a remote cache directory. Dry runs
+        # copy them, such that their folder contains all the files of the calculation.
+        pseudo_cache_dirpath = settings.pop('PSEUDO_REMOTE_CACHE', None)
+        if self.inputs.metadata.dry_run:
+            pseudo_cache_dirpath = None
+
+        # Create the subfolder which will contain the pseudopotential files or their symlinks, as the sandbox is
+        # uploaded before the symlinks are created
         folder.get_subfolder(self._PSEUDO_SUBFOLDER, create=True)
 
+        # List the restart files to copy or symlink in the case of a restart, and have ABINIT read them
+        parameters = self.inputs.parameters
+        if 'parent_calc_folder' in self.inputs:
+            restart_copy_list, restart_symlink_list, restart_parameters = self._generate_restart_lists(
+                parameters.get_dict(), settings
+            )
+            remote_copy_list += restart_copy_list
+            remote_symlink_list += restart_symlink_list
+            parameters = orm.Dict(dict={**parameters.get_dict(), **restart_parameters})
+
         # Generate the input file content and list of pseudopotential files to copy
         arguments = [
-            self.inputs.parameters,
+            parameters,
             self.inputs.pseudos,
             self.inputs.structure,
-            self.inputs.kpoints
+            self.inputs.kpoints,
+            settings.pop('NATIVE_INPUT_WRITER', False),
         ]
-        input_filecontent, local_copy_pseudo_list = self._generate_inputdata(*arguments)
+        with profiler.phase('generate_inputdata'):
+            input_filecontent, local_copy_pseudo_list = self._generate_inputdata(*arguments)
+        if datasets is not None:
+            dataset_structures = self.inputs.get('dataset_structures', {})
+            with profiler.phase('generate_datasetdata'):
+                input_filecontent += '\n' + self._generate_datasetdata(
+                    datasets, self.inputs.structure, dataset_structures
+                )
 
-        # Merge the pseudopotential copy list with the overall copy list then write the input file
-        local_copy_list += local_copy_pseudo_list
+        # Merge the pseudopotential copy list with the overall copy list, or symlink them from the remote cache, then
+        # write the input file
+        if pseudo_cache_dirpath is None:
+            local_copy_list += local_copy_pseudo_list
+        else:
+            pseudo_copy_list, pseudo_symlink_list = self._generate_pseudo_lists(
+                local_copy_pseudo_list, pseudo_cache_dirpath
+            )
+            local_copy_list += pseudo_copy_list
+            remote_symlink_list += pseudo_symlink_list
         with io.open(folder.get_abs_path(self.metadata.options.input_filename), mode='w', encoding='utf-8') as stream:
             stream.write(input_filecontent)
 
-        # List the files to copy or symlink in the case of a restart
-        if 'parent_folder' in self.inputs:
-            # Symlink by default if on the same computer, otherwise copy by default
-            same_computer = self.inputs.code.computer.uuid == self.inputs.parent_folder.computer.uuid
-            if settings.pop('PARENT_FOLDER_SYMLINK', same_computer):
-                remote_symlink_list.append((
-                    self.inputs.parent_folder.computer.uuid,
-                    os.path.join(self.inputs.parent_folder.get_remote_path(), '*'),
-                    './')
-                )
-            else:
-                remote_copy_list.append((
-                    self.inputs.parent_folder.computer.uuid,
-                    os.path.join(self.inputs.parent_folder.get_remote_path(), '*'),
-                    './')
-                )
-
         # Generate the commandline parameters
         cmdline_params = self._generate_cmdline_params(settings)
 
         # Generate list of files to retrieve from wherever the calculation is run
-        retrieve_list = self._generate_retrieve_list(self.inputs.parameters, settings)
+        with profiler.phase('generate_retrieve_list'):
+            retrieve_list, retrieve_temporary_list = self._generate_retrieve_list(
+                self.inputs.parameters, settings, datasets
+            )
 
         # Set up the `CodeInfo` to pass to `CalcInfo`
         codeinfo = datastructures.CodeInfo()
@@ -353,6 +630,7 @@ class AbinitCalculation(CalcJob):
         calcinfo.stdin_name = self.metadata.options.input_filename
         calcinfo.stdout_name = self.metadata.options.output_filename
         calcinfo.retrieve_list = retrieve_list
+        calcinfo.retrieve_temporary_list = retrieve_temporary_list
         calcinfo.remote_symlink_list = remote_symlink_list
         calcinfo.remote_copy_list = remote_copy_list
         calcinfo.local_copy_list = local_copy_list
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Command line interface of `aiida-abinit`."""
+import click
+
+from aiida.cmdline.params import options, types
+from aiida.cmdline.utils import decorators, echo
+
+
+@click.group('aiida-abinit', context_settings={'help_option_names': ['-h', '--help']})
+@options.PROFILE(type=types.ProfileParamType(load_profile=True), expose_value=False)
+def cmd_root():
+    """CLI for the `aiida-abinit` plugin."""
+
+
+@cmd_root.command('reparse')
+@options.GROUP(help='Only re-parse the calculations of this group.')
+@click.option('-t', '--tag', required=True, help='Tag of the re-parse, e.g. the version of the parser.')
+@click.option('-n', '--max-workers', type=click.INT, default=None, help='Number of worker processes [default: #CPUs].')
+@click.option('-b', '--batch-size', type=click.INT, default=100, show_default=True, help='Calculations per batch.')
+@click.option('-l', '--limit', type=click.INT, default=None, help='Maximum number of calculations to re-parse.')
+@click.option('--dry-run', is_flag=True, help='Only print the number of calculations that would be re-parsed.')
+@decorators.with_dbenv()
+def cmd_reparse(group, tag, max_workers, batch_size, limit, dry_run):
+    """Re-parse the retrieved files of existing `AbinitCalculation` nodes with the current parser.
+
+    The calculations that were already re-parsed with the same TAG are skipped, such that an interrupted re-parse can be
+    resumed by running the same command again.
+    """
+    from aiida_abinit.utils import get_calculations_to_reparse, reparse_calculations
+
+    pks = get_calculations_to_reparse(tag, group=group, limit=limit)
+
+    if dry_run or not pks:
+        echo.echo_report(f'{len(pks)} calculations to re-parse with tag `{tag}`.')
+        return
+
+    num_failed = 0
+    failures = []
+
+    with click.progressbar(length=len(pks), label='Re-parsing calculations') as progress:
+        for results in reparse_calculations(pks, tag, max_workers=max_workers, batch_size=batch_size):
+            for result in results:
+                if result.exception is not None:
+                    failures.append(result)
+                elif result.exit_status != 0:
+                    num_failed += 1
+            progress.update(len(results))
+
+    for result in failures:
+        echo.echo_warning(f'parsing calculation<{result.pk}> raised: {result.exception}')
+
+    echo.echo_success(
+        f'Re-parsed {len(pks) - len(failures)} calculations, of which {num_failed} with a non-zero exit status.'
+    )
+
+
+@cmd_root.command('stage-pseudos')
+@click.argument('family', type=types.GroupParamType(sub_classes=('aiida.groups:pseudo.family',)))
+@options.COMPUTER(required=True, help='Computer on which to stage the pseudopotentials.')
+@click.option('-d', '--dirpath', required=True, help='Absolute path of the remote cache directory.')
+@decorators.with_dbenv()
+def cmd_stage_pseudos(family, computer, dirpath):
+    """Stage the pseudopotentials of the pseudopotential FAMILY in a remote cache directory of a computer.
+
+    The calculations with the `PSEUDO_REMOTE_CACHE` setting set to the same directory symlink the staged
+    pseudopotentials instead of copying them. Running the command again uploads the pseudopotentials that were removed
+    from the directory since.
+    """
+    from aiida_abinit.utils import stage_pseudos_remote
+
+    try:
+        remote_paths = stage_pseudos_remote(family.nodes, computer, dirpath)
+    except (ValueError, OSError) as exception:
+        echo.echo_critical(f'staging the pseudopotentials failed: {exception}')
+
+    echo.echo_success(
+        f'Staged {len(remote_paths)} pseudopotentials of `{family.label}` in `{dirpath}` on `{computer.label}`.'
+    )
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""Monitors of running `AbinitCalculation` jobs, see the `monitors` input of the `CalcJob`.
+
+A monitor is attached to a calculation through an entry of its `monitors` input, e.g.::
+
+    builder.monitors = {
+        'divergence': orm.Dict({
+            'entry_point': 'abinit.divergence',
+            'minimum_poll_interval': 600,
+            'kwargs': {'scf_stall_iterations': 30}
+        })
+    }
+"""
+import math
+import typing as ty
+
+from aiida.common.escaping import escape_for_bash
+from aiida.engine.processes.calcjobs.monitors import CalcJobMonitorResult
+
+__all__ = ('MONITOR_EXTRA', 'check_progress', 'monitor_divergence', 'update_progress')
+
+#: Extra of the `CalcJobNode` with the progress read by `monitor_divergence` and, if it stopped the calculation, the
+#: `reason` and `message`, with which the parser returns the corresponding exit code.
+MONITOR_EXTRA = 'aiida_abinit_monitor'
+
+#: Reasons for which `monitor_divergence` stops a calculation.
+SCF_DIVERGED = 'scf_diverged'
+SCF_STALLED = 'scf_stalled'
+RELAXATION_STALLED = 'relaxation_stalled'
+
+#: Values of `ionmov` of structural relaxations, whose energy should decrease. The others are molecular dynamics.
+RELAXATION_IONMOVS = (2, 3, 4, 5, 7, 10, 11, 15, 20, 22)
+
+
+def update_progress(progress: dict, lines: ty.Iterable[str], max_energies: ty.Optional[int] = None) -> dict:
+    """Update the progress of a calculation with new lines of its output file.
+
+    The SCF iterations are read from the `ETOT` lines, whose last column is the residual of the density or potential,
+    depending on `iscf`. An SCF cycle ends when the next one starts, and its last total energy is then recorded as the
+    energy of the ionic step. The ionic steps are reset at the start of a new dataset. Only the last `max_energies`
+    energies are kept, the minimum of the older ones is kept as `energy_minimum`.
+
+    :param progress: dictionary with the `residuals` of the current SCF cycle, its last total energy `etot` in Ha, the
+        `energies` of the completed ionic steps of the current dataset in Ha and whether a total energy or residual was
+        not finite, `diverged`, updated in place; empty at the start
+    :param lines: the new lines of the output file
+    :param max_energies: maximum number of energies of ionic steps to keep, by default all
+    :returns: the updated progress
+    """
+    residuals = progress.setdefault('residuals', [])
+    energies = progress.setdefault('energies', [])
+    progress.setdefault('etot', None)
+    progress.setdefault('energy_minimum', None)
+    progress.setdefault('diverged', False)
+
+    for line in lines:
+        if line.startswith('== DATASET'):
+            residuals.clear()
+            energies.clear()
+            progress['etot'] = None
+            progress['energy_minimum'] = None
+            continue
+
+        if not line.startswith(' ETOT '):
+            continue
+
+        columns = line.split()
+        try:
+            iteration = int(columns[1])
+        except (IndexError, ValueError):
+            continue
+
+        if iteration == 1 and residuals:
+            if progress['etot'] is not None:
+                energies.append(progress['etot'])
+            if max_energies is not None and len(energies) > max_energies:
+                dropped = energies[:-max_energies]
+                del energies[:-max_energies]
+                if progress['energy_minimum'] is not None:
+                    dropped.append(progress['energy_minimum'])
+                progress['energy_minimum'] = min(dropped)
+            residuals.clear()
+
+        # ABINIT prints asterisks for numbers that overflow their format. These and `NaN` are not stored, as the extras
+        # of a node cannot contain values that are not finite, but mark the calculation as diverged.
+        try:
+            etot, residual = float(columns[2]), float(columns[-1])
+        except ValueError:
+            etot, residual = math.inf, math.inf
+        if not math.isfinite(etot) or not math.isfinite(residual):
+            progress['diverged'] = True
+            continue
+
+        progress['etot'] = etot
+        residuals.append(residual)
+
+    return progress
+
+
+def check_progress(
+    progress: dict,
+    scf_divergence_factor: float = 1.0e3,
+    scf_stall_iterations: int = 20,
+    scf_stall_factor: float = 0.5,
+    ionic_stall_steps: int = 20,
+    energy_tolerance: float = 1.0e-6,
+    check_relaxation: bool = True,
+) -> ty.Optional[ty.Tuple[str, str]]:
+    """Check the progress of a calculation, as read by `update_progress`, for a diverged or stalled minimization.
+
+    :param progress: the progress of the calculation
+    :param scf_divergence_factor: the SCF cycle diverged if its residual is this factor larger than its minimum so far,
+        or if a total energy or residual was not finite
+    :param scf_stall_iterations: the SCF cycle stalled if the minimum of its residual over this number of iterations is
+        not `scf_stall_factor` times smaller than the minimum before
+    :param scf_stall_factor: factor by which the residual should decrease over `scf_stall_iterations` iterations
+    :param ionic_stall_steps: the relaxation stalled if the minimum of the energy over this number of ionic steps is not
+        `energy_tolerance` smaller than the minimum before, e.g. because it oscillates between geometries
+    :param energy_tolerance: decrease of the energy in Ha over `ionic_stall_steps` ionic steps
+    :param check_relaxation: whether to check for a stalled relaxation, which is not relevant for molecular dynamics
+    :returns: tuple of the reason and a message if the calculation should be stopped, `None` otherwise
+    """
+    residuals = progress.get('residuals', [])
+    energies = progress.get('energies', [])
+
+    if progress.get('diverged', False):
+        return SCF_DIVERGED, 'the SCF cycle diverged: the total energy or the residual is not finite'
+
+    if residuals:
+        residual = residuals[-1]
+        minimum = min(residuals)
+        if residual > scf_divergence_factor * minimum:
+            return SCF_DIVERGED, (
+                f'the SCF cycle diverged: the residual increased from {minimum:.3e} to {residual:.3e} after '
+                f'{len(residuals)} iterations'
+            )
+
+    if len(residuals) > scf_stall_iterations:
+        previous = min(residuals[:-scf_stall_iterations])
+        recent = min(residuals[-scf_stall_iterations:])
+        if recent > scf_stall_factor * previous:
+            return SCF_STALLED, (
+                f'the SCF cycle stalled: the residual did not decrease below {scf_stall_factor * previous:.3e} in the '
+                f'last {scf_stall_iterations} iterations'
+            )
+
+    if check_relaxation and len(energies) > ionic_stall_steps:
+        energy_minimum = progress.get('energy_minimum', None)
+        previous = min(energies[:-ionic_stall_steps] + ([] if energy_minimum is None else [energy_minimum]))
+        recent = min(energies[-ionic_stall_steps:])
+        if recent > previous - energy_tolerance:
+            return RELAXATION_STALLED, (
+                f'the relaxation stalled: the energy did not decrease below {previous:.8f} Ha in the last '
+                f'{ionic_stall_steps} ionic steps'
+            )
+
+    return None
+
+
+def monitor_divergence(  # pylint: disable=too-many-arguments
+    node,
+    transport,
+    scf_divergence_factor: float = 1.0e3,
+    scf_stall_iterations: int = 20,
+    scf_stall_factor: float = 0.5,
+    ionic_stall_steps: int = 20,
+    energy_tolerance: float = 1.0e-6,
+) -> ty.Optional[CalcJobMonitorResult]:
+    """Stop the calculation if the SCF cycle diverges or stalls, or if the relaxation stalls.
+
+    A relaxation is only checked for an `ionmov` of `RELAXATION_IONMOVS`, as the energy of molecular dynamics is not
+    expected to decrease.
+
+    The lines of the output file written since the previous call are read on the remote with `tail`, and the progress
+    is stored in the `MONITOR_EXTRA` extra of the node, see `update_progress`. If `check_progress` reports a reason to
+    stop the calculation, it is added to the extra and the job is killed. The retrieved files are still parsed, and the
+    parser returns `ERROR_SCF_DIVERGED` or `ERROR_RELAXATION_STALLED` depending on the reason.
+
+    :param node: the `CalcJobNode` of the running calculation
+    :param transport: an open transport to the computer of the calculation
+    :param scf_divergence_factor: see `check_progress`
+    :param scf_stall_iterations: see `check_progress`
+    :param scf_stall_factor: see `check_progress`
+    :param ionic_stall_steps: see `check_progress`
+    :param energy_tolerance: see `check_progress`
+    :returns: a `CalcJobMonitorResult` to kill the job, or `None` to let it continue
+    """
+    progress = node.base.extras.get(MONITOR_EXTRA, {})
+    offset = progress.get('offset', 0)
+    filepath = f"{node.get_remote_workdir()}/{node.get_option('output_filename')}"
+
+    retval, stdout, _ = transport.exec_command_wait(f'tail -c +{offset + 1} {escape_for_bash(filepath)}')
+    if retval != 0:
+        # The output file is not written yet
+        return None
+
+    # An incomplete last line is read again by the next call
+    content = stdout[:stdout.rfind('\n') + 1]
+    progress['offset'] = offset + len(content.encode('utf-8'))
+    # Only the energies compared by `check_progress` are kept, as the extra is updated at every call
+    update_progress(progress, content.splitlines(), max_energies=ionic_stall_steps + 1)
+
+    ionmov = node.inputs.parameters.get('ionmov', 0) if 'parameters' in node.inputs else 0
+    stop = check_progress(
+        progress,
+        scf_divergence_factor=scf_divergence_factor,
+        scf_stall_iterations=scf_stall_iterations,
+        scf_stall_factor=scf_stall_factor,
+        ionic_stall_steps=ionic_stall_steps,
+        energy_tolerance=energy_tolerance,
+        check_relaxation=ionmov in RELAXATION_IONMOVS,
+    )
+    if stop is not None:
+        progress['reason'], progress['message'] = stop
+
+    node.base.extras.set(MONITOR_EXTRA, progress)
+
+    if stop is None:
+        return None
+
+    # The exit code is set by the parser, which reads the reason from the extra
+    return CalcJobMonitorResult(message=progress['message'], override_exit_code=False)
@@ -2,20 +2,25 @@
 """AiiDA-abinit output parser."""
 from os import path
 from tempfile import TemporaryDirectory
+import contextlib
+import io
 import logging
+import os
+import shutil
 
-from abipy.dynamics.hist import HistFile
-from abipy.flowtk import events
-from abipy import abilab
-import netCDF4 as nc
 import numpy as np
-from pymatgen.core import units
 
+from aiida.common.constants import elements
 from aiida.common.exceptions import NotExistent
 from aiida.engine import ExitCode
-from aiida.orm import BandsData, Dict, StructureData, TrajectoryData
+from aiida.orm import ArrayData, BandsData, Dict, StructureData, TrajectoryData
 from aiida.parsers.parser import Parser
 
+from aiida_abinit.monitors import MONITOR_EXTRA, RELAXATION_STALLED, SCF_DIVERGED, SCF_STALLED
+from aiida_abinit.utils import (AbinitEventReport, PhaseProfiler, get_parser_options, get_profiling_options,
+                                scan_abinit_events, uppercase_dict)
+from aiida_abinit.utils.parser_options import DEFAULT_TRAJECTORY_CHUNK_SIZE
+
 UNITS_SUFFIX = '_units'
 DEFAULT_CHARGE_UNITS = 'e'
 DEFAULT_DIPOLE_UNITS = 'Debye'
@@ -26,6 +31,36 @@ DEFAULT_LENGTH_UNITS = 'Angstrom'
 DEFAULT_MAGNETIZATION_UNITS = 'Bohr mag. / cell'
 DEFAULT_POLARIZATION_UNITS = 'C / m^2'
 DEFAULT_STRESS_UNITS = 'GPa'
+DEFAULT_TIME_UNITS = 's'
+
+# Prefix of the `parser_options` passed to `_read_trajectory`, e.g. `trajectory_stride`
+TRAJECTORY_OPTION_PREFIX = 'trajectory_'
+
+# Message of the warning of ABINIT when the SCF cycle did not converge within `nstep` iterations
+SCF_CONVERGENCE_WARNING_MESSAGE = 'was not enough SCF cycles to converge'
+
+# Exit codes of the reasons for which the `monitor_divergence` monitor stops a calculation
+MONITOR_EXIT_CODES = {
+    SCF_DIVERGED: 'ERROR_SCF_DIVERGED',
+    SCF_STALLED: 'ERROR_SCF_DIVERGED',
+    RELAXATION_STALLED: 'ERROR_RELAXATION_STALLED',
+}
+
+# Indices of the Voigt components (xx, yy, zz, yz, xz, xy) making up the symmetric stress tensor
+VOIGT_TO_TENSOR = np.array([[0, 5, 4], [5, 1, 3], [4, 3, 2]])
+
+# Conversion factor of the stress from Ha / Bohr^3 to GPa, with the constants used by `abipy`
+HA_BOHR3_TO_GPA = 27.21138386 / 0.52917720859**3 * 1.602176487e-19 * 1.0e+21
+
+# Arrays of the GSR output quantities stored in the `output_arrays` output instead of in `output_parameters`
+GSR_ARRAYS = ('cart_forces', 'cart_stress_tensor')
+
+# Contributions to the total energy written to the GSR file, in Ha
+GSR_ENERGY_TERMS = (
+    'e_localpsp', 'e_eigenvalues', 'e_ewald', 'e_hartree', 'e_corepsp', 'e_corepspdc', 'e_kinetic', 'e_nonlocalpsp',
+    'e_entropy', 'entropy', 'e_xc', 'e_xcdc', 'e_paw', 'e_pawdc', 'e_elecfield', 'e_magfield', 'e_fermie', 'e_sicdc',
+    'e_exactX', 'h0', 'e_electronpositron', 'edc_electronpositron', 'e0_electronpositron', 'e_monopole'
+)
 
 
 class AbinitParser(Parser):
@@ -39,54 +74,193 @@ class AbinitParser(Parser):
             settings = {}
 
         # Look for optional settings input node and potential 'parser_options' dictionary within it
-        parser_options = settings.get('parser_options', None)
-        if parser_options is not None:
-            error_on_warning = parser_options.get(error_on_warning, False)
-            report_comments = parser_options.get(report_comments, True)
-        else:
-            error_on_warning = False
-            report_comments = True
+        try:
+            parser_options = get_parser_options(uppercase_dict(settings).get('PARSER_OPTIONS', None))
+        except ValueError as exception:
+            self.logger.warning(f'{exception} Using the default parser options instead.')
+            parser_options = get_parser_options()
 
+        # The phases are only profiled if requested, in which case they are stored in the extras of the node
         try:
-            retrieved = self.retrieved
+            profiler = PhaseProfiler(get_profiling_options(uppercase_dict(settings).get('PROFILING', None)))
+        except ValueError as exception:
+            self.logger.warning(f'{exception} The parser is not profiled.')
+            profiler = PhaseProfiler()
+
+        with profiler.profile(self.node, 'parse'):
+            return self._parse(settings, parser_options, profiler, **kwargs)
+
+    def _parse(self, settings, parser_options, profiler, **kwargs):
+        """Parse outputs, store results in database, see `parse`.
+
+        :param settings: input settings
+        :param parser_options: the validated parser options
+        :param profiler: the `PhaseProfiler` recording the phases
+        """
+        trajectory_options = {
+            key[len(TRAJECTORY_OPTION_PREFIX):]: value
+            for key, value in parser_options.items()
+            if key.startswith(TRAJECTORY_OPTION_PREFIX)
+        }
+
+        try:
+            self.retrieved  # pylint: disable=pointless-statement
         except NotExistent:
             return self.exit_codes.ERROR_NO_RETRIEVED_FOLDER
 
+        # Packed calculations write the results of each dataset to separate files
+        ndtset = len(uppercase_dict(settings).get('DATASETS', None) or [])
+
         parameters = self.node.inputs.parameters.get_dict()
         ionmov = parameters.get('ionmov', 0)
         optcell = parameters.get('optcell', 0)
         is_relaxation = ionmov != 0 or optcell != 0
+        is_autoparal = parameters.get('autoparal', 0) != 0 and parameters.get('max_ncpus', 0) > 0
+
+        # NetCDF files may have been retrieved permanently (`keep`), temporarily (`temporary`) or not at all (`none`)
+        netcdf_retrieval = uppercase_dict(settings).get('NETCDF_RETRIEVAL', 'keep')
 
         prefix = self.node.get_attribute('prefix')
-        retrieve_list = self.node.get_attribute('retrieve_list')
         output_filename = self.node.get_attribute('output_filename')
         with TemporaryDirectory() as dirpath:
-            retrieved.copy_tree(dirpath)
-
-            if output_filename in retrieve_list:
-                stdout_filepath = path.join(dirpath, output_filename)
+            # Only the files that are parsed are copied from the repository, one at a time
+            if is_autoparal:
+                with self._get_filepath(output_filename, dirpath, **kwargs) as stdout_filepath:
+                    if stdout_filepath is None:
+                        return self.exit_codes.ERROR_OUTPUT_MISSING
+                    # ABINIT stops after printing the proposed parallel configurations
+                    return self._parse_autoparal(stdout_filepath)
+
+            summary = {}
+            with profiler.phase('parse_stdout'):
                 exit_code = self._parse_stdout(
-                    stdout_filepath, error_on_warning=error_on_warning, report_comments=report_comments
+                    output_filename,
+                    dirpath,
+                    error_on_warning=parser_options['error_on_warning'],
+                    report_comments=parser_options['report_comments'],
+                    summary=summary,
+                    use_events_parser=parser_options['use_events_parser'],
+                    **kwargs
                 )
-                if exit_code is not None:
-                    return exit_code
-            else:
-                return self.exit_codes.ERROR_OUTPUT_MISSING
-
-            if f'{prefix}o_GSR.nc' in retrieve_list:
-                gsr_filepath = path.join(dirpath, f'{prefix}o_GSR.nc')
-                self._parse_gsr(gsr_filepath, is_relaxation)
-            else:
-                return self.exit_codes.ERROR_MISSING_GSR_OUTPUT_FILE
-
-            if f'{prefix}o_HIST.nc' in retrieve_list:
-                hist_filepath = path.join(dirpath, f'{prefix}o_HIST.nc')
-                self._parse_trajectory(hist_filepath)
-            else:
-                if is_relaxation:
-                    return self.exit_codes.ERROR_MISSING_HIST_OUTPUT_FILE
+            # A calculation killed by the monitor did not complete, but the reason it was stopped is reported instead
+            monitor_reason = self.node.base.extras.get(MONITOR_EXTRA, {}).get('reason', None)
+            if monitor_reason is not None and summary:
+                self.logger.error(f"stopped by the monitor: {self.node.base.extras.get(MONITOR_EXTRA)['message']}")
+                exit_code = self.exit_codes[MONITOR_EXIT_CODES[monitor_reason]]
+            if exit_code is not None:
+                if exit_code.status in [
+                    self.exit_codes.ERROR_OUT_OF_WALLTIME.status,
+                    self.exit_codes.ERROR_SCF_DIVERGED.status,
+                    self.exit_codes.ERROR_RELAXATION_STALLED.status,
+                ]:
+                    # The timings of the stdout are used to size the restart, and the trajectory of an interrupted
+                    # relaxation is kept, to be stitched with that of its restart
+                    self.out('output_parameters', Dict(dict=summary))
+                    with self._get_filepath(f'{prefix}o_HIST.nc', dirpath, **kwargs) as hist_filepath:
+                        if hist_filepath is not None and is_relaxation:
+                            with profiler.phase('parse_trajectory'):
+                                self._parse_trajectory(
+                                    hist_filepath, parser_options['parse_trajectory'], **trajectory_options
+                                )
+                return exit_code
+
+            # The outputs of an unconverged SCF cycle are still parsed, such that they can be inspected, before
+            # returning the exit code. The SCF cycles of the intermediate steps of a relaxation can fail to converge
+            # without affecting the final result, so only those of fixed geometry runs are checked.
+            exit_code = ExitCode(0)
+            if not summary['scf_converged'] and not is_relaxation:
+                exit_code = self.exit_codes.ERROR_SCF_CONVERGENCE_NOT_REACHED
+
+            if netcdf_retrieval == 'none':
+                # Without any NetCDF file, the only results are those of the stdout
+                self.out('output_parameters', Dict(dict=summary))
+                return exit_code
+
+            if ndtset > 0:
+                with profiler.phase('parse_datasets'):
+                    datasets_exit_code = self._parse_datasets(dirpath, prefix, ndtset, parser_options, **kwargs)
+                return exit_code if datasets_exit_code.status == 0 else datasets_exit_code
+
+            with self._get_filepath(f'{prefix}o_GSR.nc', dirpath, **kwargs) as gsr_filepath:
+                if gsr_filepath is not None:
+                    with profiler.phase('parse_gsr'):
+                        self._parse_gsr(gsr_filepath, is_relaxation, parser_options, summary)
+                else:
+                    return self.exit_codes.ERROR_MISSING_GSR_OUTPUT_FILE
 
-        return ExitCode(0)
+            with self._get_filepath(f'{prefix}o_HIST.nc', dirpath, **kwargs) as hist_filepath:
+                if hist_filepath is not None:
+                    with profiler.phase('parse_trajectory'):
+                        self._parse_trajectory(hist_filepath, parser_options['parse_trajectory'], **trajectory_options)
+                else:
+                    if is_relaxation:
+                        return self.exit_codes.ERROR_MISSING_HIST_OUTPUT_FILE
+
+        return exit_code
+
+    @contextlib.contextmanager
+    def _get_filepath(self, filename, dirpath, retrieved_temporary_folder=None, **kwargs):
+        """Yield the path of a retrieved file, either from the retrieved or from the temporary retrieved folder.
+
+        Files of the retrieved folder are copied from the repository into `dirpath`, as `abipy` and `netCDF4` need a
+        path, and removed again when the context exits. Files of the temporary retrieved folder are used in place.
+
+        :param filename: name of the file
+        :param dirpath: path of a temporary directory where files of the retrieved folder can be copied
+        :param retrieved_temporary_folder: path of the folder with the files of the `retrieve_temporary_list`
+        :returns: absolute path of the file or `None` if the file was not retrieved
+        """
+        # pylint: disable=unused-argument
+        if filename in self.node.get_attribute('retrieve_list'):
+            if filename not in self.retrieved.base.repository.list_object_names():
+                yield None
+                return
+            filepath = path.join(dirpath, path.basename(filename))
+            with self.retrieved.base.repository.open(filename, mode='rb') as source:
+                with open(filepath, 'wb') as target:
+                    shutil.copyfileobj(source, target)
+            try:
+                yield filepath
+            finally:
+                os.remove(filepath)
+            return
+
+        retrieve_temporary_list = self.node.get_attribute('retrieve_temporary_list', [])
+        if retrieved_temporary_folder is not None and filename in retrieve_temporary_list:
+            filepath = path.join(retrieved_temporary_folder, filename)
+            if path.isfile(filepath):
+                yield filepath
+                return
+
+        yield None
+
+    @contextlib.contextmanager
+    def _open_file(self, filename, retrieved_temporary_folder=None, **kwargs):
+        """Yield a text stream of a retrieved file, read incrementally from the repository or temporary folder.
+
+        :param filename: name of the file
+        :param retrieved_temporary_folder: path of the folder with the files of the `retrieve_temporary_list`
+        :returns: text stream or `None` if the file was not retrieved
+        """
+        # pylint: disable=unused-argument
+        if filename in self.node.get_attribute('retrieve_list'):
+            if filename not in self.retrieved.base.repository.list_object_names():
+                yield None
+                return
+            # NOTE: the text mode of the repository reads the whole file, so the binary stream is decoded instead
+            with self.retrieved.base.repository.open(filename, mode='rb') as handle:
+                yield io.TextIOWrapper(handle, encoding='utf-8', errors='replace')
+            return
+
+        retrieve_temporary_list = self.node.get_attribute('retrieve_temporary_list', [])
+        if retrieved_temporary_folder is not None and filename in retrieve_temporary_list:
+            filepath = path.join(retrieved_temporary_folder, filename)
+            if path.isfile(filepath):
+                with open(filepath, 'r', encoding='utf-8', errors='replace') as handle:
+                    yield handle
+                return
+
+        yield None
 
     def _report_message(self, level, message):
         if not isinstance(level, int):
@@ -97,14 +271,69 @@ class AbinitParser(Parser):
             message = '\n' + '\n'.join(message_lines)
         self.logger.log(level, '%s', message)
 
-    def _parse_stdout(self, filepath, error_on_warning=False, report_comments=True):
-        """Abinit stdout parser."""
+    def _parse_stdout(  # pylint: disable=too-many-branches
+        self,
+        filename,
+        dirpath,
+        error_on_warning=False,
+        report_comments=True,
+        summary=None,
+        use_events_parser=False,
+        **kwargs
+    ):
+        """Abinit stdout parser.
+
+        The output is scanned one line at a time for the events and the final summary with `scan_abinit_events`, which
+        stops at the first error. If the scan fails or `use_events_parser` is set, the `abipy` `EventsParser` is used.
+
+        :param filename: name of the output file
+        :param dirpath: path of a temporary directory where the output file can be copied for the `EventsParser`
+        :param summary: optional dictionary updated with the number of errors, warnings and comments in the output,
+            whether the run completed and whether all SCF cycles converged, and, if available, the number of SCF
+            iterations and ionic steps and the wall time of the run
+        :param use_events_parser: whether to use the `abipy` `EventsParser` instead of `scan_abinit_events`
+        """
+        report = None
+
         # Read the output log file for potential errors.
-        parser = events.EventsParser()
-        try:
-            report = parser.parse(filepath)
-        except:  # pylint: disable=bare-except
-            return self.exit_codes.ERROR_OUTPUT_PARSE
+        if not use_events_parser:
+            with self._open_file(filename, **kwargs) as handle:
+                if handle is None:
+                    return self.exit_codes.ERROR_OUTPUT_MISSING
+                try:
+                    report = scan_abinit_events(handle, stop_on_error=True)
+                except:  # pylint: disable=bare-except
+                    self.logger.warning('scanning the output for events failed, falling back to the `EventsParser`')
+
+        if report is None:
+            from abipy.flowtk import events
+
+            with self._get_filepath(filename, dirpath, **kwargs) as filepath:
+                if filepath is None:
+                    return self.exit_codes.ERROR_OUTPUT_MISSING
+                parser = events.EventsParser()
+                try:
+                    report = parser.parse(filepath)
+                except:  # pylint: disable=bare-except
+                    return self.exit_codes.ERROR_OUTPUT_PARSE
+
+        if summary is not None:
+            summary.update({
+                'num_errors': len(report.errors),
+                'num_warnings': len(report.warnings),
+                'num_comments': len(report.comments),
+                'run_completed': bool(report.run_completed),
+                'scf_converged': not any(self._is_scf_convergence_warning(warning) for warning in report.warnings),
+            })
+            # Only `scan_abinit_events` counts the SCF iterations and ionic steps and reads the wall time
+            if isinstance(report, AbinitEventReport):
+                summary.update({
+                    'num_scf_iterations': report.num_scf_iterations,
+                    'num_ionic_steps': report.num_ionic_steps,
+                })
+                if report.wall_time is not None:
+                    summary['wall_time'] = report.wall_time
+                    summary['wall_time' + UNITS_SUFFIX] = DEFAULT_TIME_UNITS
 
         # Handle `ERROR`s
         if len(report.errors) > 0:
@@ -116,13 +345,8 @@ class AbinitParser(Parser):
         if len(report.warnings) > 0:
             for warning in report.warnings:
                 self._report_message('WARNING', warning.message)
-            # Need to figure out how to handle the ordering of errors.
-            # In theory, this is restartable, but it can occur alongside out
-            # of walltime, in which case it probably _isn't_ restartable.
-            # for warning in report.warnings:
-            #     if ('nstep' in warning.message and
-            #         'was not enough SCF cycles to converge.' in warning.message):
-            #         return self.exit_codes.ERROR_SCF_CONVERGENCE_NOT_REACHED
+            # The SCF convergence warnings are checked by the caller through the `summary`, after the walltime and the
+            # completion of the run, as a run that ran out of walltime also reports an unconverged SCF cycle
             if error_on_warning:
                 # This can be quite harsh; inefficient k-point parallelization can cause
                 # a non-zero exit in this case.
@@ -142,10 +366,289 @@ class AbinitParser(Parser):
         if not report.run_completed:
             return self.exit_codes.ERROR_RUN_NOT_COMPLETED
 
-    def _parse_gsr(self, filepath, is_relaxation):
-        """Abinit GSR parser."""
-        # abipy.electrons.gsr.GsrFile has a method `from_binary_string`;
-        # could try to use this instead of copying the files
+    @staticmethod
+    def _is_scf_convergence_warning(event):
+        """Return whether an event of the output is the warning that the SCF cycle did not converge within `nstep`.
+
+        ABINIT reports it in a `!ScfConvergenceWarning` document, the `EventsParser` as a `ScfConvergenceWarning`.
+
+        :param event: an event of `scan_abinit_events` or of the `EventsParser`
+        """
+        tag = getattr(event, 'tag', None) or type(event).__name__
+        return 'ScfConvergenceWarning' in tag or SCF_CONVERGENCE_WARNING_MESSAGE in str(event.message)
+
+    def _parse_autoparal(self, filepath):
+        """Abinit `autoparal` parser: the parallel configurations proposed by ABINIT with their efficiency."""
+        from abipy.flowtk.tasks import ParalHintsParser
+
+        try:
+            paral_hints = ParalHintsParser().parse(filepath)
+        except:  # pylint: disable=bare-except
+            return self.exit_codes.ERROR_OUTPUT_PARSE
+
+        output_parameters = {
+            'autoparal': {
+                'info': paral_hints.info,
+                'configurations': [dict(configuration) for configuration in paral_hints],
+            }
+        }
+        self.out('output_parameters', Dict(dict=output_parameters))
+
+        return ExitCode(0)
+
+    def _parse_datasets(self, dirpath, prefix, ndtset, parser_options, **kwargs):
+        """Abinit packed calculation parser: one `Dict` per dataset in the `output_datasets` namespace.
+
+        The arrays of all datasets are stored in a single `output_arrays` node, their names prefixed with `ds{index}_`.
+
+        :param parser_options: the parser options, as returned by `get_parser_options`
+        """
+        energies = []
+        output_arrays = ArrayData()
+
+        for index in range(1, ndtset + 1):
+            with self._get_filepath(f'{prefix}o_DS{index}_GSR.nc', dirpath, **kwargs) as filepath:
+                if filepath is None:
+                    return self.exit_codes.ERROR_MISSING_GSR_OUTPUT_FILE
+                gsr_data, _, _ = self._read_gsr(
+                    filepath, parse_bands=False, parse_energy_terms=parser_options['parse_energy_terms']
+                )
+            arrays_in_output_parameters = parser_options['arrays_in_output_parameters']
+            self._split_gsr_arrays(gsr_data, output_arrays, arrays_in_output_parameters, f'ds{index}_')
+            energies.append(gsr_data['energy'])
+            self.out(f'output_datasets.ds{index}', Dict(dict=gsr_data))
+
+        if parser_options['parse_arrays'] and output_arrays.get_arraynames():
+            self.out('output_arrays', output_arrays)
+
+        output_parameters = {
+            'ndtset': ndtset,
+            'energy': energies,
+            'energy' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
+        }
+        self.out('output_parameters', Dict(dict=output_parameters))
+
+        return ExitCode(0)
+
+    def _parse_gsr(self, filepath, is_relaxation, parser_options, summary=None):
+        """Abinit GSR parser.
+
+        :param parser_options: the parser options, as returned by `get_parser_options`
+        :param summary: optional summary of the stdout, added to the `output_parameters`
+        """
+        gsr_data, structure, bands_data = self._read_gsr(
+            filepath,
+            bands_dtype=np.dtype(parser_options['bands_dtype']),
+            parse_bands=parser_options['parse_bands'],
+            parse_energy_terms=parser_options['parse_energy_terms'],
+        )
+        output_arrays = ArrayData()
+        self._split_gsr_arrays(gsr_data, output_arrays, parser_options['arrays_in_output_parameters'])
+
+        if bands_data is not None:
+            self.out('output_bands', bands_data)
+        if parser_options['parse_arrays'] and output_arrays.get_arraynames():
+            self.out('output_arrays', output_arrays)
+        self.out('output_parameters', Dict(dict={**(summary or {}), **gsr_data}))
+        if not is_relaxation:
+            self.out('output_structure', structure)
+
+    @staticmethod
+    def _split_gsr_arrays(gsr_data, output_arrays, arrays_in_output_parameters=False, array_prefix=''):
+        """Move the arrays of the GSR output quantities to an `ArrayData`, replacing them by summaries.
+
+        The arrays are stored as binary files in the repository of the `ArrayData` instead of as lists in the attributes
+        of the `output_parameters` `Dict`. Their units remain in the `Dict` and the maximum force is added to it.
+
+        :param gsr_data: the output quantities as returned by `_read_gsr`, updated in place
+        :param output_arrays: the `ArrayData` to which the arrays are added
+        :param arrays_in_output_parameters: whether to also keep the arrays in the output quantities, as lists
+        :param array_prefix: prefix of the names of the arrays in the `ArrayData`
+        """
+        cart_forces = gsr_data['cart_forces']
+        if cart_forces is not None:
+            gsr_data['max_force'] = float(np.linalg.norm(cart_forces, axis=1).max())
+            gsr_data['max_force' + UNITS_SUFFIX] = DEFAULT_FORCE_UNITS
+
+        for name in GSR_ARRAYS:
+            array = gsr_data.pop(name)
+            if array is None:
+                continue
+            output_arrays.set_array(array_prefix + name, array)
+            if arrays_in_output_parameters:
+                gsr_data[name] = array.tolist()
+
+    @staticmethod
+    def _get_bands_data(kpoints, eigenvalues, occupations, fermi_energy):
+        """Return a `BandsData` with the eigenvalues, the occupations and the Fermi energy.
+
+        The arrays are stored as they are: `BandsData.set_bands` would copy them and, unless they are in double
+        precision, convert every value to a Python float to validate it. Only their shapes are checked instead.
+
+        :param kpoints: cartesian coordinates of the k-points, in 1 / Angstrom
+        :param eigenvalues: array of the eigenvalues with shape (nsppol, nkpt, nband), in eV
+        :param occupations: array of the occupations with the same shape as `eigenvalues`
+        :param fermi_energy: the Fermi energy in eV, stored in the `fermi_energy` attribute
+        :raises ValueError: if the shapes of the arrays are inconsistent
+        """
+        if eigenvalues.ndim != 3 or eigenvalues.shape[1] != len(kpoints) or occupations.shape != eigenvalues.shape:
+            raise ValueError(
+                f'inconsistent shapes of the k-points {kpoints.shape}, eigenvalues {eigenvalues.shape} and occupations '
+                f'{occupations.shape}'
+            )
+
+        bands_data = BandsData()
+        bands_data.set_kpoints(kpoints)
+        bands_data.set_array('bands', eigenvalues)
+        bands_data.set_array('occupations', occupations)
+        bands_data.units = DEFAULT_ENERGY_UNITS
+        bands_data.base.attributes.set('fermi_energy', fermi_energy)
+
+        return bands_data
+
+    @staticmethod
+    def _read_gsr(filepath, bands_dtype=np.float64, parse_bands=True, parse_energy_terms=True):
+        """Read the output quantities, structure and bands from an Abinit GSR file.
+
+        The variables are read directly with `netCDF4` by `_read_gsr_netcdf`. If the file does not have the expected
+        layout, e.g. because it was written by an older version of Abinit, it is read through `abipy` instead.
+
+        :param bands_dtype: data type of the eigenvalues and occupations of the `BandsData`, e.g. `float32` to halve
+            the size of the arrays
+        :param parse_bands: whether to read the eigenvalues and occupations into a `BandsData`
+        :param parse_energy_terms: whether to read the contributions to the total energy
+        :returns: tuple of the output quantities dictionary, the `StructureData` and the `BandsData` (`None` if the
+            bands were not requested or could not be read). The forces and the stress tensor of the dictionary are
+            numpy arrays, see `_split_gsr_arrays`.
+        """
+        try:
+            return AbinitParser._read_gsr_netcdf(filepath, bands_dtype, parse_bands, parse_energy_terms)
+        except (KeyError, IndexError, ValueError, AttributeError):
+            return AbinitParser._read_gsr_abipy(filepath, bands_dtype, parse_bands, parse_energy_terms)
+
+    @staticmethod
+    def _read_gsr_netcdf(filepath, bands_dtype=np.float64, parse_bands=True, parse_energy_terms=True):
+        # pylint: disable=too-many-locals,too-many-statements
+        """Read the output quantities, structure and bands from an Abinit GSR file with `netCDF4`.
+
+        Only the variables that end up in the outputs are read, without building the `GsrFile` of `abipy`. The units
+        conversions are those of `abipy`, such that the outputs are the same as those of `_read_gsr_abipy`. See
+        `_read_gsr` for the parameters.
+
+        :returns: tuple of the output quantities dictionary, the `StructureData` and the `BandsData` (`None` if the
+            bands were not requested or could not be read)
+        :raises KeyError: if one of the variables or dimensions is missing from the file
+        """
+        import netCDF4
+        from pymatgen.core.units import Ha_to_eV, bohr_to_ang
+
+        with netCDF4.Dataset(filepath, 'r') as dataset:
+            dataset.set_auto_mask(False)
+            dimensions = dataset.dimensions
+            variables = dataset.variables
+
+            def read(name):
+                return variables[name][()]
+
+            nspden = dimensions['number_of_components'].size if 'number_of_components' in dimensions else 1
+            nspinor = dimensions['number_of_spinor_components'].size
+            nsppol = dimensions['number_of_spins'].size
+            is_scf_run = int(read('kptopt')) >= 0 if 'kptopt' in variables else True
+
+            if is_scf_run:
+                cart_forces = read('cartesian_forces') * Ha_to_eV / bohr_to_ang
+                cart_stress_tensor = read('cartesian_stress_tensor')[VOIGT_TO_TENSOR] * HA_BOHR3_TO_GPA
+                pressure = float(-np.trace(cart_stress_tensor) / 3)
+            else:
+                cart_forces, cart_stress_tensor, pressure = None, None, None
+
+            gsr_data = {
+                'abinit_version': dataset.getncattr('abinit_version'),
+                'nband': int(read('number_of_states')[0, 0]),
+                'nelect': float(read('number_of_electrons')),
+                'nkpt': dimensions['number_of_kpoints'].size,
+                'nspden': nspden,
+                'nspinor': nspinor,
+                'nsppol': nsppol,
+                'cart_stress_tensor': cart_stress_tensor,
+                'cart_stress_tensor' + UNITS_SUFFIX: DEFAULT_STRESS_UNITS,
+                'is_scf_run': is_scf_run,
+                'cart_forces': cart_forces,
+                'cart_forces' + UNITS_SUFFIX: DEFAULT_FORCE_UNITS,
+                'energy': float(read('etotal')) * Ha_to_eV,
+                'energy' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
+            }
+            for name in GSR_ENERGY_TERMS if parse_energy_terms else ():
+                # Renamed `e_nlpsp_vfock` in Abinit 8.9
+                variable = 'e_nlpsp_vfock' if name == 'e_nonlocalpsp' and name not in variables else name
+                gsr_data[name] = float(read(variable)) * Ha_to_eV
+                gsr_data[name + UNITS_SUFFIX] = DEFAULT_ENERGY_UNITS
+            gsr_data['pressure'] = pressure
+            gsr_data['pressure' + UNITS_SUFFIX] = DEFAULT_STRESS_UNITS
+
+            cell = read('primitive_vectors') * bohr_to_ang
+            numbers = read('atomic_numbers')
+            species = read('atom_species') - 1
+            positions = read('reduced_atom_positions') @ cell
+
+            structure = StructureData(cell=cell.tolist())
+            for index, position in zip(species, positions):
+                symbol = elements[int(round(numbers[index]))]['symbol']
+                structure.append_atom(position=position.tolist(), symbols=symbol)
+
+            # The eigenvalues and occupations are converted one spin at a time into the arrays of the `BandsData`, such
+            # that at most one spin channel is held in double precision next to the (possibly reduced precision) arrays
+            weights = read('kpoint_weights')
+            if parse_bands:
+                eigenvalues = np.empty(variables['eigenvalues'].shape, dtype=bands_dtype)
+                occupations = np.empty(variables['occupations'].shape, dtype=bands_dtype)
+            spin_densities = []
+            for spin in range(nsppol):
+                occupations_spin = variables['occupations'][spin]
+                spin_densities.append(np.sum(weights[:, None] * occupations_spin))
+                if parse_bands:
+                    eigenvalues[spin] = variables['eigenvalues'][spin] * Ha_to_eV
+                    occupations[spin] = occupations_spin
+
+            if nsppol == 2:
+                total_magnetization = float(spin_densities[0] - spin_densities[1])
+            elif nspinor == 1 or nspden == 1:
+                total_magnetization = 0.0
+            else:
+                # The collinear magnetization is not defined for non-collinear calculations
+                total_magnetization = None
+
+            if total_magnetization is not None:
+                gsr_data['total_magnetization'] = total_magnetization
+                gsr_data['total_magnetization' + UNITS_SUFFIX] = DEFAULT_MAGNETIZATION_UNITS
+
+            bands_data = None
+            if parse_bands:
+                try:
+                    reciprocal_cell = 2 * np.pi * np.linalg.inv(cell).T
+                    kpoints = read('reduced_coordinates_of_kpoints') @ reciprocal_cell
+                    fermi_energy = float(read('fermi_energy')) * Ha_to_eV
+                    bands_data = AbinitParser._get_bands_data(kpoints, eigenvalues, occupations, fermi_energy)
+                except (KeyError, ValueError):
+                    pass
+
+        return gsr_data, structure, bands_data
+
+    @staticmethod
+    def _read_gsr_abipy(filepath, bands_dtype=np.float64, parse_bands=True, parse_energy_terms=True):
+        """Read the output quantities, structure and bands from an Abinit GSR file with `abipy`.
+
+        See `_read_gsr` for the parameters.
+
+        :returns: tuple of the output quantities dictionary, the `StructureData` and the `BandsData` (`None` if the
+            bands were not requested or could not be read)
+        """
+        from abipy import abilab
+
+        bands_data = None
+
+        # NOTE: `GsrFile.from_binary_string` also writes the content to a temporary file, so the file is opened from the
+        # path of the single copy made by `_get_filepath`
         with abilab.abiopen(filepath) as gsr:
             gsr_data = {
                 'abinit_version': gsr.abinit_version,
@@ -155,66 +658,22 @@ class AbinitParser(Parser):
                 'nspden': gsr.nspden,
                 'nspinor': gsr.nspinor,
                 'nsppol': gsr.nsppol,
-                'cart_stress_tensor': gsr.cart_stress_tensor.tolist(),
+                'cart_stress_tensor': np.asarray(gsr.cart_stress_tensor),
                 'cart_stress_tensor' + UNITS_SUFFIX: DEFAULT_STRESS_UNITS,
                 'is_scf_run': bool(gsr.is_scf_run),
-                'cart_forces': gsr.cart_forces.tolist(),
+                'cart_forces': np.asarray(gsr.cart_forces),
                 'cart_forces' + UNITS_SUFFIX: DEFAULT_FORCE_UNITS,
                 # 'forces': gsr.cart_forces.tolist(),  # backwards compatibility
                 # 'forces' + UNITS_SUFFIX: DEFAULT_FORCE_UNITS,
                 'energy': float(gsr.energy),
                 'energy' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_localpsp': float(gsr.energy_terms.e_localpsp),
-                'e_localpsp' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_eigenvalues': float(gsr.energy_terms.e_eigenvalues),
-                'e_eigenvalues' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_ewald': float(gsr.energy_terms.e_ewald),
-                'e_ewald' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_hartree': float(gsr.energy_terms.e_hartree),
-                'e_hartree' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_corepsp': float(gsr.energy_terms.e_corepsp),
-                'e_corepsp' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_corepspdc': float(gsr.energy_terms.e_corepspdc),
-                'e_corepspdc' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_kinetic': float(gsr.energy_terms.e_kinetic),
-                'e_kinetic' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_nonlocalpsp': float(gsr.energy_terms.e_nonlocalpsp),
-                'e_nonlocalpsp' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_entropy': float(gsr.energy_terms.e_entropy),
-                'e_entropy' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'entropy': float(gsr.energy_terms.entropy),
-                'entropy' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_xc': float(gsr.energy_terms.e_xc),
-                'e_xc' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_xcdc': float(gsr.energy_terms.e_xcdc),
-                'e_xcdc' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_paw': float(gsr.energy_terms.e_paw),
-                'e_paw' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_pawdc': float(gsr.energy_terms.e_pawdc),
-                'e_pawdc' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_elecfield': float(gsr.energy_terms.e_elecfield),
-                'e_elecfield' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_magfield': float(gsr.energy_terms.e_magfield),
-                'e_magfield' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_fermie': float(gsr.energy_terms.e_fermie),
-                'e_fermie' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_sicdc': float(gsr.energy_terms.e_sicdc),
-                'e_sicdc' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_exactX': float(gsr.energy_terms.e_exactX),
-                'e_exactX' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'h0': float(gsr.energy_terms.h0),
-                'h0' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_electronpositron': float(gsr.energy_terms.e_electronpositron),
-                'e_electronpositron' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'edc_electronpositron': float(gsr.energy_terms.edc_electronpositron),
-                'edc_electronpositron' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e0_electronpositron': float(gsr.energy_terms.e0_electronpositron),
-                'e0_electronpositron' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'e_monopole': float(gsr.energy_terms.e_monopole),
-                'e_monopole' + UNITS_SUFFIX: DEFAULT_ENERGY_UNITS,
-                'pressure': float(gsr.pressure),
-                'pressure' + UNITS_SUFFIX: DEFAULT_STRESS_UNITS
             }
+            for name in GSR_ENERGY_TERMS if parse_energy_terms else ():
+                gsr_data[name] = float(getattr(gsr.energy_terms, name))
+                gsr_data[name + UNITS_SUFFIX] = DEFAULT_ENERGY_UNITS
+            gsr_data['pressure'] = float(gsr.pressure)
+            gsr_data['pressure' + UNITS_SUFFIX] = DEFAULT_STRESS_UNITS
+
             structure = StructureData(pymatgen=gsr.structure)
 
             try:
@@ -229,57 +688,126 @@ class AbinitParser(Parser):
                 else:
                     raise exc
 
+            if parse_bands:
+                try:
+                    ebands = gsr.ebands
+                    bands_data = AbinitParser._get_bands_data(
+                        ebands.kpoints.get_cart_coords(),
+                        np.asarray(ebands.eigens, dtype=bands_dtype),
+                        np.asarray(ebands.occfacts, dtype=bands_dtype),
+                        float(ebands.fermie),
+                    )
+                except (AttributeError, KeyError, ValueError):
+                    bands_data = None
+
+        return gsr_data, structure, bands_data
+
+    def _parse_trajectory(self, filepath, parse_trajectory='full', **kwargs):
+        """Abinit trajectory parser.
+
+        :param parse_trajectory: `full` to output the trajectory and the final structure, `last` to only read the last
+            step of the trajectory and output the final structure
+        :param kwargs: the `trajectory_*` parser options without prefix, see `_read_trajectory`
+        """
+        if parse_trajectory == 'last':
+            _, output_structure = self._read_trajectory(filepath, start=-1)
+        else:
             try:
-                bands_data = BandsData()
-                bands_data.set_kpoints(gsr.ebands.kpoints.get_cart_coords())
-                bands_data.set_bands(np.array(gsr.ebands.eigens), units=str(gsr.ebands.eigens.unit))
-                self.out('output_bands', bands_data)
-            # HACK: refine this exception catch
-            except:  # pylint: disable=bare-except
-                pass
-
-        self.out('output_parameters', Dict(dict=gsr_data))
-        if not is_relaxation:
-            self.out('output_structure', structure)
+                output_trajectory, output_structure = self._read_trajectory(filepath, **kwargs)
+            except ValueError as exception:
+                # The window of the parser options can be beyond the steps done, e.g. by an interrupted relaxation
+                self.logger.warning(f'{exception} Only the last step is kept in the `output_trajectory`.')
+                kwargs.update({'stride': 1, 'start': -1, 'stop': None})
+                output_trajectory, output_structure = self._read_trajectory(filepath, **kwargs)
+            self.out('output_trajectory', output_trajectory)
 
-    def _parse_trajectory(self, filepath):
-        """Abinit trajectory parser."""
-
-        def _voigt_to_tensor(voigt):
-            tensor = np.zeros((3, 3))
-            tensor[0, 0] = voigt[0]
-            tensor[1, 1] = voigt[1]
-            tensor[2, 2] = voigt[2]
-            tensor[1, 2] = voigt[3]
-            tensor[0, 2] = voigt[4]
-            tensor[0, 1] = voigt[5]
-            tensor[2, 1] = tensor[1, 2]
-            tensor[2, 0] = tensor[0, 2]
-            tensor[1, 0] = tensor[0, 1]
-            return tensor
-
-        with HistFile(filepath) as hist_file:
-            structures = hist_file.structures
+        self.out('output_structure', output_structure)
 
-        output_structure = StructureData(pymatgen=structures[-1])
+    @staticmethod
+    def _read_trajectory(  # pylint: disable=too-many-locals,too-many-statements
+        filepath,
+        stride=1,
+        start=None,
+        stop=None,
+        chunk_size=DEFAULT_TRAJECTORY_CHUNK_SIZE,
+        full_scalars=False
+    ):
+        """Read the trajectory and the final structure from an Abinit HIST file in a single pass.
+
+        The steps between `start` and `stop` are selected with the given `stride`, following the Python slicing rules,
+        and are read in blocks of at most `chunk_size` steps. Only the arrays of the selected steps are kept in memory,
+        such that long molecular dynamics runs can be down-sampled. With `full_scalars`, the `energy`, `energy_kin` and
+        `total_force` arrays are kept for all steps between `start` and `stop`, whose indices are stored in the
+        `scalar_stepids` array.
+
+        :param filepath: path of the HIST file
+        :param stride: keep one out of `stride` steps
+        :param start: index of the first step to keep
+        :param stop: index of the step at which to stop
+        :param chunk_size: maximum number of steps read at once
+        :param full_scalars: whether to keep the scalar quantities of all steps in the window
+        :returns: tuple of the `TrajectoryData` and the `StructureData` of the last step of the HIST file
+        """
+        import netCDF4 as nc
+        from pymatgen.core import units
+
+        chunk_size = max(int(chunk_size), 1)
 
         with nc.Dataset(filepath, 'r') as data_set:  # pylint: disable=no-member
+            data_set.set_auto_mask(False)
+            variables = data_set.variables
             n_steps = data_set.dimensions['time'].size
-            energy_ha = data_set.variables['etotal'][:].data  # Ha
-            energy_kin_ha = data_set.variables['ekin'][:].data  # Ha
-            forces_cart_ha_bohr = data_set.variables['fcart'][:, :, :].data  # Ha/bohr
-            positions_cart_bohr = data_set.variables['xcart'][:, :, :].data  # bohr
-            stress_voigt = data_set.variables['strten'][:, :].data  # Ha/bohr^3
-
-        stepids = np.arange(n_steps)
-        symbols = np.array([specie.symbol for specie in structures[0].species], dtype='<U2')
-        cells = np.array([structure.lattice.matrix for structure in structures]).reshape((n_steps, 3, 3))
+            natom = data_set.dimensions['natom'].size
+            typat = variables['typat'][:].astype(int)
+            znucl = variables['znucl'][:]
+
+            window = range(n_steps)[start:stop]
+            steps = window[::int(stride)]
+            if len(steps) == 0:
+                raise ValueError(f'No steps of the {n_steps} steps of the trajectory are selected.')
+
+            energy_ha = np.empty(len(steps))  # Ha
+            energy_kin_ha = np.empty(len(steps))  # Ha
+            forces_cart_ha_bohr = np.empty((len(steps), natom, 3))  # Ha/bohr
+            positions_cart_bohr = np.empty((len(steps), natom, 3))  # bohr
+            cells_bohr = np.empty((len(steps), 3, 3))  # bohr
+            stress_voigt = np.empty((len(steps), 6))  # Ha/bohr^3
+
+            for offset in range(0, len(steps), chunk_size):
+                block = steps[offset:offset + chunk_size]
+                index = slice(block[0], block[-1] + 1, block.step)
+                selection = slice(offset, offset + len(block))
+                energy_ha[selection] = variables['etotal'][index]
+                energy_kin_ha[selection] = variables['ekin'][index]
+                forces_cart_ha_bohr[selection] = variables['fcart'][index]
+                positions_cart_bohr[selection] = variables['xcart'][index]
+                cells_bohr[selection] = variables['rprimd'][index]
+                stress_voigt[selection] = variables['strten'][index]
+
+            total_force_ha_bohr = forces_cart_ha_bohr.sum(axis=(1, 2))
+
+            if full_scalars and steps != window:
+                energy_ha = variables['etotal'][window.start:window.stop]
+                energy_kin_ha = variables['ekin'][window.start:window.stop]
+                total_force_ha_bohr = np.empty(len(window))
+                for offset in range(0, len(window), chunk_size):
+                    block = window[offset:offset + chunk_size]
+                    forces_block = variables['fcart'][block.start:block.stop]
+                    total_force_ha_bohr[offset:offset + len(block)] = forces_block.sum(axis=(1, 2))
+
+            # Only the structure of the last step is needed
+            final_cell_bohr = variables['rprimd'][n_steps - 1]
+            final_positions_bohr = variables['xcart'][n_steps - 1]
+
+        stepids = np.array(steps)
+        symbols = np.array([elements[int(round(znucl[itype - 1]))]['symbol'] for itype in typat], dtype='<U2')
+        cells = cells_bohr * units.bohr_to_ang
         energy = energy_ha * units.Ha_to_eV
         energy_kin = energy_kin_ha * units.Ha_to_eV
         forces = forces_cart_ha_bohr * units.Ha_to_eV / units.bohr_to_ang
         positions = positions_cart_bohr * units.bohr_to_ang
-        stress = np.array([_voigt_to_tensor(sv) for sv in stress_voigt]) * units.Ha_to_eV / units.bohr_to_ang**3
-        total_force = np.array([np.sum(f) for f in forces_cart_ha_bohr]) * units.Ha_to_eV / units.bohr_to_ang
+        stress = stress_voigt[:, VOIGT_TO_TENSOR] * units.Ha_to_eV / units.bohr_to_ang**3
+        total_force = total_force_ha_bohr * units.Ha_to_eV / units.bohr_to_ang
 
         output_trajectory = TrajectoryData()
         output_trajectory.set_trajectory(stepids=stepids, cells=cells, symbols=symbols, positions=positions)
@@ -288,6 +816,11 @@ class AbinitParser(Parser):
         output_trajectory.set_array('forces', forces)  # eV/angstrom
         output_trajectory.set_array('stress', stress)  # eV/angstrom^3
         output_trajectory.set_array('total_force', total_force)  # eV/angstrom
+        if full_scalars and steps != window:
+            output_trajectory.set_array('scalar_stepids', np.array(window))
 
-        self.out('output_trajectory', output_trajectory)
-        self.out('output_structure', output_structure)
+        output_structure = StructureData(cell=final_cell_bohr * units.bohr_to_ang)
+        for symbol, position in zip(symbols, final_positions_bohr * units.bohr_to_ang):
+            output_structure.append_atom(position=position, symbols=str(symbol))
+
+        return output_trajectory, output_structure
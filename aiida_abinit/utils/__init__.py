@@ -1,9 +1,22 @@
 # -*- coding: utf-8 -*-
 """aiida-abinit utility functions."""
 
+from .convergence import *
 from .dictionary import *
+from .events import *
+from .inputs import *
 from .kpoints import *
+from .parser_options import *
+from .profiling import *
 from .pseudos import *
+from .reparse import *
 from .resources import *
+from .structure import *
+from .trajectory import *
 
-__all__ = dictionary.__all__ + kpoints.__all__ + pseudos.__all__ + resources.__all__  # pylint: disable=undefined-variable
+# pylint: disable=undefined-variable
+__all__ = (
+    convergence.__all__ + dictionary.__all__ + events.__all__ + inputs.__all__ + kpoints.__all__ +
+    parser_options.__all__ + profiling.__all__ + pseudos.__all__ + reparse.__all__ + resources.__all__ +
+    structure.__all__ + trajectory.__all__
+)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Utility functions for convergence studies."""
+import typing as ty
+
+import numpy as np
+
+from aiida import orm
+from aiida.engine import calcfunction
+
+__all__ = ('get_converged_index', 'get_convergence_summary', 'get_energy_per_atom')
+
+
+def _points_agree(point, other, energy_tolerance, force_tolerance=None, stress_tolerance=None) -> bool:
+    """Return whether the results of two points of a convergence scan agree within the tolerances."""
+    if abs(point['energy'] - other['energy']) > energy_tolerance:
+        return False
+
+    for key, tolerance in (('forces', force_tolerance), ('stress', stress_tolerance)):
+        if tolerance is None or point.get(key, None) is None or other.get(key, None) is None:
+            continue
+        if np.abs(np.asarray(point[key]) - np.asarray(other[key])).max() > tolerance:
+            return False
+
+    return True
+
+
+def get_converged_index(
+    points: ty.List[ty.Optional[dict]],
+    energy_tolerance: float,
+    force_tolerance: ty.Optional[float] = None,
+    stress_tolerance: ty.Optional[float] = None,
+    num_finer: int = 1,
+) -> ty.Optional[int]:
+    """Return the index of the coarsest point of a convergence scan whose results agree with those of all finer points.
+
+    Points without results, e.g. because their calculation failed or was not run, are ignored, and a point is only
+    converged if at least `num_finer` finer points have results. In particular, the finest point with results is never
+    converged, as there is nothing to compare it with.
+
+    :param points: the results of the points, ordered from coarse to fine, each a dictionary with the `energy` per atom
+        and optionally the `forces` and `stress` arrays, or `None` for a point without results
+    :param energy_tolerance: maximum difference of the energy per atom, in the units of the `energy`
+    :param force_tolerance: optional maximum difference of the force components, in the units of the `forces`
+    :param stress_tolerance: optional maximum difference of the stress components, in the units of the `stress`
+    :param num_finer: minimum number of finer points with results to compare with, e.g. to confirm the agreement of
+        two points with a third one while finer points can still be computed
+    :returns: the index of the converged point, or `None` if no point is converged
+    """
+    indices = [index for index, point in enumerate(points) if point is not None]
+
+    for position, index in enumerate(indices[:max(len(indices) - num_finer, 0)]):
+        if all(
+            _points_agree(points[index], points[other], energy_tolerance, force_tolerance, stress_tolerance)
+            for other in indices[position + 1:]
+        ):
+            return index
+
+    return None
+
+
+def get_energy_per_atom(parameters: orm.Dict, structure: orm.StructureData) -> float:
+    """Return the total energy per atom of a calculation.
+
+    :param parameters: the `output_parameters` of the calculation, with the total `energy` in eV
+    :param structure: the structure the calculation ran with, e.g. its `output_structure`, which can contain fewer atoms
+        than the input structure if it was reduced to the primitive cell
+    :returns: the total energy per atom in eV
+    """
+    return parameters['energy'] / len(structure.sites)
+
+
+@calcfunction
+def get_convergence_summary(scans: orm.Dict, **candidates) -> orm.Dict:
+    """Return the converged values and, for each scan, the candidate values and their total energy per atom.
+
+    :param scans: for each scanned parameter, a dictionary with its candidate `values`, the `labels` of the completed
+        candidates, `None` for the others, and its `converged` value, `None` if none of the candidates is converged
+    :param candidates: the `output_parameters` and `output_structure` of the completed candidates, with the keys
+        `<label>_parameters` and `<label>_structure`
+    :returns: the converged values and the `scans` with the energy per atom in eV of each candidate, `None` for the
+        candidates without results
+    """
+    converged = {}
+    summary = {}
+
+    for name, scan in scans.get_dict().items():
+        summary[name] = {
+            'values': scan['values'],
+            'energies': [
+                None if label is None else
+                get_energy_per_atom(candidates[f'{label}_parameters'], candidates[f'{label}_structure'])
+                for label in scan['labels']
+            ],
+            'converged': scan['converged'],
+        }
+        if scan['converged'] is not None:
+            converged[name] = scan['converged']
+
+    return orm.Dict(dict={**converged, 'scans': summary})
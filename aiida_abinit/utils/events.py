@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Utilities to scan the events reported in the ABINIT output."""
+import collections
+import typing as ty
+
+__all__ = ('AbinitEventReport', 'scan_abinit_events')
+
+#: An event of the ABINIT output: the YAML tag (e.g. `!WARNING`), the message and the line number of the document.
+AbinitEvent = collections.namedtuple('AbinitEvent', ['tag', 'message', 'lineno'])
+
+#: Tag of the YAML document written by ABINIT at the end of a completed run.
+FINAL_SUMMARY_TAG = '!FinalSummary'
+
+#: Start of the lines of the SCF iterations, e.g. ` ETOT  1  -8.8...`.
+SCF_ITERATION_PREFIX = ' ETOT '
+
+#: Start of the headers of the ionic steps of the mover, after the `---`, e.g. `--- Iteration: (1/10) Internal ...`.
+IONIC_STEP_PREFIX = 'Iteration: ('
+
+
+class AbinitEventReport:
+    """Errors, warnings and comments reported in the ABINIT output, and whether the run completed.
+
+    Provides the `errors`, `warnings`, `comments` and `run_completed` attributes of the `EventReport` of `abipy`, as
+    well as the number of SCF iterations and ionic steps and the wall time of the run, for the walltime estimates.
+    """
+
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+        self.comments = []
+        self.run_completed = False
+        self.num_scf_iterations = 0
+        self.num_ionic_steps = 0
+        self.wall_time = None
+
+    def __len__(self):
+        return len(self.errors) + len(self.warnings) + len(self.comments)
+
+    def append(self, event: AbinitEvent) -> None:
+        """Add an event to the list of errors, warnings or comments based on its tag."""
+        tag = event.tag.lower()
+        if tag.endswith(('error', 'bug')):
+            self.errors.append(event)
+        elif tag.endswith('warning'):
+            self.warnings.append(event)
+        elif tag.endswith('comment'):
+            self.comments.append(event)
+
+
+def _is_event_tag(tag: ty.Optional[str]) -> bool:
+    """Return whether the tag of a YAML document is that of an event, i.e. an error, bug, warning or comment."""
+    return tag is not None and tag.lower().endswith(('error', 'bug', 'warning', 'comment'))
+
+
+def _get_message(lines: ty.List[str]) -> str:
+    """Return the message of the YAML document of an event, or the raw document if it cannot be loaded."""
+    import yaml
+
+    try:
+        document = yaml.safe_load(''.join(lines))
+        return str(document['message'])
+    except (yaml.YAMLError, KeyError, TypeError):
+        return 'Malformatted YAML document:\n' + ''.join(lines)
+
+
+def _get_ionic_step(tag: str) -> int:
+    """Return the index of the ionic step from the header of the step, e.g. 3 for `Iteration: (3/10) ...`."""
+    try:
+        return int(tag[len(IONIC_STEP_PREFIX):].split('/', 1)[0])
+    except ValueError:
+        return 0
+
+
+def _get_wall_time(lines: ty.List[str]) -> ty.Optional[float]:
+    """Return the `overall_wall_time` of the YAML document of the final summary, or `None` if it cannot be loaded."""
+    import yaml
+
+    try:
+        return float(yaml.safe_load(''.join(lines))['overall_wall_time'])
+    except (yaml.YAMLError, KeyError, TypeError, ValueError):
+        return None
+
+
+def scan_abinit_events(handle: ty.TextIO, stop_on_error: bool = False) -> AbinitEventReport:
+    """Scan the ABINIT output for the YAML documents of events and the final summary, one line at a time.
+
+    Only the lines of the event documents are kept in memory, and only their message is loaded, such that the cost of
+    the scan is bounded by the size of the events rather than that of the output. Documents start with a `--- !tag`
+    line and end with a `...` line, as those read by the `EventsParser` of `abipy`. The SCF iterations and the ionic
+    steps are counted on the way, and the wall time is read from the final summary.
+
+    :param handle: text stream of the ABINIT output
+    :param stop_on_error: whether to stop at the first error, in which case the run is reported as not completed
+    :returns: the report of the events
+    """
+    report = AbinitEventReport()
+    lines, tag, lineno = None, None, 0
+
+    for index, line in enumerate(handle, start=1):
+        if line.startswith(SCF_ITERATION_PREFIX):
+            report.num_scf_iterations += 1
+            continue
+
+        if line.startswith('---'):
+            tag = line[3:].strip()
+            if tag == FINAL_SUMMARY_TAG:
+                report.run_completed = True
+            elif tag.startswith(IONIC_STEP_PREFIX):
+                report.num_ionic_steps = max(report.num_ionic_steps, _get_ionic_step(tag))
+            is_document = _is_event_tag(tag) or tag == FINAL_SUMMARY_TAG
+            lines, lineno = ([], index) if is_document else (None, 0)
+            continue
+
+        if lines is None:
+            continue
+
+        if line.startswith('...'):
+            if tag == FINAL_SUMMARY_TAG:
+                report.wall_time = _get_wall_time(lines)
+            else:
+                report.append(AbinitEvent(tag, _get_message(lines), lineno))
+            lines = None
+            if stop_on_error and report.errors:
+                break
+            continue
+
+        lines.append(line)
+
+    return report
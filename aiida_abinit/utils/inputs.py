@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""Lightweight writer for ABINIT input files."""
+import typing as ty
+
+import numpy as np
+
+__all__ = ('render_abinit_datasets', 'render_abinit_input')
+
+# Default data prefixes that `abipy` adds to every input file
+DATA_PREFIX = {
+    'indata_prefix': 'indata/in',
+    'tmpdata_prefix': 'tmpdata/tmp',
+    'outdata_prefix': 'outdata/out',
+}
+
+UNITS = ('bohr', 'angstrom', 'hartree', 'Ha', 'eV')
+
+SECTION_WIDTH = 46
+
+
+def render_abinit_input(abivars: dict, structure_abivars: dict) -> str:
+    """Render the content of an ABINIT input file without going through `abipy`'s `AbinitInput`.
+
+    The output is identical to `AbinitInput.to_string(with_pseudos=False)`: variables are grouped by section in the
+    order of the ABINIT variable database, the default data prefixes are added and the structure variables are written
+    last. Large numerical arrays such as `xred` and `kpt` are formatted in a single pass instead of value by value.
+
+    :param abivars: the ABINIT variables, except those related to the structure
+    :param structure_abivars: the ABINIT variables describing the structure, as returned by `get_sanitized_structure`
+    :returns: input file content
+    :raises ValueError: if one of the variables is not a known ABINIT variable
+    """
+    from abipy.abio.abivars_db import get_abinit_variables
+
+    database = get_abinit_variables()
+
+    variables = dict(abivars)
+    for name, value in DATA_PREFIX.items():
+        variables.setdefault(name, value)
+
+    sections = {}
+    for name, value in variables.items():
+        if value is None:
+            continue
+        try:
+            section = database.name2varset[name]
+        except KeyError as exception:
+            raise ValueError(f'`{name}` is not a registered ABINIT variable.') from exception
+        sections.setdefault(section, []).append(name)
+
+    lines = []
+
+    for section in database.my_varset_list:
+        if section not in sections:
+            continue
+        lines.extend(_format_header(f'SECTION: {section}'))
+        for name in sections[section]:
+            value = variables[name]
+            if database[name].vartype == 'string':
+                value = _format_string(value)
+            lines.append(_format_variable(name, value))
+
+    lines.extend(_format_header('STRUCTURE'))
+    for name, value in structure_abivars.items():
+        lines.append(_format_variable(name, value))
+
+    return '\n'.join(lines)
+
+
+def render_abinit_datasets(datasets: ty.List[dict]) -> str:
+    """Render the multi-dataset block of an ABINIT input file.
+
+    The block sets `ndtset` and declares the variables of each dataset with the index of the dataset as suffix, e.g.
+    `ecut2` for the `ecut` of the second dataset. It is meant to be appended to an input file containing the variables
+    common to all datasets, which ABINIT uses for any variable that is not set for a specific dataset.
+
+    :param datasets: list with the ABINIT variables of each dataset
+    :returns: content of the multi-dataset block
+    :raises ValueError: if one of the variables is not a known ABINIT variable
+    """
+    from abipy.abio.abivars_db import get_abinit_variables
+
+    database = get_abinit_variables()
+
+    lines = _format_header('DATASETS')
+    lines.append(_format_variable('ndtset', len(datasets)))
+
+    for index, variables in enumerate(datasets, start=1):
+        for name, value in variables.items():
+            if value is None:
+                continue
+            if name not in database:
+                raise ValueError(f'`{name}` is not a registered ABINIT variable.')
+            if database[name].vartype == 'string':
+                value = _format_string(value)
+            lines.append(_format_variable(f'{name}{index}', value))
+
+    return '\n'.join(lines)
+
+
+def _format_header(title: str) -> list:
+    """Return the lines of a section header."""
+    return [SECTION_WIDTH * '#', '####' + title.center(SECTION_WIDTH - 1).rstrip(), SECTION_WIDTH * '#']
+
+
+def _format_string(value) -> str:
+    """Wrap the value of a string variable in double quotes."""
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+
+    str_values = [str(v).strip() for v in value]
+    if str_values[0][0] != '"':
+        str_values[0] = '"' + str_values[0]
+    if str_values[-1][-1] != '"':
+        str_values[-1] += '"'
+    if len(str_values) > 1:
+        str_values[0] = '\n    ' + str_values[0]
+
+    return ',\n    '.join(str_values)
+
+
+def _get_floatdecimal(name: str) -> int:
+    """Return the minimum number of decimals used to print the float values of the given variable."""
+    floatdecimal = 0
+    if any(key in name for key in ('xred', 'xcart', 'rprim', 'qpt', 'kpt')):
+        floatdecimal = 16
+    if name == 'qpt':
+        floatdecimal = 22
+    if any(key in name for key in ('ngkpt', 'kptrlatt', 'ngqpt', 'ng2qpt')):
+        floatdecimal = 0
+    return floatdecimal
+
+
+def _format_variable(name: str, value) -> str:
+    """Return the line(s) declaring a variable in the input file."""
+    units = ''
+    if hasattr(value, '__iter__') and isinstance(value[-1], str) and value[-1] in UNITS:
+        value = list(value)
+        units = value.pop(-1)
+
+    if value is None or not str(value):
+        return ''
+
+    valperline = 2 if name == 'bdgw' else 3
+    floatdecimal = _get_floatdecimal(name)
+    line = ' ' + name
+
+    if isinstance(value, np.ndarray):
+        line += _format_array(value, floatdecimal, valperline)
+    elif isinstance(value, (list, tuple)):
+        if all(isinstance(v, (list, tuple)) for v in value):
+            line += _format_list2d(value, floatdecimal)
+        else:
+            line += _format_list(value, floatdecimal, valperline)
+    else:
+        line += ' ' + str(value)
+
+    if units:
+        line += ' ' + units
+
+    return line
+
+
+def _format_scalar(value, floatdecimal: int = 0) -> str:
+    """Format a single value with the appropriate number of decimals."""
+    sval = str(value)
+    if sval.lstrip('-').lstrip('+').isdigit() and floatdecimal == 0:
+        return sval
+
+    try:
+        fval = float(value)
+    except Exception:  # pylint: disable=broad-except
+        return sval
+
+    if fval == 0 or 1e-3 < abs(fval) < 1e4:
+        form = 'f'
+        addlen = 5
+    else:
+        form = 'e'
+        addlen = 8
+
+    ndec = max(len(str(fval - int(fval))) - 2, floatdecimal)
+
+    if floatdecimal > 16:
+        ndec = max(floatdecimal, ndec)
+    else:
+        ndec = min(ndec, 10)
+
+    return f'{fval:>{ndec + addlen}.{ndec}{form}}'.replace('e', 'd')
+
+
+def _format_list(values, floatdecimal: int, valperline: int) -> str:
+    """Format a flat list of values, `valperline` values per line."""
+    line = ''
+
+    for i, value in enumerate(values):
+        line += ' ' + _format_scalar(value, floatdecimal)
+        if (i + 1) % valperline == 0:
+            line += '\n'
+
+    return _finalize_list(line)
+
+
+def _format_array(array: np.ndarray, floatdecimal: int, valperline: int) -> str:
+    """Format a numerical array, `valperline` values per line.
+
+    For the variables printed with a fixed number of decimals (e.g. `xred` and `kpt`) each value is formatted with ten
+    decimals in fixed-point or exponential notation, so the full array can be formatted in a single operation.
+    """
+    values = array.ravel()
+
+    if floatdecimal != 16 or values.dtype.kind not in 'biuf':
+        return _format_list(values.tolist(), floatdecimal, valperline)
+
+    values = values.astype(float)
+    num_values = values.size
+    num_lines, num_remainder = divmod(num_values, valperline)
+    absolute = np.abs(values)
+    is_fixed = (values == 0) | ((absolute > 1e-3) & (absolute < 1e4))
+
+    if is_fixed.all():
+        fmt = (' %15.10f' * valperline + '\n') * num_lines + ' %15.10f' * num_remainder
+    else:
+        formats = np.where(is_fixed, ' %15.10f', ' %18.10e').tolist()
+        for index in range(valperline - 1, num_values, valperline):
+            formats[index] += '\n'
+        fmt = ''.join(formats)
+
+    return _finalize_list((fmt % tuple(values.tolist())).replace('e', 'd'))
+
+
+def _finalize_list(line: str) -> str:
+    """Add a leading carriage return to values spread over several lines and strip the trailing one."""
+    if '\n' in line.rstrip('\n'):
+        line = '\n' + line
+    return line.rstrip('\n')
+
+
+def _format_list2d(values, floatdecimal: int) -> str:
+    """Format a list of lists, one list per line."""
+    flat_values = [value for row in values for value in _flatten(row)]
+
+    if all(isinstance(value, int) for value in flat_values):
+        value_type = int
+    else:
+        try:
+            for value in flat_values:
+                float(value)
+            value_type = float
+        except Exception:  # pylint: disable=broad-except
+            value_type = str
+
+    width = max(len(str(value)) for value in flat_values)
+    if value_type == int:
+        formatspec = f'>{width}d'
+    elif value_type == str:
+        formatspec = f'>{width}'
+    else:
+        maxdec = max(len(str(value - int(value))) - 2 for value in flat_values)
+        ndec = min(max(maxdec, floatdecimal), 10)
+        if all(value == 0 or 1e-3 < abs(value) < 1e4 for value in flat_values):
+            formatspec = f'>{ndec + 5}.{ndec}f'
+        else:
+            formatspec = f'>{ndec + 8}.{ndec}e'
+
+    line = '\n'
+    for row in values:
+        for value in row:
+            line += f' {value:{formatspec}}'
+        line += '\n'
+
+    return line.rstrip('\n')
+
+
+def _flatten(value) -> list:
+    """Flatten a (nested) iterable into a list."""
+    if isinstance(value, str) or not hasattr(value, '__iter__'):
+        return [value]
+    return [item for element in value for item in _flatten(element)]
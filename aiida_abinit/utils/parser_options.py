@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Schema of the `parser_options` of the `settings` of an `AbinitCalculation`."""
+import collections
+import typing as ty
+
+__all__ = ('PARSER_OPTIONS', 'get_parser_options')
+
+#: Number of steps of the HIST file read at once.
+DEFAULT_TRAJECTORY_CHUNK_SIZE = 1000
+
+#: A parser option: the allowed types of its value, its default value and, if restricted, the allowed values.
+ParserOption = collections.namedtuple('ParserOption', ['types', 'default', 'choices', 'help'])
+
+PARSER_OPTIONS = {
+    'error_on_warning':
+    ParserOption(bool, False, None, 'Whether to return an exit code if the output contains warnings.'),
+    'report_comments':
+    ParserOption(bool, True, None, 'Whether to report the comments of the output in the log.'),
+    'use_events_parser':
+    ParserOption(bool, False, None, 'Whether to scan the output for events with the `EventsParser` of `abipy`.'),
+    'parse_energy_terms':
+    ParserOption(bool, True, None, 'Whether to add the contributions to the total energy to `output_parameters`.'),
+    'parse_arrays':
+    ParserOption(bool, True, None, 'Whether to output the forces and stress tensor in `output_arrays`.'),
+    'arrays_in_output_parameters':
+    ParserOption(bool, False, None, 'Whether to also add the forces and stress tensor to `output_parameters`.'),
+    'parse_bands':
+    ParserOption(bool, True, None, 'Whether to output the eigenvalues and occupations in `output_bands`.'),
+    'bands_dtype':
+    ParserOption(str, 'float64', ('float64', 'float32'), 'Data type of the arrays of `output_bands`.'),
+    'parse_trajectory':
+    ParserOption(
+        str, 'full', ('full', 'last'),
+        'Whether to output the `output_trajectory` (`full`) or only the final `output_structure` (`last`).'
+    ),
+    'trajectory_stride':
+    ParserOption(int, 1, None, 'Keep one out of `trajectory_stride` steps of the trajectory.'),
+    'trajectory_start':
+    ParserOption((int, type(None)), None, None, 'Index of the first step of the trajectory to keep.'),
+    'trajectory_stop':
+    ParserOption((int, type(None)), None, None, 'Index of the step of the trajectory at which to stop.'),
+    'trajectory_chunk_size':
+    ParserOption(int, DEFAULT_TRAJECTORY_CHUNK_SIZE, None, 'Maximum number of steps of the HIST file read at once.'),
+    'trajectory_full_scalars':
+    ParserOption(bool, False, None, 'Whether to keep the scalar quantities of all steps of the trajectory.'),
+}
+
+
+def get_parser_options(parser_options: ty.Optional[dict] = None) -> dict:
+    """Validate the parser options and return them, completed with the default value of the missing options.
+
+    :param parser_options: the `parser_options` of the `settings`, see `PARSER_OPTIONS` for the available options
+    :returns: the value of all parser options
+    :raises ValueError: if an option is unknown or has an invalid value
+    """
+    parser_options = parser_options or {}
+
+    unknown_options = set(parser_options) - set(PARSER_OPTIONS)
+    if unknown_options:
+        raise ValueError(
+            f"Unknown parser options: {', '.join(sorted(unknown_options))}, should be among: "
+            f"{', '.join(PARSER_OPTIONS)}."
+        )
+
+    validated = {}
+
+    for name, option in PARSER_OPTIONS.items():
+        value = parser_options.get(name, option.default)
+        types = option.types if isinstance(option.types, tuple) else (option.types,)
+        # `bool` is a subclass of `int`, so booleans are only accepted by boolean options
+        if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+            raise ValueError(f'The `{name}` parser option should be of type {types[0].__name__}, got `{value!r}`.')
+        if option.choices is not None and value not in option.choices:
+            raise ValueError(
+                f"Invalid value `{value}` of the `{name}` parser option, should be one of: {', '.join(option.choices)}."
+            )
+        validated[name] = value
+
+    for name in ('trajectory_stride', 'trajectory_chunk_size'):
+        if validated[name] < 1:
+            raise ValueError(f'The `{name}` parser option should be a positive integer, got `{validated[name]}`.')
+
+    return validated
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""Opt-in instrumentation of the phases of `AbinitCalculation.prepare_for_submission` and `AbinitParser.parse`."""
+import contextlib
+import os
+import time
+import tracemalloc
+import typing as ty
+
+__all__ = ('PROFILING_EXTRA', 'PhaseProfiler', 'get_profiling_options', 'get_profiling_statistics')
+
+#: Extra of the `CalcJobNode` with the wall time and peak memory of the phases, per instrumented process step.
+PROFILING_EXTRA = 'aiida_abinit_profiling'
+
+#: Name of the phase covering the complete process step.
+TOTAL_PHASE = 'total'
+
+DEFAULT_PROFILING_OPTIONS = {
+    'trace_memory': True,
+    'cprofile_dirpath': None,
+}
+
+
+def get_profiling_options(profiling: ty.Union[bool, dict, None] = None) -> ty.Optional[dict]:
+    """Validate the `PROFILING` setting and return the profiling options, or `None` if profiling is disabled.
+
+    The setting is either a boolean, enabling the profiling with the default options, or a dictionary with the options:
+
+        * `trace_memory`: whether to record the peak memory of the phases with `tracemalloc`, which slows down the
+          instrumented code considerably
+        * `cprofile_dirpath`: absolute path of a directory of the machine running the daemon, into which the `cProfile`
+          statistics of the process steps are dumped as `<uuid>_<step>.prof`
+
+    :param profiling: the `PROFILING` setting
+    :returns: the profiling options or `None`
+    :raises ValueError: if the setting or one of its options is invalid
+    """
+    if profiling is None or profiling is False:
+        return None
+
+    if profiling is True:
+        return dict(DEFAULT_PROFILING_OPTIONS)
+
+    if not isinstance(profiling, dict):
+        raise ValueError(f'The `PROFILING` setting should be a boolean or a dictionary, got `{profiling!r}`.')
+
+    unknown_options = set(profiling) - set(DEFAULT_PROFILING_OPTIONS)
+    if unknown_options:
+        raise ValueError(
+            f"Unknown profiling options: {', '.join(sorted(unknown_options))}, should be among: "
+            f"{', '.join(DEFAULT_PROFILING_OPTIONS)}."
+        )
+
+    options = {**DEFAULT_PROFILING_OPTIONS, **profiling}
+
+    if not isinstance(options['trace_memory'], bool):
+        raise ValueError(f"The `trace_memory` profiling option should be a boolean, got `{options['trace_memory']!r}`.")
+
+    dirpath = options['cprofile_dirpath']
+    if dirpath is not None and (not isinstance(dirpath, str) or not os.path.isabs(dirpath)):
+        raise ValueError(f'The `cprofile_dirpath` profiling option should be an absolute path, got `{dirpath!r}`.')
+
+    return options
+
+
+class PhaseProfiler:
+    """Record the wall time and peak memory of the phases of a process step and store them in the extras of its node.
+
+    A profiler without options is disabled, and its context managers do nothing, such that the instrumented code does
+    not need to check whether the profiling is enabled. Phases can be nested and entered several times, in which case
+    the wall times are summed and the peak memory is the maximum over all entries.
+    """
+
+    def __init__(self, options: ty.Optional[dict] = None):
+        """Construct the profiler.
+
+        :param options: profiling options as returned by `get_profiling_options`, `None` to disable the profiler
+        """
+        self._options = options
+        self._phases = {}
+        self._stack = []
+
+    @property
+    def enabled(self) -> bool:
+        """Return whether the profiler records the phases."""
+        return self._options is not None
+
+    @property
+    def phases(self) -> dict:
+        """Return the recorded phases, with their `wall_time` in seconds, `peak_memory` in bytes and `count`."""
+        return self._phases
+
+    @contextlib.contextmanager
+    def profile(self, node, step: str):
+        """Profile a complete process step, recorded as the `total` phase, and store the phases in the node extras.
+
+        :param node: the `CalcJobNode` of the calculation
+        :param step: name of the process step, e.g. `parse`, used as the key in the `PROFILING_EXTRA` extra
+        """
+        if not self.enabled:
+            yield
+            return
+
+        import cProfile
+
+        # Memory is only traced if it isn't already, e.g. by the benchmarks, which should then not be stopped
+        start_tracing = self._options['trace_memory'] and not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+
+        profiler = cProfile.Profile() if self._options['cprofile_dirpath'] is not None else None
+
+        self._phases = {}
+        try:
+            if profiler is not None:
+                profiler.enable()
+            with self.phase(TOTAL_PHASE):
+                yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            if start_tracing:
+                tracemalloc.stop()
+
+        # The results are only stored for steps that completed, not those that excepted
+        profiling = node.base.extras.get(PROFILING_EXTRA, {})
+        profiling[step] = self._phases
+        node.base.extras.set(PROFILING_EXTRA, profiling)
+
+        if profiler is not None:
+            os.makedirs(self._options['cprofile_dirpath'], exist_ok=True)
+            profiler.dump_stats(os.path.join(self._options['cprofile_dirpath'], f'{node.uuid}_{step}.prof'))
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Record the wall time and peak memory of a phase.
+
+        :param name: name of the phase
+        """
+        if not self.enabled:
+            yield
+            return
+
+        tracing = tracemalloc.is_tracing()
+        current_memory = 0
+
+        if tracing:
+            current_memory, peak_memory = tracemalloc.get_traced_memory()
+            # The peak is reset for the nested phase, so the peak reached so far is kept for the enclosing phase
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], peak_memory)
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+
+        entry = [current_memory, current_memory]
+        self._stack.append(entry)
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - start
+            self._stack.pop()
+
+            peak_memory = entry[1]
+            if tracing:
+                peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1])
+                if self._stack:
+                    self._stack[-1][1] = max(self._stack[-1][1], peak_memory)
+
+            phase = self._phases.setdefault(name, {'wall_time': 0.0, 'peak_memory': 0, 'count': 0})
+            phase['wall_time'] += wall_time
+            phase['peak_memory'] = max(phase['peak_memory'], peak_memory - entry[0])
+            phase['count'] += 1
+
+
+def get_profiling_statistics(step: str = 'parse', group=None, limit: ty.Optional[int] = None) -> dict:
+    """Aggregate the phases recorded by the `PhaseProfiler` of a process step over the profiled calculations.
+
+    :param step: name of the process step, `prepare_for_submission` or `parse`
+    :param group: optional `Group` to which the calculations should belong
+    :param limit: optional maximum number of calculations, the most recent ones
+    :returns: dictionary with, for each phase, the number of calculations `count`, the `total`, `mean` and `max`
+        wall time in seconds, the maximum `peak_memory` in bytes, and the pks of the calculations with the largest wall
+        time `max_wall_time_pk` and peak memory `max_peak_memory_pk`
+    """
+    from aiida import orm
+
+    builder = orm.QueryBuilder()
+    relationship = {}
+    if group is not None:
+        builder.append(orm.Group, filters={'id': group.pk}, tag='group')
+        relationship = {'with_group': 'group'}
+    builder.append(
+        orm.CalcJobNode,
+        filters={
+            'process_type': 'aiida.calculations:abinit',
+            'extras': {
+                'has_key': PROFILING_EXTRA
+            }
+        },
+        project=['id', f'extras.{PROFILING_EXTRA}.{step}'],
+        tag='calculation',
+        **relationship
+    )
+    builder.order_by({'calculation': {'id': 'desc'}})
+    if limit is not None:
+        builder.limit(limit)
+
+    statistics = {}
+
+    for pk, phases in builder.iterall():
+        for name, phase in (phases or {}).items():
+            entry = statistics.setdefault(
+                name, {
+                    'count': 0,
+                    'total': 0.0,
+                    'max': 0.0,
+                    'peak_memory': 0,
+                    'max_wall_time_pk': None,
+                    'max_peak_memory_pk': None
+                }
+            )
+            entry['count'] += 1
+            entry['total'] += phase['wall_time']
+            if entry['max_wall_time_pk'] is None or phase['wall_time'] > entry['max']:
+                entry['max'] = phase['wall_time']
+                entry['max_wall_time_pk'] = pk
+            if entry['max_peak_memory_pk'] is None or phase['peak_memory'] > entry['peak_memory']:
+                entry['peak_memory'] = phase['peak_memory']
+                entry['max_peak_memory_pk'] = pk
+
+    for entry in statistics.values():
+        entry['mean'] = entry['total'] / entry['count']
+
+    return statistics
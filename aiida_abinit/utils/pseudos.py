@@ -1,11 +1,22 @@
 # -*- coding: utf-8 -*-
 """Pseudopotential utility functions."""
+import hashlib
+import os
+import posixpath
+import tempfile
 import typing as ty
+import uuid
 
 from aiida import orm
+from aiida.common.escaping import escape_for_bash
 from aiida_pseudo.data.pseudo import Psp8Data, JthXmlData
 
-__all__ = ('validate_and_prepare_pseudos_inputs',)
+__all__ = (
+    'get_remote_pseudo_path', 'get_staged_pseudo_paths', 'stage_pseudos_remote', 'validate_and_prepare_pseudos_inputs'
+)
+
+#: Extra of a pseudopotential node listing, per computer UUID, the remote cache directories it has been staged to.
+REMOTE_CACHE_EXTRA = 'aiida_abinit_remote_cache'
 
 
 def validate_and_prepare_pseudos_inputs(
@@ -38,3 +49,114 @@ def validate_and_prepare_pseudos_inputs(
             raise ValueError(f'pseudo for element {kind} is not of type Psp8Data or JthXmlData')
 
     return pseudos
+
+
+def get_remote_pseudo_path(pseudo: ty.Union[Psp8Data, JthXmlData], dirpath: str) -> str:
+    """Return the path of a pseudopotential in a content-addressed remote cache directory.
+
+    The pseudopotential is stored in a subdirectory named after its md5 checksum, with its original filename.
+
+    :param pseudo: pseudopotential node
+    :param dirpath: absolute path of the remote cache directory
+    :returns: absolute remote path of the pseudopotential file
+    """
+    return posixpath.join(dirpath, pseudo.md5, pseudo.filename)
+
+
+def get_staged_pseudo_paths(pseudos: ty.Iterable[ty.Union[Psp8Data, JthXmlData]], computer: orm.Computer,
+                            dirpath: str) -> ty.Dict[str, str]:
+    """Return the remote paths of the given pseudopotentials that were staged to a cache directory of a computer.
+
+    Only the `aiida_abinit_remote_cache` extra of the nodes, as recorded by `stage_pseudos_remote`, is checked, so that
+    no transport to the computer is opened.
+
+    :param pseudos: pseudopotential nodes
+    :param computer: computer on which the pseudopotentials are needed
+    :param dirpath: absolute path of the remote cache directory
+    :returns: dictionary mapping the UUID of each staged pseudopotential onto its absolute remote path
+    :raises ValueError: if `dirpath` is not an absolute path
+    """
+    if not posixpath.isabs(dirpath):
+        raise ValueError(f'the remote pseudopotential cache directory `{dirpath}` is not an absolute path.')
+
+    return {
+        pseudo.uuid: get_remote_pseudo_path(pseudo, dirpath)
+        for pseudo in pseudos
+        if dirpath in pseudo.base.extras.get(REMOTE_CACHE_EXTRA, {}).get(computer.uuid, [])
+    }
+
+
+def stage_pseudos_remote(pseudos: ty.Iterable[ty.Union[Psp8Data, JthXmlData]], computer: orm.Computer,
+                         dirpath: str) -> ty.Dict[str, str]:
+    """Make sure that the given pseudopotentials are present in a content-addressed cache directory of a computer.
+
+    This opens a transport to the computer, so it should be run before submitting the calculations that symlink the
+    pseudopotentials from the directory, e.g. with the `aiida-abinit stage-pseudos` command, and not while preparing
+    them. Pseudopotentials that are recorded as staged to the directory on the computer (in the
+    `aiida_abinit_remote_cache` extra of the node) are only checked to still exist, as the files may have been removed
+    since. The others are verified against the md5 checksum of the node and uploaded if missing or corrupted. Uploads
+    are written to a temporary file first and then moved in place, such that concurrent stagings never expose
+    incomplete files.
+
+    :param pseudos: pseudopotential nodes
+    :param computer: computer on which the pseudopotentials are needed
+    :param dirpath: absolute path of the remote cache directory
+    :returns: dictionary mapping the UUID of each pseudopotential onto its absolute remote path
+    :raises ValueError: if `dirpath` is not an absolute path
+    :raises OSError: if a pseudopotential could not be verified after its upload
+    """
+    if not posixpath.isabs(dirpath):
+        raise ValueError(f'the remote pseudopotential cache directory `{dirpath}` is not an absolute path.')
+
+    pseudos = {pseudo.uuid: pseudo for pseudo in pseudos}
+    remote_paths = {pseudo.uuid: get_remote_pseudo_path(pseudo, dirpath) for pseudo in pseudos.values()}
+
+    with computer.get_transport() as transport:
+        for pseudo in pseudos.values():
+            remote_path = remote_paths[pseudo.uuid]
+            remote_cache = pseudo.base.extras.get(REMOTE_CACHE_EXTRA, {})
+            is_recorded = dirpath in remote_cache.get(computer.uuid, [])
+            if is_recorded and transport.isfile(remote_path):
+                continue
+
+            if not _verify_remote_pseudo(transport, pseudo, remote_path):
+                _upload_remote_pseudo(transport, pseudo, remote_path)
+                if not _verify_remote_pseudo(transport, pseudo, remote_path):
+                    raise OSError(f'could not verify the pseudopotential staged to `{remote_path}`.')
+
+            if not is_recorded:
+                remote_cache.setdefault(computer.uuid, []).append(dirpath)
+                pseudo.base.extras.set(REMOTE_CACHE_EXTRA, remote_cache)
+
+    return remote_paths
+
+
+def _verify_remote_pseudo(transport, pseudo, remote_path: str) -> bool:
+    """Return whether the remote file exists and has the md5 checksum of the pseudopotential node."""
+    if not transport.isfile(remote_path):
+        return False
+
+    retval, stdout, _ = transport.exec_command_wait(f'md5sum {escape_for_bash(remote_path)}')
+    if retval == 0 and stdout.strip():
+        return stdout.split()[0] == pseudo.md5
+
+    # Fall back to computing the checksum locally if `md5sum` is not available on the computer
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = os.path.join(tmpdir, pseudo.filename)
+        transport.getfile(remote_path, filepath)
+        with open(filepath, 'rb') as handle:
+            return hashlib.md5(handle.read()).hexdigest() == pseudo.md5
+
+
+def _upload_remote_pseudo(transport, pseudo, remote_path: str) -> None:
+    """Upload the pseudopotential to the remote path through a temporary file."""
+    remote_tmp_path = f'{remote_path}.{uuid.uuid4().hex}.tmp'
+    transport.makedirs(posixpath.dirname(remote_path), ignore_existing=True)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = os.path.join(tmpdir, pseudo.filename)
+        with open(filepath, 'wb') as target, pseudo.open(mode='rb') as source:
+            target.write(source.read())
+        transport.putfile(filepath, remote_tmp_path)
+
+    transport.rename(remote_tmp_path, remote_path)
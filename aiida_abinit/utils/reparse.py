@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Utilities to re-parse the outputs of existing `AbinitCalculation` nodes in bulk."""
+import collections
+import typing as ty
+
+__all__ = ('REPARSE_EXTRA', 'get_calculations_to_reparse', 'reparse_calculations')
+
+#: Extra of the `CalcJobNode` with the tag of the last successful re-parse, used to resume an interrupted re-parse.
+REPARSE_EXTRA = 'aiida_abinit_reparse_tag'
+
+#: Result of the re-parse of a calculation: its pk, the exit status of the parser and the error message if it raised.
+ReparseResult = collections.namedtuple('ReparseResult', ['pk', 'exit_status', 'exception'])
+
+
+def get_calculations_to_reparse(tag: str, group=None, limit: ty.Optional[int] = None) -> ty.List[int]:
+    """Return the pks of the `AbinitCalculation` nodes with a retrieved folder that were not yet re-parsed with `tag`.
+
+    :param tag: tag of the re-parse, calculations whose `REPARSE_EXTRA` extra is equal to it are skipped
+    :param group: optional `Group` to which the calculations should belong
+    :param limit: optional maximum number of calculations to return
+    :returns: list of pks, in increasing order
+    """
+    from aiida import orm
+
+    builder = orm.QueryBuilder()
+    relationship = {}
+    if group is not None:
+        builder.append(orm.Group, filters={'id': group.pk}, tag='group')
+        relationship = {'with_group': 'group'}
+    builder.append(
+        orm.CalcJobNode,
+        filters={'process_type': 'aiida.calculations:abinit'},
+        project=['id', f'extras.{REPARSE_EXTRA}'],
+        tag='calculation',
+        **relationship
+    )
+    builder.append(orm.FolderData, with_incoming='calculation', edge_filters={'label': 'retrieved'})
+    builder.order_by({'calculation': {'id': 'asc'}})
+
+    pks = [pk for pk, reparse_tag in builder.iterall() if reparse_tag != tag]
+
+    return pks[:limit] if limit is not None else pks
+
+
+def _reparse_batch(pks: ty.List[int], tag: str, store_provenance: bool = True) -> ty.List[ReparseResult]:
+    """Re-parse the calculations with the given pks and tag those that were parsed, returning the results.
+
+    The outputs are stored through `Parser.parse_from_node`, which records the re-parse as a `CalcFunctionNode` with the
+    retrieved folder as input. The calculations are tagged as they are parsed, such that an interrupted re-parse only
+    repeats the calculations of the batches that were running.
+    """
+    from aiida import orm
+    from aiida.plugins import ParserFactory
+
+    parser_class = ParserFactory('abinit')
+    results = []
+
+    for pk in pks:
+        node = orm.load_node(pk)
+        try:
+            _, calcfunction = parser_class.parse_from_node(node, store_provenance=store_provenance)
+        except Exception as exception:  # pylint: disable=broad-except
+            results.append(ReparseResult(pk, None, f'{type(exception).__name__}: {exception}'))
+            continue
+        if store_provenance:
+            node.base.extras.set(REPARSE_EXTRA, tag)
+        results.append(ReparseResult(pk, calcfunction.exit_status, None))
+
+    return results
+
+
+def _initialize_worker(profile_name: str) -> None:
+    """Load the profile of the parent process in a worker of the process pool."""
+    from aiida import load_profile
+
+    load_profile(profile_name, allow_switch=True)
+
+
+def reparse_calculations(
+    pks: ty.List[int],
+    tag: str,
+    max_workers: ty.Optional[int] = None,
+    batch_size: int = 100,
+    store_provenance: bool = True
+) -> ty.Iterator[ty.List[ReparseResult]]:
+    """Re-parse the calculations with the given pks with the current `AbinitParser`, in a pool of processes.
+
+    The calculations are distributed over the workers in batches of `batch_size`, and the results are yielded one batch
+    at a time as they complete, such that the caller can report the progress. Each worker loads the current profile and
+    stores the outputs of its calculations itself. Every calculation whose outputs were stored, whether the parser
+    succeeded or returned an exit code, gets the `REPARSE_EXTRA` extra set to `tag`, such that an interrupted re-parse
+    can be resumed by querying the calculations with `get_calculations_to_reparse` again. Calculations for which the
+    parser raised are not tagged.
+
+    Note that the files of the `retrieve_temporary_list` are not available anymore, such that calculations that ran
+    with the `temporary` value of the `NETCDF_RETRIEVAL` setting can only re-parse the standard output.
+
+    :param pks: pks of the `AbinitCalculation` nodes to re-parse, see `get_calculations_to_reparse`
+    :param tag: tag of the re-parse, e.g. the version of the parser
+    :param max_workers: number of worker processes, by default the number of CPUs. With a single worker, the
+        calculations are re-parsed in the current process.
+    :param batch_size: number of calculations sent to a worker at once
+    :param store_provenance: whether to store the outputs, `False` can be used to test the parser on a subset of the
+        calculations
+    :returns: iterator over the lists of `ReparseResult` of the batches, in the order in which they complete
+    """
+    import concurrent.futures
+    import multiprocessing
+
+    from aiida import get_profile
+
+    batch_size = max(int(batch_size), 1)
+    batches = [pks[index:index + batch_size] for index in range(0, len(pks), batch_size)]
+
+    if max_workers == 1:
+        for batch in batches:
+            yield _reparse_batch(batch, tag, store_provenance)
+        return
+
+    # Workers are spawned rather than forked, as they should not share the database connections of the parent
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_initialize_worker,
+        initargs=(get_profile().name,)
+    ) as executor:
+        futures = [executor.submit(_reparse_batch, batch, tag, store_provenance) for batch in batches]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
@@ -1,11 +1,35 @@
 # -*- coding: utf-8 -*-
 """Utilities for calculation job resources."""
 
+import math
+import typing as ty
+
+import numpy as np
+
+from aiida import orm
+
+from .structure import get_sanitized_structure
+
 __all__ = (
+    'estimate_step_costs',
+    'estimate_wallclock_seconds',
+    'get_autoparal_resources',
     'get_default_options',
+    'get_irreducible_kpoints_count',
+    'get_kpoint_parallel_layouts',
+    'get_timelimit_seconds',
+    'plan_kpoint_resources',
     'seconds_to_timelimit',
+    'select_autoparal_configuration',
 )
 
+#: Default margin between the walltime of the scheduler and the `--timelimit` of ABINIT, such that ABINIT can write its
+#: output files before it is killed: the largest of a `fraction` of the walltime and a number of `seconds`.
+DEFAULT_TIMELIMIT_MARGIN = {'fraction': 0.05, 'seconds': 60}
+
+#: ABINIT default of the maximum number of SCF iterations `nstep`.
+DEFAULT_NSTEP = 30
+
 
 def get_default_options(max_num_machines: int = 1, max_wallclock_seconds: int = 1800, with_mpi: bool = False) -> dict:
     """Return an instance of the options dictionary with the minimally required parameters for a `CalcJob`.
@@ -42,3 +66,241 @@ def seconds_to_timelimit(seconds: int) -> str:
         timelimit += f'{hours:02d}:'
     timelimit += f'{minutes:02d}:{seconds:02d}'
     return timelimit
+
+
+def get_timelimit_seconds(max_wallclock_seconds: int, margin: ty.Optional[dict] = None) -> int:
+    """Return the `--timelimit` of ABINIT for a walltime, leaving a margin to write the output files.
+
+    The margin is the largest of a `fraction` of the walltime and a number of `seconds`, but at most half the walltime.
+
+    :param max_wallclock_seconds: walltime of the scheduler in seconds
+    :param margin: dictionary with the `fraction` and `seconds` of the margin, by default `DEFAULT_TIMELIMIT_MARGIN`
+    :returns: time limit in seconds
+    :raises ValueError: if the margin has unknown keys or negative values
+    """
+    margin = {**DEFAULT_TIMELIMIT_MARGIN, **(margin or {})}
+
+    unknown_keys = set(margin) - set(DEFAULT_TIMELIMIT_MARGIN)
+    if unknown_keys:
+        raise ValueError(
+            f"Unknown keys of the timelimit margin: {', '.join(sorted(unknown_keys))}, should be among: "
+            f"{', '.join(DEFAULT_TIMELIMIT_MARGIN)}."
+        )
+    if not all(isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+               for value in margin.values()) or margin['fraction'] >= 1:
+        raise ValueError(f'The timelimit margin should have non-negative values and a fraction below 1: {margin}.')
+
+    seconds = max(margin['fraction'] * max_wallclock_seconds, margin['seconds'])
+
+    return int(max_wallclock_seconds - min(seconds, max_wallclock_seconds / 2))
+
+
+def estimate_step_costs(timings: ty.List[dict]) -> ty.Tuple[ty.Optional[float], ty.Optional[float]]:
+    """Return the average wall time of an SCF iteration and of an ionic step over previous calculations.
+
+    :param timings: dictionaries with the `wall_time` in seconds and the `num_scf_iterations` and `num_ionic_steps` of
+        previous calculations, as in their `output_parameters`. Those without a wall time are ignored.
+    :returns: wall time of an SCF iteration and of an ionic step in seconds, `None` if no iteration or step was done
+    """
+    costs = []
+
+    for key in ('num_scf_iterations', 'num_ionic_steps'):
+        counted = [timing for timing in timings if timing.get('wall_time') is not None and timing.get(key, 0) > 0]
+        total_steps = sum(timing[key] for timing in counted)
+        costs.append(sum(timing['wall_time'] for timing in counted) / total_steps if total_steps else None)
+
+    return tuple(costs)
+
+
+def estimate_wallclock_seconds(
+    parameters: dict,
+    scf_iteration_cost: ty.Optional[float],
+    ionic_step_cost: ty.Optional[float],
+    safety_factor: float = 1.5,
+    min_wallclock_seconds: int = 600,
+    max_wallclock_seconds: ty.Optional[int] = None,
+    margin: ty.Optional[dict] = None
+) -> ty.Optional[int]:
+    """Estimate the walltime to request for a calculation from the cost of the steps of previous calculations.
+
+    Relaxations are estimated from their maximum number of ionic steps `ntime`, other runs from their maximum number of
+    SCF iterations `nstep`. The estimate is multiplied by the `safety_factor` and increased by the margin of the
+    `--timelimit`, such that ABINIT can complete the steps before it stops.
+
+    :param parameters: input parameters of the calculation
+    :param scf_iteration_cost: wall time of an SCF iteration in seconds, see `estimate_step_costs`
+    :param ionic_step_cost: wall time of an ionic step in seconds, see `estimate_step_costs`
+    :param safety_factor: factor applied to the estimated wall time
+    :param min_wallclock_seconds: minimum walltime in seconds
+    :param max_wallclock_seconds: optional maximum walltime in seconds
+    :param margin: the margin of the `--timelimit`, see `get_timelimit_seconds`
+    :returns: walltime in seconds, or `None` if it cannot be estimated
+    """
+    if parameters.get('ionmov', 0) > 0:
+        if ionic_step_cost is None or 'ntime' not in parameters:
+            return None
+        estimate = parameters['ntime'] * ionic_step_cost
+    else:
+        if scf_iteration_cost is None:
+            return None
+        estimate = parameters.get('nstep', DEFAULT_NSTEP) * scf_iteration_cost
+
+    margin = {**DEFAULT_TIMELIMIT_MARGIN, **(margin or {})}
+    estimate *= safety_factor
+    wallclock_seconds = max(estimate / (1 - margin['fraction']), estimate + margin['seconds'])
+    wallclock_seconds = max(wallclock_seconds, min_wallclock_seconds)
+    if max_wallclock_seconds is not None:
+        wallclock_seconds = min(wallclock_seconds, max_wallclock_seconds)
+
+    return int(math.ceil(wallclock_seconds))
+
+
+def select_autoparal_configuration(configurations: ty.List[dict],
+                                   max_ncpus: int,
+                                   min_efficiency: float = 0.0) -> ty.Optional[dict]:
+    """Select the best parallel configuration among those proposed by ABINIT with `autoparal`.
+
+    The configurations using at most `max_ncpus` cores with a parallel efficiency of at least `min_efficiency` are
+    ranked by their speedup, i.e. the product of the number of cores and the efficiency. If no configuration is
+    efficient enough, the most efficient one is returned.
+
+    :param configurations: list of configurations from the `configurations` section of the `Autoparal` document
+    :param max_ncpus: maximum number of cores, i.e. MPI processes times OpenMP threads
+    :param min_efficiency: minimum parallel efficiency
+    :returns: the selected configuration or `None` if no configuration fits in `max_ncpus` cores
+    """
+
+    def get_ncpus(configuration):
+        return configuration.get('tot_ncpus', configuration['mpi_ncpus'] * configuration.get('omp_ncpus', 1))
+
+    candidates = [configuration for configuration in configurations if get_ncpus(configuration) <= max_ncpus]
+    if not candidates:
+        return None
+
+    efficient = [configuration for configuration in candidates if configuration['efficiency'] >= min_efficiency]
+    if not efficient:
+        return max(candidates, key=lambda configuration: configuration['efficiency'])
+
+    return max(efficient, key=lambda configuration: (get_ncpus(configuration) * configuration['efficiency'],
+                                                     configuration['efficiency']))
+
+
+def get_autoparal_resources(configuration: dict, num_mpiprocs_per_machine: int) -> dict:
+    """Return the `resources` option corresponding to a parallel configuration proposed by ABINIT with `autoparal`.
+
+    The MPI processes are distributed evenly over the smallest number of machines with at most
+    `num_mpiprocs_per_machine` processes each, such that the total number of processes is the one of the configuration.
+
+    :param configuration: a configuration of the `Autoparal` document, see `select_autoparal_configuration`
+    :param num_mpiprocs_per_machine: maximum number of MPI processes per machine
+    :returns: resources dictionary with `num_machines`, `num_mpiprocs_per_machine` and `num_cores_per_mpiproc`
+    """
+    mpi_ncpus = int(configuration['mpi_ncpus'])
+    num_machines = math.ceil(mpi_ncpus / num_mpiprocs_per_machine)
+    while mpi_ncpus % num_machines:
+        num_machines += 1
+
+    return {
+        'num_machines': num_machines,
+        'num_mpiprocs_per_machine': mpi_ncpus // num_machines,
+        'num_cores_per_mpiproc': int(configuration.get('omp_ncpus', 1)),
+    }
+
+
+def get_irreducible_kpoints_count(structure: orm.StructureData,
+                                  mesh: ty.Sequence[int],
+                                  shiftk: ty.Optional[ty.Sequence] = None,
+                                  kptopt: int = 1,
+                                  symprec: float = 1e-5) -> int:
+    """Return the number of irreducible k-points of a Monkhorst-Pack mesh, as generated by ABINIT.
+
+    The symmetry of the structure is determined with `spglib` for the structure sanitized in the same way as for the
+    input file, since the mesh is defined with respect to its reciprocal lattice. Shifts that are neither zero nor half
+    a grid step along each direction cannot be reduced by `spglib` and count the full mesh.
+
+    :param structure: input structure
+    :param mesh: number of k-points along each reciprocal lattice vector, i.e. `ngkpt`
+    :param shiftk: list of shifts of the mesh, by default a single unshifted mesh
+    :param kptopt: the ABINIT `kptopt`: 1 uses the symmetries and time reversal, 2 only time reversal, 3 neither and 4
+        only the symmetries
+    :param symprec: symmetry precision passed to `spglib`
+    :returns: number of irreducible k-points
+    """
+    import spglib
+
+    abi_structure, _ = get_sanitized_structure(structure)
+    cell = (abi_structure.lattice.matrix, abi_structure.frac_coords, abi_structure.atomic_numbers)
+
+    if kptopt in (1, 4):
+        rotations = spglib.get_symmetry(cell, symprec=symprec)['rotations']
+    else:
+        rotations = np.eye(3, dtype='intc')[np.newaxis]
+
+    count = 0
+    for shift in np.reshape(shiftk if shiftk is not None else [0.0, 0.0, 0.0], (-1, 3)):
+        if not np.all(np.isclose(shift, 0.0) | np.isclose(shift, 0.5)) or kptopt == 3:
+            count += int(np.prod(mesh))
+            continue
+        mapping, _ = spglib.get_stabilized_reciprocal_mesh(
+            mesh, rotations, is_shift=np.isclose(shift, 0.5).astype('intc'), is_time_reversal=kptopt in (1, 2)
+        )
+        count += len(np.unique(mapping))
+
+    return count
+
+
+def get_kpoint_parallel_layouts(num_kpoints: int, max_num_machines: int, num_cores_per_machine: int) -> ty.List[dict]:
+    """Return the layouts of MPI processes and OpenMP threads that distribute the k-points evenly over the processes.
+
+    ABINIT distributes the k-points and spins over the MPI processes, which are only all busy if their number divides
+    `nkpt * nsppol`, and the k-point parallelization scales better than the OpenMP threads. Each MPI process runs as
+    many OpenMP threads, `num_cores_per_mpiproc`, as fit on the cores of its machine. The layouts are sorted such that
+    those with most MPI processes, then using most cores, then with fewest threads, come first.
+
+    :param num_kpoints: the number of k-points times the number of spin polarizations, i.e. `nkpt * nsppol`
+    :param max_num_machines: maximum number of machines
+    :param num_cores_per_machine: number of cores of each machine
+    :returns: list of resources dictionaries with `num_machines`, `num_mpiprocs_per_machine` and
+        `num_cores_per_mpiproc`
+    """
+    layouts = []
+
+    for num_machines in range(1, max_num_machines + 1):
+        for num_mpiprocs_per_machine in range(1, num_cores_per_machine + 1):
+            if num_kpoints % (num_machines * num_mpiprocs_per_machine) == 0:
+                layouts.append({
+                    'num_machines': num_machines,
+                    'num_mpiprocs_per_machine': num_mpiprocs_per_machine,
+                    'num_cores_per_mpiproc': num_cores_per_machine // num_mpiprocs_per_machine,
+                })
+
+    def sort_key(layout):
+        num_mpiprocs = layout['num_machines'] * layout['num_mpiprocs_per_machine']
+        return (-num_mpiprocs, -num_mpiprocs * layout['num_cores_per_mpiproc'], layout['num_cores_per_mpiproc'])
+
+    return sorted(layouts, key=sort_key)
+
+
+def plan_kpoint_resources(structure: orm.StructureData, kpoints: orm.KpointsData, parameters: dict,
+                          max_num_machines: int, num_cores_per_machine: int) -> dict:
+    """Return the resources with the most MPI processes that distribute the k-points evenly over the processes.
+
+    :param structure: input structure
+    :param kpoints: input k-point mesh or list
+    :param parameters: input parameters, from which `kptopt`, `shiftk` and `nsppol` are taken
+    :param max_num_machines: maximum number of machines
+    :param num_cores_per_machine: number of cores of each machine
+    :returns: resources dictionary, see `get_kpoint_parallel_layouts`
+    """
+    try:
+        mesh = kpoints.get_kpoints_mesh()[0]
+    except AttributeError:
+        nkpt = len(kpoints.get_kpoints())
+    else:
+        nkpt = get_irreducible_kpoints_count(
+            structure, mesh, parameters.get('shiftk', None), parameters.get('kptopt', 1)
+        )
+
+    num_kpoints = nkpt * parameters.get('nsppol', 1)
+
+    return get_kpoint_parallel_layouts(num_kpoints, max_num_machines, num_cores_per_machine)[0]
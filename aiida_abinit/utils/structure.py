@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Structure utility functions."""
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import typing as ty
+
+from aiida import orm
+
+__all__ = ('get_sanitized_structure', 'clear_structure_cache', 'set_structure_cache_size')
+
+#: Environment variable with the maximum number of entries of the in-memory sanitized structure cache.
+STRUCTURE_CACHE_SIZE_ENV = 'AIIDA_ABINIT_STRUCTURE_CACHE_SIZE'
+#: Environment variable with the path of a directory used as on-disk tier of the sanitized structure cache.
+STRUCTURE_CACHE_DIR_ENV = 'AIIDA_ABINIT_STRUCTURE_CACHE_DIR'
+
+DEFAULT_STRUCTURE_CACHE_SIZE = 128
+
+
+class _StructureCache:
+    """Bounded least-recently-used cache of sanitized structures and their ABINIT structure variables.
+
+    The in-memory tier stores the sanitized `abipy` `Structure` together with its abivars. The optional on-disk tier
+    stores the sanitized structure only, serialized as JSON, such that several daemon workers can share the result of
+    the sanitization. The abivars are cheap to derive from the sanitized structure and are recomputed when an entry is
+    loaded from disk.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_STRUCTURE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str):
+        """Return the entry for the given key from the in-memory tier or `None` if not present."""
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return None
+            return self._entries[key]
+
+    def put(self, key: str, value) -> None:
+        """Add an entry to the in-memory tier, evicting the least recently used entries if necessary."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all entries from the in-memory tier."""
+        with self._lock:
+            self._entries.clear()
+
+
+_STRUCTURE_CACHE = _StructureCache(int(os.environ.get(STRUCTURE_CACHE_SIZE_ENV, DEFAULT_STRUCTURE_CACHE_SIZE)))
+
+
+def set_structure_cache_size(maxsize: int) -> None:
+    """Set the maximum number of entries of the in-memory sanitized structure cache.
+
+    A size of zero disables the in-memory tier. Excess entries are evicted the next time an entry is added.
+
+    :param maxsize: maximum number of entries
+    """
+    _STRUCTURE_CACHE.maxsize = int(maxsize)
+
+
+def clear_structure_cache() -> None:
+    """Remove all entries from the in-memory sanitized structure cache."""
+    _STRUCTURE_CACHE.clear()
+
+
+def _get_cache_key(structure: orm.StructureData, sanitize_kwargs: dict) -> str:
+    """Return the cache key for the given structure and `abi_sanitize` keyword arguments."""
+    parameters = json.dumps(sanitize_kwargs, sort_keys=True)
+    return hashlib.sha256(f'{structure.base.caching.get_hash()}:{parameters}'.encode('utf-8')).hexdigest()
+
+
+def _load_from_disk(dirpath: str, key: str):
+    """Load a sanitized structure from the on-disk tier or return `None` if not present or unreadable."""
+    from abipy.core.structure import Structure as AbiStructure
+
+    try:
+        with open(os.path.join(dirpath, f'{key}.json'), 'r', encoding='utf-8') as handle:
+            return AbiStructure.from_dict(json.load(handle))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _dump_to_disk(dirpath: str, key: str, abi_structure) -> None:
+    """Atomically write a sanitized structure to the on-disk tier, ignoring any I/O errors."""
+    try:
+        os.makedirs(dirpath, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=dirpath, suffix='.tmp', delete=False, encoding='utf-8') as handle:
+            json.dump(abi_structure.as_dict(), handle)
+        os.replace(handle.name, os.path.join(dirpath, f'{key}.json'))
+    except OSError:
+        pass
+
+
+def get_sanitized_structure(
+    structure: orm.StructureData,
+    symprec: float = 1e-3,
+    angle_tolerance: float = 5,
+    primitive: bool = True,
+    primitive_standard: bool = False
+) -> ty.Tuple[ty.Any, dict]:
+    """Return the `abipy` sanitized version of a `StructureData` and its ABINIT structure variables.
+
+    The result of the sanitization is cached in a bounded in-memory LRU cache keyed on the hash of the structure node
+    and the sanitization parameters. The size of the cache can be set through the `AIIDA_ABINIT_STRUCTURE_CACHE_SIZE`
+    environment variable or `set_structure_cache_size`. If the `AIIDA_ABINIT_STRUCTURE_CACHE_DIR` environment variable
+    is set, the sanitized structures are also stored in that directory, such that they are shared between processes.
+
+    :param structure: input structure
+    :param symprec: symmetry precision passed to `abi_sanitize`
+    :param angle_tolerance: angle tolerance passed to `abi_sanitize`
+    :param primitive: whether `abi_sanitize` should reduce the structure to its primitive cell
+    :param primitive_standard: whether `abi_sanitize` should use the standard primitive cell
+    :returns: tuple of a copy of the sanitized `abipy` `Structure` and a copy of its abivars (`natom`, `ntypat`,
+        `typat`, `znucl`, `xred`, `acell`, `rprim`)
+    """
+    from abipy.core.structure import Structure as AbiStructure
+
+    sanitize_kwargs = {
+        'symprec': symprec,
+        'angle_tolerance': angle_tolerance,
+        'primitive': primitive,
+        'primitive_standard': primitive_standard,
+    }
+    key = _get_cache_key(structure, sanitize_kwargs)
+    entry = _STRUCTURE_CACHE.get(key)
+
+    if entry is None:
+        dirpath = os.environ.get(STRUCTURE_CACHE_DIR_ENV, None)
+        abi_structure = _load_from_disk(dirpath, key) if dirpath else None
+
+        if abi_structure is None:
+            # `abipy` has its own subclass of Pymatgen's `Structure`, so we use that
+            abi_structure = AbiStructure.as_structure(structure.get_pymatgen())
+            abi_structure = abi_structure.abi_sanitize(**sanitize_kwargs)
+            if dirpath:
+                _dump_to_disk(dirpath, key, abi_structure)
+
+        entry = (abi_structure, abi_structure.to_abivars())
+        _STRUCTURE_CACHE.put(key, entry)
+
+    abi_structure, abivars = entry
+    abivars = {name: value.copy() if hasattr(value, 'copy') else value for name, value in abivars.items()}
+
+    return abi_structure.copy(), abivars
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Trajectory utility functions."""
+import typing as ty
+
+import numpy as np
+
+from aiida import orm
+from aiida.engine import calcfunction
+
+__all__ = ('get_trajectory_overlap', 'stitch_trajectories')
+
+# Arrays of the `TrajectoryData` of the `AbinitParser` concatenated by `stitch_trajectories`, besides the `positions`
+# and `cells`, if they have one entry per step in all trajectories
+STITCHED_ARRAYS = ('energy', 'energy_kin', 'forces', 'stress', 'total_force')
+
+
+def get_trajectory_overlap(previous: orm.TrajectoryData, trajectory: orm.TrajectoryData) -> int:
+    """Return the number of leading steps of a trajectory that repeat steps of the trajectory it continues.
+
+    A calculation that restarts from the HIST file of a previous one starts from its last geometry, which is then the
+    first step of its trajectory, but may also copy the history of the previous calculation into its own. All steps up
+    to the last one with the final geometry and cell of the previous trajectory are therefore repeated steps.
+
+    :param previous: trajectory of the previous calculation
+    :param trajectory: trajectory of the calculation restarted from the previous one
+    :returns: number of steps of `trajectory` to skip to continue `previous`
+    """
+    positions = trajectory.get_positions()
+    cells = trajectory.get_cells()
+
+    if positions.shape[1:] != previous.get_positions().shape[1:]:
+        return 0
+
+    matches = np.all(np.isclose(positions, previous.get_positions()[-1]), axis=(1, 2))
+    if cells is not None and previous.get_cells() is not None:
+        matches &= np.all(np.isclose(cells, previous.get_cells()[-1]), axis=(1, 2))
+
+    indices = np.flatnonzero(matches)
+
+    return int(indices[-1]) + 1 if len(indices) > 0 else 0
+
+
+def _stitch_trajectories(trajectories: ty.List[orm.TrajectoryData]) -> orm.TrajectoryData:
+    """Concatenate the trajectories of successive calculations, see `stitch_trajectories`."""
+    stepids, cells, positions = [], [], []
+    arrays = {name: [] for name in STITCHED_ARRAYS}
+    last_stepid = None
+
+    for index, trajectory in enumerate(trajectories):
+        overlap = get_trajectory_overlap(trajectories[index - 1], trajectory) if index > 0 else 0
+        trajectory_stepids = trajectory.get_stepids()
+
+        # The step ids are shifted such that the last skipped step, or else the step before the first, is the last step
+        # of the previous trajectory
+        if last_stepid is None:
+            shift = 0
+        elif overlap > 0:
+            shift = last_stepid - trajectory_stepids[overlap - 1]
+        else:
+            shift = last_stepid + 1 - trajectory_stepids[0]
+
+        stepids.append(trajectory_stepids[overlap:] + shift)
+        cells.append(trajectory.get_cells()[overlap:])
+        positions.append(trajectory.get_positions()[overlap:])
+
+        for name in list(arrays):
+            if name in trajectory.get_arraynames() and len(trajectory.get_array(name)) == trajectory.numsteps:
+                arrays[name].append(trajectory.get_array(name)[overlap:])
+            else:
+                arrays.pop(name)
+
+        if len(stepids[-1]) > 0:
+            last_stepid = stepids[-1][-1]
+
+    stitched = orm.TrajectoryData()
+    stitched.set_trajectory(
+        symbols=trajectories[-1].symbols,
+        positions=np.concatenate(positions),
+        stepids=np.concatenate(stepids),
+        cells=np.concatenate(cells)
+    )
+    for name, values in arrays.items():
+        stitched.set_array(name, np.concatenate(values))
+
+    return stitched
+
+
+@calcfunction
+def stitch_trajectories(**trajectories) -> orm.TrajectoryData:
+    """Concatenate the trajectories of successive calculations, each restarted from the HIST file of the previous one.
+
+    The steps of a trajectory that repeat those of the previous one, see `get_trajectory_overlap`, are skipped and the
+    step ids are shifted to follow those of the previous trajectory. Besides the positions and cells, only the arrays of
+    `STITCHED_ARRAYS` that have one entry per step in all trajectories are kept.
+
+    :param trajectories: the `TrajectoryData` of the calculations, ordered by their keys `trajectory_<index>`
+    :returns: the stitched `TrajectoryData`
+    """
+    ordered = [trajectories[key] for key in sorted(trajectories, key=lambda key: int(key.rsplit('_', 1)[-1]))]
+    return _stitch_trajectories(ordered)
@@ -2,5 +2,6 @@
 """Workchains."""
 
 from .base import AbinitBaseWorkChain
+from .convergence import AbinitConvergenceWorkChain
 
-__all__ = ('AbinitBaseWorkChain',)
+__all__ = ('AbinitBaseWorkChain', 'AbinitConvergenceWorkChain')
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 """Base Abinit WorkChain implementation."""
 from aiida import orm
-from aiida.common import AttributeDict, exceptions
-from aiida.engine import (BaseRestartWorkChain, ProcessHandlerReport, process_handler, while_)
+from aiida.common import AttributeDict
+from aiida.engine import (BaseRestartWorkChain, ProcessHandlerReport, ToContext, if_, process_handler, while_)
 from aiida.plugins import CalculationFactory
-from aiida_abinit.utils import (create_kpoints_from_distance, validate_and_prepare_pseudos_inputs)
+from aiida_pseudo.data.pseudo import JthXmlData
+from aiida_abinit.utils import (create_kpoints_from_distance, estimate_step_costs, estimate_wallclock_seconds,
+                                get_autoparal_resources, get_timelimit_seconds, plan_kpoint_resources,
+                                select_autoparal_configuration, stitch_trajectories, uppercase_dict,
+                                validate_and_prepare_pseudos_inputs)
 
 AbinitCalculation = CalculationFactory('abinit')
 
@@ -14,6 +18,25 @@ class AbinitBaseWorkChain(BaseRestartWorkChain):
 
     _process_class = AbinitCalculation
 
+    # Default values of the optional keys of the `automatic_parallelization` input
+    _AUTOMATIC_PARALLELIZATION_DEFAULTS = {'autoparal': 1, 'min_efficiency': 0.8, 'num_mpiprocs_per_machine': None}
+
+    # Default values of the optional keys of the `adaptive_walltime` input, the maximum walltime defaults to that of
+    # the `options`
+    _ADAPTIVE_WALLTIME_DEFAULTS = {'safety_factor': 1.5, 'min_wallclock_seconds': 600, 'max_wallclock_seconds': None}
+
+    # Successive strategies to restart a calculation whose SCF cycle did not converge: each multiplies the maximum
+    # number of SCF steps `nstep` and the mixing factor `diemix` of the previous calculation, and can set other input
+    # parameters, e.g. the preconditioning of the SCF cycle with the dielectric matrix `iprcel`
+    _SCF_RESTART_STRATEGIES = (
+        {'nstep': 2.0},
+        {'nstep': 2.0, 'diemix': 0.5},
+        {'nstep': 1.5, 'diemix': 0.5, 'parameters': {'iprcel': 45}},
+    )
+
+    # Default values of ABINIT for the input parameters changed by the SCF restart strategies, `diemix` is 0.7 for PAW
+    _SCF_DEFAULTS = {'nstep': 30, 'diemix': 1.0}
+
     @classmethod
     def define(cls, spec):
         """Define the process specification."""
@@ -31,6 +54,30 @@ class AbinitBaseWorkChain(BaseRestartWorkChain):
                    help='The minimum desired distance in 1/Å between k-points in reciprocal space. The explicit '
                         'k-point mesh will be generated automatically by a calculation function based on the input '
                         'structure.')
+        spec.input('automatic_parallelization',
+                   valid_type=orm.Dict,
+                   required=False,
+                   help='When defined, a short ABINIT `autoparal` calculation is run first to determine the parallel '
+                        'configuration of the calculation. Should contain the maximum number of cores `max_ncpus` and '
+                        'optionally the `autoparal` method (default 1), the minimum parallel efficiency '
+                        '`min_efficiency` (default 0.8) and the maximum `num_mpiprocs_per_machine` (defaults to that '
+                        'of the computer).')
+        spec.input('kpoint_parallelization',
+                   valid_type=orm.Bool,
+                   required=False,
+                   help='When `True`, the MPI processes and OpenMP threads are chosen such that the k-points are '
+                        'distributed evenly over the MPI processes, using the `num_machines` of the `resources` as '
+                        'maximum and the `default_mpiprocs_per_machine` of the computer as number of cores per '
+                        'machine. Any number of MPI processes in the `resources` is replaced. Ignored if the '
+                        '`automatic_parallelization` input is defined.')
+        spec.input('adaptive_walltime',
+                   valid_type=orm.Dict,
+                   required=False,
+                   help='When defined, the walltime of each restart is estimated from the wall time of the SCF '
+                        'iterations and ionic steps of the previous calculations, for `nstep` SCF iterations or, for '
+                        'relaxations, `ntime` ionic steps. Can contain the `safety_factor` applied to the estimate '
+                        '(default 1.5), and the `min_wallclock_seconds` (default 600) and `max_wallclock_seconds` '
+                        '(defaults to that of the `options`) of the walltime.')
         spec.expose_inputs(AbinitCalculation,
                            namespace='abinit',
                            exclude=('kpoints',))
@@ -41,6 +88,10 @@ class AbinitBaseWorkChain(BaseRestartWorkChain):
             cls.validate_kpoints,
             cls.validate_pseudos,
             cls.validate_resources,
+            if_(cls.should_run_autoparal)(
+                cls.run_autoparal,
+                cls.inspect_autoparal,
+            ),
             while_(cls.should_run_process)(
                 cls.prepare_process,
                 cls.run_process,
@@ -59,6 +110,16 @@ class AbinitBaseWorkChain(BaseRestartWorkChain):
             message='Neither the `options` nor `automatic_parallelization` input was specified.')
         spec.exit_code(204, 'ERROR_INVALID_INPUT_RESOURCES_UNDERSPECIFIED',
             message='The `metadata.options` did not specify both `resources.num_machines` and `max_wallclock_seconds`.')
+        spec.exit_code(205, 'ERROR_INVALID_INPUT_AUTOMATIC_PARALLELIZATION',
+            message='The `automatic_parallelization` input contains unknown keys or does not define `max_ncpus`.')
+        spec.exit_code(206, 'ERROR_INVALID_INPUT_ADAPTIVE_WALLTIME',
+            message='The `adaptive_walltime` input contains unknown keys.')
+        spec.exit_code(207, 'ERROR_INVALID_INPUT_KPOINT_PARALLELIZATION',
+            message='The `kpoint_parallelization` requires the `default_mpiprocs_per_machine` of the computer.')
+        spec.exit_code(310, 'ERROR_SUB_PROCESS_FAILED_AUTOMATIC_PARALLELIZATION',
+            message='The automatic parallelization calculation failed or proposed no suitable configuration.')
+        spec.exit_code(410, 'ERROR_SCF_CONVERGENCE_NOT_REACHED',
+            message='The SCF cycle did not converge with any of the restart strategies.')
 
     def setup(self):
         """Call the `setup` of the `BaseRestartWorkChain` and then create the inputs dictionary in `self.ctx.inputs`.
@@ -68,6 +129,7 @@ class AbinitBaseWorkChain(BaseRestartWorkChain):
         """
         super().setup()
         self.ctx.restart_calc = None
+        self.ctx.scf_restarts = []
         self.ctx.inputs = AttributeDict(self.exposed_inputs(AbinitCalculation, 'abinit'))
 
     def validate_parameters(self):
@@ -88,9 +150,8 @@ class AbinitBaseWorkChain(BaseRestartWorkChain):
         the case of the latter, the `KpointsData` will be constructed for the input `StructureData` using the
         `create_kpoints_from_distance` calculation function.
         """
-        for key in ['kpoints', 'kpoints_distance']:
-            if key in self.inputs:
-                return self.exit_codes.ERROR_INVALID_INPUT_KPOINTS # pylint: disable=no-member
+        if all(key not in self.inputs for key in ['kpoints', 'kpoints_distance']):
+            return self.exit_codes.ERROR_INVALID_INPUT_KPOINTS  # pylint: disable=no-member
 
         try:
             kpoints = self.inputs.kpoints
@@ -122,27 +183,264 @@ class AbinitBaseWorkChain(BaseRestartWorkChain):
         """Validate the inputs related to the resources.
 
         `metadata.options` should at least contain the options `resources` and `max_wallclock_seconds`,
-        where `resources` should define the `num_machines`.
+        where `resources` should define the `num_machines`. If the `automatic_parallelization` input is defined, the
+        `resources` are determined by the `autoparal` calculation instead.
+
+        If the `kpoint_parallelization` input is `True`, the `num_machines` are used as maximum and the MPI processes
+        and OpenMP threads are chosen such that the k-points are distributed evenly over the MPI processes, using the
+        cores of each machine as given by the `default_mpiprocs_per_machine` of the computer.
         """
+        if 'adaptive_walltime' in self.inputs:
+            adaptive_walltime = self.inputs.adaptive_walltime.get_dict()
+            if set(adaptive_walltime) - set(self._ADAPTIVE_WALLTIME_DEFAULTS):
+                return self.exit_codes.ERROR_INVALID_INPUT_ADAPTIVE_WALLTIME  # pylint: disable=no-member
+            self.ctx.adaptive_walltime = {**self._ADAPTIVE_WALLTIME_DEFAULTS, **adaptive_walltime}
+            if self.ctx.adaptive_walltime['max_wallclock_seconds'] is None:
+                self.ctx.adaptive_walltime['max_wallclock_seconds'] = self.ctx.inputs.metadata.options.get(
+                    'max_wallclock_seconds', None
+                )
+
+        if 'automatic_parallelization' in self.inputs:
+            automatic_parallelization = self.inputs.automatic_parallelization.get_dict()
+            valid_keys = set(self._AUTOMATIC_PARALLELIZATION_DEFAULTS) | {'max_ncpus'}
+            if 'max_ncpus' not in automatic_parallelization or set(automatic_parallelization) - valid_keys:
+                return self.exit_codes.ERROR_INVALID_INPUT_AUTOMATIC_PARALLELIZATION  # pylint: disable=no-member
+            if self.ctx.inputs.metadata.options.get('max_wallclock_seconds', None) is None:
+                return self.exit_codes.ERROR_INVALID_INPUT_RESOURCES_UNDERSPECIFIED  # pylint: disable=no-member
+            self.ctx.automatic_parallelization = {
+                **self._AUTOMATIC_PARALLELIZATION_DEFAULTS,
+                **automatic_parallelization
+            }
+            return None
+
         num_machines = self.ctx.inputs.metadata.options.get('resources', {}).get('num_machines', None)
         max_wallclock_seconds = self.ctx.inputs.metadata.options.get('max_wallclock_seconds', None)
 
         if num_machines is None or max_wallclock_seconds is None:
             return self.exit_codes.ERROR_INVALID_INPUT_RESOURCES_UNDERSPECIFIED  # pylint: disable=no-member
 
+        if 'kpoint_parallelization' in self.inputs and self.inputs.kpoint_parallelization.value:
+            num_cores_per_machine = self.ctx.inputs.code.computer.get_default_mpiprocs_per_machine()
+            if not num_cores_per_machine:
+                return self.exit_codes.ERROR_INVALID_INPUT_KPOINT_PARALLELIZATION  # pylint: disable=no-member
+            resources = plan_kpoint_resources(
+                self.ctx.inputs.structure, self.ctx.inputs.kpoints, self.ctx.inputs.parameters, num_machines,
+                num_cores_per_machine
+            )
+            self.set_resources(resources)
+            self.report(
+                f'distributing the k-points over {resources["num_machines"]} machine(s) with '
+                f'{resources["num_mpiprocs_per_machine"]} MPI processes per machine and '
+                f'{resources["num_cores_per_mpiproc"]} OpenMP threads per MPI process'
+            )
+
+        return None
+
+    def should_run_autoparal(self):
+        """Return whether the parallel configuration should be determined with an `autoparal` calculation."""
+        return 'automatic_parallelization' in self.inputs
+
+    def run_autoparal(self):
+        """Run a serial ABINIT calculation with `autoparal` and `max_ncpus`.
+
+        With `max_ncpus` defined, ABINIT only prints the parallel configurations it proposes for up to `max_ncpus`
+        cores with their parallel efficiency, and then stops.
+        """
+        automatic_parallelization = self.ctx.automatic_parallelization
+
+        inputs = AttributeDict(self.ctx.inputs)
+        inputs.parameters = {
+            **self.ctx.inputs.parameters,
+            'autoparal': automatic_parallelization['autoparal'],
+            'max_ncpus': automatic_parallelization['max_ncpus'],
+        }
+        options = {
+            **self.ctx.inputs.metadata.get('options', {}),
+            'resources': {'num_machines': 1, 'num_mpiprocs_per_machine': 1},
+        }
+        inputs.metadata = {**self.ctx.inputs.metadata, 'options': options, 'call_link_label': 'autoparal'}
+
+        inputs = self._wrap_bare_dict_inputs(AbinitCalculation.spec().inputs, inputs)
+        node = self.submit(AbinitCalculation, **inputs)
+        self.report(f'launching {node.process_label}<{node.pk}> to determine the parallel configuration')
+
+        return ToContext(calculation_autoparal=node)
+
+    def inspect_autoparal(self):
+        """Select the best parallel configuration and set the corresponding parameters and resources."""
+        calculation = self.ctx.calculation_autoparal
+        automatic_parallelization = self.ctx.automatic_parallelization
+
+        if not calculation.is_finished_ok:
+            self.report(f'automatic parallelization calculation<{calculation.pk}> failed')
+            return self.exit_codes.ERROR_SUB_PROCESS_FAILED_AUTOMATIC_PARALLELIZATION  # pylint: disable=no-member
+
+        configurations = calculation.outputs.output_parameters['autoparal']['configurations']
+        configuration = select_autoparal_configuration(
+            configurations, automatic_parallelization['max_ncpus'], automatic_parallelization['min_efficiency']
+        )
+        if configuration is None:
+            max_ncpus = automatic_parallelization['max_ncpus']
+            self.report(f'no parallel configuration proposed for at most {max_ncpus} cores')
+            return self.exit_codes.ERROR_SUB_PROCESS_FAILED_AUTOMATIC_PARALLELIZATION  # pylint: disable=no-member
+
+        num_mpiprocs_per_machine = automatic_parallelization['num_mpiprocs_per_machine']
+        if num_mpiprocs_per_machine is None:
+            computer = self.ctx.inputs.code.computer
+            num_mpiprocs_per_machine = computer.get_default_mpiprocs_per_machine() or configuration['mpi_ncpus']
+
+        resources = get_autoparal_resources(configuration, num_mpiprocs_per_machine)
+        self.set_resources(resources)
+        self.ctx.inputs.parameters.update(configuration.get('vars', {}))
+
+        self.report(
+            f'selected parallel configuration with {configuration["mpi_ncpus"]} MPI processes and '
+            f'{resources["num_cores_per_mpiproc"]} OpenMP threads, efficiency {configuration["efficiency"]}: '
+            f'{configuration.get("vars", {})}'
+        )
+
+    def set_resources(self, resources):
+        """Set the `resources` of the calculation, with the `OMP_NUM_THREADS` for more than one core per MPI process.
+
+        :param resources: resources dictionary with `num_machines`, `num_mpiprocs_per_machine` and
+            `num_cores_per_mpiproc`
+        """
+        options = {**self.ctx.inputs.metadata.get('options', {}), 'resources': resources}
+        if resources['num_cores_per_mpiproc'] > 1:
+            environment_variables = {**options.get('environment_variables', {})}
+            environment_variables['OMP_NUM_THREADS'] = str(resources['num_cores_per_mpiproc'])
+            options['environment_variables'] = environment_variables
+        self.ctx.inputs.metadata = AttributeDict({**self.ctx.inputs.metadata, 'options': AttributeDict(options)})
+
     def prepare_process(self):
         """Prepare the inputs for the next calculation.
 
-        If a `restart_calc` has been set in the context, its `remote_folder` will be used as the `parent_folder` input
-        for the next calculation and the `restart_mode` is set to `restart`. Otherwise, no `parent_folder` is used and
-        `restart_mode` is set to `from_scratch`.
+        If a `restart_calc` has been set in the context, its `remote_folder` will be used as the `parent_calc_folder`
+        input for the next calculation and the `restart_mode` is set to `restart`. Otherwise, no `parent_calc_folder` is
+        used and `restart_mode` is set to `from_scratch`. The `parent_calc_folder` and `PARENT_RESTART_FILES` of a
+        previous restart are then removed, while those given as inputs are kept for the first calculation.
         """
         if self.ctx.restart_calc:
             self.ctx.inputs.parameters['restartxf'] = -2
-            self.ctx.inputs.parent_folder = self.ctx.restart_calc.outputs.remote_folder
+            self.ctx.inputs.parent_calc_folder = self.ctx.restart_calc.outputs.remote_folder
         else:
             # Explicitly set that this is not a restart; makes querying easier
             self.ctx.inputs.parameters['restartxf'] = 0
+            if self.ctx.iteration > 0:
+                self.ctx.inputs.pop('parent_calc_folder', None)
+                self.ctx.inputs.settings = {
+                    key: value
+                    for key, value in self.ctx.inputs.settings.items()
+                    if key.upper() != 'PARENT_RESTART_FILES'
+                }
+
+        if 'adaptive_walltime' in self.inputs and self.ctx.children:
+            self.set_adaptive_walltime()
+
+    def set_adaptive_walltime(self):
+        """Set the walltime of the next calculation from the wall time of the steps of the previous calculations.
+
+        The wall time of the SCF iterations and ionic steps is taken from the `output_parameters` of the previous
+        calculations. A calculation that ran out of walltime without reporting its wall time is assumed to have used up
+        its `--timelimit`. The walltime is left unchanged if it cannot be estimated.
+        """
+        timings = []
+        for calculation in self.ctx.children:
+            if 'output_parameters' not in calculation.outputs:
+                continue
+            timing = calculation.outputs.output_parameters.get_dict()
+            out_of_walltime = calculation.exit_status == AbinitCalculation.exit_codes.ERROR_OUT_OF_WALLTIME.status
+            if timing.get('wall_time', None) is None and out_of_walltime:
+                settings = calculation.inputs.settings.get_dict() if 'settings' in calculation.inputs else {}
+                settings = uppercase_dict(settings)
+                timing['wall_time'] = get_timelimit_seconds(
+                    calculation.get_option('max_wallclock_seconds'), settings.get('TIMELIMIT_MARGIN', None)
+                )
+            timings.append(timing)
+
+        scf_iteration_cost, ionic_step_cost = estimate_step_costs(timings)
+        wallclock_seconds = estimate_wallclock_seconds(
+            self.ctx.inputs.parameters,
+            scf_iteration_cost,
+            ionic_step_cost,
+            margin=uppercase_dict(self.ctx.inputs.settings).get('TIMELIMIT_MARGIN', None),
+            **self.ctx.adaptive_walltime
+        )
+        if wallclock_seconds is None:
+            return
+
+        options = {**self.ctx.inputs.metadata.get('options', {}), 'max_wallclock_seconds': wallclock_seconds}
+        self.ctx.inputs.metadata = AttributeDict({**self.ctx.inputs.metadata, 'options': AttributeDict(options)})
+        self.report(f'setting the walltime of the next calculation to {wallclock_seconds} seconds')
+
+    def results(self):
+        """Attach the outputs of the last calculation, with the trajectories of the calculations it continues stitched.
+
+        The trajectories are only stitched if the work chain succeeds, as the outputs are not attached otherwise.
+        """
+        exit_code = super().results()
+        if exit_code is not None:
+            return exit_code
+
+        calculation = self.ctx.children[self.ctx.iteration - 1]
+        trajectories = self._get_restart_trajectories(calculation)
+        if len(trajectories) > 1:
+            inputs = {f'trajectory_{index}': trajectory for index, trajectory in enumerate(trajectories)}
+            inputs['metadata'] = {'call_link_label': 'stitch_trajectories'}
+            trajectory = stitch_trajectories(**inputs)
+            self.report(f'stitched the trajectories of {len(trajectories)} successive calculations')
+            # The outputs are only linked when the step ends, so this replaces the trajectory of the last calculation
+            self.out('output_trajectory', trajectory)
+
+        return None
+
+    def _get_restart_trajectories(self, calculation):
+        """Return the trajectories of a calculation and of the calculations it continues, in the order they ran.
+
+        A calculation continues the previous child of the work chain if its `parent_calc_folder` is the remote folder
+        of the latter, as set by the restarts of the handlers.
+
+        :param calculation: the last calculation
+        :returns: list of `TrajectoryData`
+        """
+        children = list(self.ctx.children[:self.ctx.children.index(calculation) + 1])
+        trajectories = []
+
+        while children:
+            child = children.pop()
+            if 'output_trajectory' not in child.outputs:
+                break
+            trajectories.insert(0, child.outputs.output_trajectory)
+            if not children or 'parent_calc_folder' not in child.inputs or 'remote_folder' not in children[-1].outputs:
+                break
+            if child.inputs.parent_calc_folder.pk != children[-1].outputs.remote_folder.pk:
+                break
+
+        return trajectories
+
+    @staticmethod
+    def _get_new_ionic_steps(calculation):
+        """Return the number of ionic steps done by a calculation that were not done by the calculation it continues.
+
+        The steps are counted from the `num_ionic_steps` of the `output_parameters`, which, unlike the number of steps
+        of the `output_trajectory`, does not depend on the steps selected by the parser options. A calculation that
+        continues from the HIST file of its parent first recomputes the last step of the latter, which is not counted.
+
+        :param calculation: the calculation
+        :returns: the number of new ionic steps, or `None` if the `output_parameters` do not report the ionic steps
+        """
+        if 'output_parameters' not in calculation.outputs:
+            return None
+
+        num_steps = calculation.outputs.output_parameters.get('num_ionic_steps', None)
+        if num_steps is None:
+            return None
+
+        settings = uppercase_dict(calculation.inputs.settings.get_dict()) if 'settings' in calculation.inputs else {}
+        if 'parent_calc_folder' in calculation.inputs and 'HIST' in settings.get('PARENT_RESTART_FILES', []):
+            num_steps -= 1
+
+        return max(num_steps, 0)
 
     def report_error_handled(self, calculation, action):
         """Report an action taken for a calculation that has failed.
@@ -160,14 +458,144 @@ class AbinitBaseWorkChain(BaseRestartWorkChain):
         AbinitCalculation.exit_codes.ERROR_OUT_OF_WALLTIME,
         ])
     def handle_out_of_walltime(self, calculation):
-        """Handle `ERROR_OUT_OF_WALLTIME` exit code: calculation shut down neatly and we can simply restart."""
-        try:
-            self.ctx.inputs.structure = calculation.outputs.output_structure
-        except exceptions.NotExistent:
+        """Handle `ERROR_OUT_OF_WALLTIME` exit code: continue from the last geometry and wavefunctions.
+
+        The calculation shut down neatly, so the next one reads its wavefunctions, if they were written, and for a
+        relaxation its HIST file, from whose last geometry it continues with `restartxf = -2`. The ionic steps done by
+        the calculation are subtracted from `ntime`, and the trajectories of the successive calculations are stitched in
+        the `output_trajectory` by `results`.
+        """
+        parameters = calculation.inputs.parameters.get_dict()
+
+        restart_files = []
+        if parameters.get('ionmov', 0) > 0:
+            restart_files.append('HIST')
+        if parameters.get('prtwf', 1) != 0:
+            restart_files.append('WFK')
+
+        if not restart_files:
+            self.ctx.restart_calc = None
+            self.report_error_handled(calculation, 'out of walltime: no restart files, so restarting from scratch')
+            return ProcessHandlerReport(True)
+
+        self.ctx.restart_calc = calculation
+        self.ctx.inputs.settings = {**uppercase_dict(self.ctx.inputs.settings), 'PARENT_RESTART_FILES': restart_files}
+
+        num_steps = self._get_new_ionic_steps(calculation)
+        if 'ntime' in parameters and num_steps is not None:
+            self.ctx.inputs.parameters['ntime'] = max(parameters['ntime'] - num_steps, 1)
+            self.report(f'{num_steps} ionic steps done, setting `ntime` to {self.ctx.inputs.parameters["ntime"]}')
+
+        self.report_error_handled(
+            calculation, f'out of walltime: restart from the {" and ".join(restart_files)} of the last calculation'
+        )
+        return ProcessHandlerReport(True)
+
+    def _apply_scf_restart_strategy(self, calculation, index, restart_files):
+        """Apply a strategy of `_SCF_RESTART_STRATEGIES` to the inputs of the next calculation and record it.
+
+        :param calculation: the failed calculation
+        :param index: index of the strategy
+        :param restart_files: the `PARENT_RESTART_FILES` of the failed calculation read by the next one, if any
+        :returns: the changes of the input parameters
+        """
+        parameters = self.ctx.inputs.parameters
+        strategy = self._SCF_RESTART_STRATEGIES[index]
+
+        defaults = dict(self._SCF_DEFAULTS)
+        if any(isinstance(pseudo, JthXmlData) for pseudo in self.ctx.inputs.pseudos.values()):
+            defaults['diemix'] = 0.7
+
+        changes = {}
+        for key in ('nstep', 'diemix'):
+            if key in strategy:
+                value = parameters.get(key, defaults[key]) * strategy[key]
+                changes[key] = int(round(value)) if key == 'nstep' else round(value, 4)
+        changes.update(strategy.get('parameters', {}))
+        parameters.update(changes)
+
+        if restart_files:
             self.ctx.restart_calc = calculation
-            self.report_error_handled(calculation, 'restart from the last calculation')
+            self.ctx.inputs.settings = {
+                **uppercase_dict(self.ctx.inputs.settings), 'PARENT_RESTART_FILES': restart_files
+            }
         else:
             self.ctx.restart_calc = None
-            self.report_error_handled(calculation, 'out of walltime: structure changed, so restarting from scratch')
+
+        self.ctx.scf_restarts.append({
+            'calculation': calculation.pk,
+            'strategy': index,
+            'changes': changes,
+            'restart_files': restart_files
+        })
+
+        return changes
+
+    def _get_next_scf_restart_strategy(self):
+        """Return the index of the strategy of `_SCF_RESTART_STRATEGIES` following the last one applied."""
+        return self.ctx.scf_restarts[-1]['strategy'] + 1 if self.ctx.scf_restarts else 0
+
+    @process_handler(priority=420, exit_codes=[
+        AbinitCalculation.exit_codes.ERROR_SCF_DIVERGED,
+        ])
+    def handle_scf_diverged(self, calculation):
+        """Handle `ERROR_SCF_DIVERGED`: restart with the next SCF strategy that reduces the mixing.
+
+        The monitor stopped the calculation because its SCF cycle diverged or stalled, so its wavefunctions and density
+        are not a good starting point and are not read by the next calculation. A relaxation continues from the last
+        geometry of its HIST file. The strategies that only increase `nstep` are skipped.
+        """
+        strategies = [
+            index for index in range(self._get_next_scf_restart_strategy(), len(self._SCF_RESTART_STRATEGIES))
+            if 'diemix' in self._SCF_RESTART_STRATEGIES[index]
+        ]
+        if not strategies:
+            self.report_error_handled(calculation, 'SCF cycle diverged with all restart strategies: aborting')
+            exit_code = self.exit_codes.ERROR_SCF_CONVERGENCE_NOT_REACHED  # pylint: disable=no-member
+            return ProcessHandlerReport(True, exit_code)
+
+        restart_files = ['HIST'] if calculation.inputs.parameters.get('ionmov', 0) > 0 else []
+        changes = self._apply_scf_restart_strategy(calculation, strategies[0], restart_files)
+
+        action = 'restart from the last geometry' if restart_files else 'restart from scratch'
+        self.report_error_handled(
+            calculation, f'SCF cycle diverged: {action} with strategy {strategies[0] + 1}, changing {changes}'
+        )
+
+        return ProcessHandlerReport(True)
+
+    @process_handler(priority=410, exit_codes=[
+        AbinitCalculation.exit_codes.ERROR_SCF_CONVERGENCE_NOT_REACHED,
+        ])
+    def handle_scf_convergence_not_reached(self, calculation):
+        """Handle `ERROR_SCF_CONVERGENCE_NOT_REACHED`: restart from the wavefunctions with the next SCF strategy.
+
+        The next calculation reads the wavefunctions (`irdwfk`) of the failed one, or its density (`irdden`) if it did
+        not write them, such that the SCF cycle continues from where it stopped rather than from random wavefunctions.
+        The strategies of `_SCF_RESTART_STRATEGIES` are applied in turn, and each attempt is recorded in the context.
+        Packed calculations restart from scratch, as the restart files of their datasets are not staged.
+        """
+        index = self._get_next_scf_restart_strategy()
+        if index >= len(self._SCF_RESTART_STRATEGIES):
+            self.report_error_handled(calculation, 'SCF cycle did not converge with any restart strategy: aborting')
+            exit_code = self.exit_codes.ERROR_SCF_CONVERGENCE_NOT_REACHED  # pylint: disable=no-member
+            return ProcessHandlerReport(True, exit_code)
+
+        restart_files = []
+        if 'DATASETS' not in uppercase_dict(self.ctx.inputs.settings):
+            if calculation.inputs.parameters.get('prtwf', 1) != 0:
+                restart_files = ['WFK']
+            elif calculation.inputs.parameters.get('prtden', 1) != 0:
+                restart_files = ['DEN']
+
+        changes = self._apply_scf_restart_strategy(calculation, index, restart_files)
+
+        if restart_files:
+            action = f'restart from the {" and ".join(restart_files)} of the last calculation'
+        else:
+            action = 'restart from scratch'
+        self.report_error_handled(
+            calculation, f'SCF cycle did not converge: {action} with strategy {index + 1}, changing {changes}'
+        )
 
         return ProcessHandlerReport(True)
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""Abinit WorkChain to converge the plane-wave cutoff and the k-point density."""
+from aiida import orm
+from aiida.common import AttributeDict
+from aiida.engine import ToContext, WorkChain, while_
+
+from aiida_abinit.utils import get_converged_index, get_convergence_summary, get_energy_per_atom, uppercase_dict
+
+from .base import AbinitBaseWorkChain
+
+
+def validate_inputs(inputs, _):
+    """Validate the top level namespace."""
+    if 'ecuts' not in inputs and 'kpoints_distances' not in inputs:
+        return 'Neither the `ecuts` nor the `kpoints_distances` input was specified.'
+
+    for key in ('ecuts', 'kpoints_distances'):
+        if key not in inputs:
+            continue
+        values = inputs[key].get_list()
+        if len(values) < 2 or any(not isinstance(value, (int, float)) or value <= 0 for value in values):
+            return f'The `{key}` input should contain at least two positive numbers.'
+
+    if 'max_concurrent' in inputs and inputs['max_concurrent'].value < 1:
+        return 'The `max_concurrent` input should be a positive integer.'
+
+
+class AbinitConvergenceWorkChain(WorkChain):
+    """Workchain to converge the plane-wave cutoff `ecut` and the k-point density of an `AbinitBaseWorkChain`.
+
+    The candidate values of each parameter are scanned from coarse to fine, first `ecut` and then the k-point density
+    with the converged `ecut`. The candidates are run concurrently, up to `max_concurrent` at a time. A candidate is
+    converged if it agrees with all finer completed ones within the tolerances. As long as some candidates are not
+    submitted yet, this agreement should be confirmed by at least two finer candidates, such that a candidate is not
+    converged merely because the next one happens to agree with it. No more candidates are submitted once one is
+    converged. The candidates submitted after others completed read the density of the finest completed candidate as
+    starting guess of their SCF cycle.
+    """
+
+    # Parameters scanned, in order, with the input of their candidate values and whether finer values are smaller
+    _SCANS = (
+        ('ecut', 'ecuts', False),
+        ('kpoints_distance', 'kpoints_distances', True),
+    )
+
+    @classmethod
+    def define(cls, spec):
+        """Define the process specification."""
+        # yapf: disable
+        super().define(spec)
+        spec.expose_inputs(AbinitBaseWorkChain,
+                           namespace='base',
+                           exclude=('clean_workdir',),
+                           namespace_options={'help': 'Inputs for the `AbinitBaseWorkChain` of each candidate. The '
+                                              '`kpoints` or `kpoints_distance` are used to converge `ecut`, by '
+                                              'default the finest of the `kpoints_distances`.'})
+        spec.input('ecuts',
+                   valid_type=orm.List,
+                   required=False,
+                   help='Candidate values of the plane-wave cutoff `ecut` in Ha.')
+        spec.input('kpoints_distances',
+                   valid_type=orm.List,
+                   required=False,
+                   help='Candidate values of the minimum distance in 1/Å between k-points in reciprocal space, see '
+                        '`create_kpoints_from_distance`.')
+        spec.input('energy_tolerance',
+                   valid_type=orm.Float,
+                   default=lambda: orm.Float(1.0e-3),
+                   help='Maximum difference of the total energy per atom in eV with the finer candidates.')
+        spec.input('force_tolerance',
+                   valid_type=orm.Float,
+                   required=False,
+                   help='Maximum difference of the force components in eV/Å with the finer candidates.')
+        spec.input('stress_tolerance',
+                   valid_type=orm.Float,
+                   required=False,
+                   help='Maximum difference of the stress components in GPa with the finer candidates.')
+        spec.input('max_concurrent',
+                   valid_type=orm.Int,
+                   required=False,
+                   help='Maximum number of candidates run at the same time, by default all candidates of a scan. The '
+                        'coarser candidates are run first, and the finer ones are only submitted if the coarser ones '
+                        'are not converged.')
+        spec.input('clean_workdir',
+                   valid_type=orm.Bool,
+                   default=lambda: orm.Bool(False),
+                   help='If `True`, work directories of all called calculation will be cleaned at the end of the '
+                        'execution.')
+        spec.inputs.validator = validate_inputs
+
+        spec.outline(
+            cls.setup,
+            while_(cls.should_run_scan)(
+                cls.setup_scan,
+                while_(cls.should_run_candidates)(
+                    cls.run_candidates,
+                    cls.inspect_candidates,
+                ),
+                cls.inspect_scan,
+            ),
+            cls.results,
+        )
+
+        spec.output('output_convergence',
+                    valid_type=orm.Dict,
+                    help='The converged values of the parameters and, for each scan, the candidate values and their '
+                         'total energy per atom in eV.')
+        spec.expose_outputs(AbinitBaseWorkChain,
+                            namespace='converged',
+                            namespace_options={'help': 'Outputs of the converged candidate of the last scan.'})
+
+        spec.exit_code(401, 'ERROR_CONVERGENCE_NOT_REACHED',
+            message='None of the candidates of a scan agreed with the finer ones within the tolerances.')
+
+    def setup(self):
+        """Define the scans to run and the converged values in the context."""
+        self.ctx.scans = [
+            (name, key, finer_is_smaller) for name, key, finer_is_smaller in self._SCANS if key in self.inputs
+        ]
+        self.ctx.converged = {}
+        self.ctx.summary = {}
+        self.ctx.completed = {}
+        self.ctx.density_folder = None
+        self.ctx.last_candidate = None
+
+        parameters = self.inputs.base.abinit.parameters.get_dict()
+        self.ctx.reuse_density = parameters.get('prtden', 1) != 0 and parameters.get('ionmov', 0) == 0
+
+    def should_run_scan(self):
+        """Return whether there is a scan left to run."""
+        return len(self.ctx.scans) > 0
+
+    def setup_scan(self):
+        """Sort the candidates of the next scan from coarse to fine."""
+        name, key, finer_is_smaller = self.ctx.scans.pop(0)
+        self.ctx.scan = AttributeDict({
+            'name': name,
+            'candidates': sorted(self.inputs[key].get_list(), reverse=finer_is_smaller),
+            'points': [],
+            'converged': None,
+        })
+        self.report(f'converging `{name}` with the candidates {self.ctx.scan.candidates}')
+
+    def should_run_candidates(self):
+        """Return whether there are candidates left to run in the current scan and none is converged yet."""
+        return self.ctx.scan.converged is None and len(self.ctx.scan.points) < len(self.ctx.scan.candidates)
+
+    def _get_candidate_inputs(self, value):
+        """Return the inputs of the `AbinitBaseWorkChain` of a candidate of the current scan.
+
+        The values converged by the previous scans are used, and if a density is available from a completed candidate,
+        it is read as starting guess of the SCF cycle.
+
+        :param value: the value of the scanned parameter
+        :returns: the inputs
+        """
+        inputs = AttributeDict(self.exposed_inputs(AbinitBaseWorkChain, namespace='base'))
+        inputs.abinit = AttributeDict(inputs.abinit)
+        parameters = inputs.abinit.parameters.get_dict()
+
+        values = {**self.ctx.converged, self.ctx.scan.name: value}
+
+        if 'ecut' in values:
+            parameters['ecut'] = values['ecut']
+            # The cutoff of the double grid of PAW calculations should not be lower than `ecut`
+            if 'pawecutdg' in parameters:
+                parameters['pawecutdg'] = max(parameters['pawecutdg'], values['ecut'])
+
+        if 'kpoints_distance' in values:
+            inputs.pop('kpoints', None)
+            inputs.kpoints_distance = orm.Float(values['kpoints_distance'])
+        elif 'kpoints' not in inputs and 'kpoints_distance' not in inputs and 'kpoints_distances' in self.inputs:
+            inputs.kpoints_distance = orm.Float(min(self.inputs.kpoints_distances.get_list()))
+
+        if self.ctx.density_folder is not None:
+            settings = uppercase_dict(inputs.abinit.settings.get_dict()) if 'settings' in inputs.abinit else {}
+            inputs.abinit.settings = orm.Dict(dict={**settings, 'PARENT_RESTART_FILES': ['DEN']})
+            inputs.abinit.parent_calc_folder = self.ctx.density_folder
+
+        inputs.abinit.parameters = orm.Dict(dict=parameters)
+
+        return inputs
+
+    def run_candidates(self):
+        """Submit the next candidates of the current scan, up to `max_concurrent` at the same time."""
+        values = self.ctx.scan.candidates
+        start = len(self.ctx.scan.points)
+        stop = len(values) if 'max_concurrent' not in self.inputs else start + self.inputs.max_concurrent.value
+
+        running = {}
+        for index, value in enumerate(values[start:stop], start=start):
+            inputs = self._get_candidate_inputs(value)
+            label = f'{self.ctx.scan.name}_{index}'
+            inputs.metadata.call_link_label = label
+            node = self.submit(AbinitBaseWorkChain, **inputs)
+            self.ctx.scan.points.append({
+                'value': value,
+                'label': label,
+                'pk': node.pk,
+                'energy': None,
+                'inspected': False
+            })
+            running[label] = node
+            self.report(f'launching {node.process_label}<{node.pk}> with `{self.ctx.scan.name}` = {value}')
+
+        return ToContext(**running)
+
+    def inspect_candidates(self):
+        """Read the results of the completed candidates and check whether one of them is converged."""
+        results = []
+
+        for point in self.ctx.scan.points:
+            node = orm.load_node(point['pk'])
+            if not node.is_finished_ok:
+                if not point['inspected']:
+                    self.report(f'{node.process_label}<{node.pk}> failed with exit status {node.exit_status}')
+                point['inspected'] = True
+                results.append(None)
+                continue
+
+            point['inspected'] = True
+            self.ctx.completed[point['label']] = node.pk
+            # The calculation can run with fewer atoms than the input structure, e.g. in the primitive cell
+            point['energy'] = get_energy_per_atom(node.outputs.output_parameters, node.outputs.output_structure)
+            result = {'energy': point['energy']}
+            if 'output_arrays' in node.outputs:
+                arraynames = node.outputs.output_arrays.get_arraynames()
+                for key, arrayname in (('forces', 'cart_forces'), ('stress', 'cart_stress_tensor')):
+                    if arrayname in arraynames:
+                        result[key] = node.outputs.output_arrays.get_array(arrayname)
+            results.append(result)
+
+            # The density of the finest completed candidate is the best starting guess for the next ones
+            if self.ctx.reuse_density and 'remote_folder' in node.outputs:
+                self.ctx.density_folder = node.outputs.remote_folder
+
+        # While finer candidates can still be submitted, an agreement with a single finer candidate is not conclusive
+        num_finer = 2 if len(self.ctx.scan.points) < len(self.ctx.scan.candidates) else 1
+        self.ctx.scan.converged = get_converged_index(
+            results,
+            self.inputs.energy_tolerance.value,
+            self.inputs.force_tolerance.value if 'force_tolerance' in self.inputs else None,
+            self.inputs.stress_tolerance.value if 'stress_tolerance' in self.inputs else None,
+            num_finer=num_finer,
+        )
+
+    def inspect_scan(self):
+        """Set the converged value of the current scan, used by the next scans."""
+        scan = self.ctx.scan
+        self.ctx.summary[scan.name] = {
+            'values': [point['value'] for point in scan.points],
+            'labels': [point['label'] if point['label'] in self.ctx.completed else None for point in scan.points],
+            'converged': None if scan.converged is None else scan.points[scan.converged]['value'],
+        }
+
+        if scan.converged is None:
+            self.report(f'none of the candidates of `{scan.name}` is converged')
+            return self.exit_codes.ERROR_CONVERGENCE_NOT_REACHED  # pylint: disable=no-member
+
+        point = scan.points[scan.converged]
+        self.ctx.converged[scan.name] = point['value']
+        self.ctx.last_candidate = point['pk']
+        self.report(f"`{scan.name}` converged at {point['value']}")
+
+    def results(self):
+        """Attach the converged values and the outputs of the converged candidate of the last scan."""
+        candidates = {}
+        for scan in self.ctx.summary.values():
+            for label in filter(None, scan['labels']):
+                outputs = orm.load_node(self.ctx.completed[label]).outputs
+                candidates[f'{label}_parameters'] = outputs.output_parameters
+                candidates[f'{label}_structure'] = outputs.output_structure
+
+        summary = get_convergence_summary(
+            scans=orm.Dict(dict=self.ctx.summary),
+            **candidates,
+            metadata={'call_link_label': 'get_convergence_summary'},
+        )
+        self.out('output_convergence', summary)
+        self.out_many(
+            self.exposed_outputs(orm.load_node(self.ctx.last_candidate), AbinitBaseWorkChain, namespace='converged')
+        )
+
+    def on_terminated(self):
+        """Clean the working directories of all child calculations if `clean_workdir=True` in the inputs."""
+        super().on_terminated()
+
+        if self.inputs.clean_workdir.value is False:
+            self.report('remote folders will not be cleaned')
+            return
+
+        cleaned_calcs = []
+
+        for called_descendant in self.node.called_descendants:
+            if isinstance(called_descendant, orm.CalcJobNode):
+                try:
+                    called_descendant.outputs.remote_folder._clean()  # pylint: disable=protected-access
+                    cleaned_calcs.append(str(called_descendant.pk))
+                except (IOError, OSError, KeyError):
+                    pass
+
+        if cleaned_calcs:
+            self.report(f"cleaned remote folders of calculations: {' '.join(cleaned_calcs)}")
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,redefined-outer-name
+"""Benchmarks of the wall time and peak memory of the `AbinitParser` on synthetic output files of increasing size.
+
+The benchmarks only run with the `--run-benchmarks` option of `pytest`, and are compared with the baselines stored in
+`baselines.json`. Run them with `--update-baselines` to store the results as the new baselines instead.
+"""
+import json
+import os
+import time
+import tracemalloc
+import warnings
+
+import pytest
+
+from aiida_abinit.parsers import AbinitParser
+from aiida_abinit.utils import get_parser_options
+
+BASELINES_FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+# Wall times depend on the machine, so only large slowdowns are reported
+WALL_TIME_TOLERANCE = 3.0
+PEAK_MEMORY_TOLERANCE = 1.5
+
+CASES = {
+    'small': {'natom': 2, 'nkpt': 4, 'nband': 8, 'nsteps': 10, 'nevents': 10},
+    'medium': {'natom': 64, 'nkpt': 200, 'nband': 200, 'nsteps': 200, 'nevents': 1000},
+    'large': {'natom': 256, 'nkpt': 1000, 'nband': 800, 'nsteps': 2000, 'nevents': 10000},
+}
+
+PHASES = ('parse_stdout', 'parse_gsr', 'parse_trajectory', 'parse')
+
+
+def generate_output(nevents, nlines_per_event=20):
+    """Return the content of an ABINIT output file with `nevents` comments, each preceded by `nlines_per_event`."""
+    lines = [' ABINIT 9.6.2', '']
+    for index in range(nevents):
+        lines.extend(f' ETOT {index:4d}  -8.5000000000000  -1.000E-08 1.000E-10' for _ in range(nlines_per_event))
+        lines.extend(['--- !COMMENT', 'src_line: 1', 'message: |', f'    Comment {index}', '...'])
+    lines.extend([
+        '--- !FinalSummary', 'program: abinit', 'version: 9.6.2', 'num_warnings: 0', f'num_comments: {nevents}', '...'
+    ])
+    return '\n'.join(lines) + '\n'
+
+
+def measure(function, repeat=3):
+    """Return the minimum wall time over `repeat` calls of `function` and the peak memory traced during one call.
+
+    :returns: dictionary with the `wall_time` in seconds and the `peak_memory` in bytes
+    """
+    wall_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        wall_times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'wall_time': min(wall_times), 'peak_memory': peak_memory}
+
+
+@pytest.fixture(scope='module')
+def baselines(request):
+    """Return a function that compares the result of a benchmark with its baseline, or records it as baseline."""
+    update = request.config.getoption('--update-baselines')
+
+    try:
+        with open(BASELINES_FILEPATH, 'r', encoding='utf-8') as handle:
+            stored = json.load(handle)
+    except FileNotFoundError:
+        stored = {}
+
+    def _compare(case, phase, result):
+        if update:
+            stored.setdefault(case, {})[phase] = dict(result, wall_time=round(result['wall_time'], 4))
+            return
+
+        baseline = stored.get(case, {}).get(phase, None)
+        if baseline is None:
+            warnings.warn(f'no baseline for `{case}:{phase}`, run with `--update-baselines` to store one')
+            return
+
+        assert result['wall_time'] <= baseline['wall_time'] * WALL_TIME_TOLERANCE, (case, phase, result, baseline)
+        assert result['peak_memory'] <= baseline['peak_memory'] * PEAK_MEMORY_TOLERANCE, (case, phase, result, baseline)
+
+    yield _compare
+
+    if update:
+        with open(BASELINES_FILEPATH, 'w', encoding='utf-8') as handle:
+            json.dump(stored, handle, indent=4, sort_keys=True)
+            handle.write('\n')
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('case', CASES)
+def test_parser_benchmark(  # pylint: disable=too-many-arguments
+    tmp_path, generate_abinit_calc_job_node, generate_gsr_file, generate_hist_file, baselines, case
+):
+    """Measure the wall time and peak memory of each phase of the parser and of the complete `parse`."""
+    sizes = CASES[case]
+    gsr = {'natom': sizes['natom'], 'nkpt': sizes['nkpt'], 'nband': sizes['nband']}
+    hist = {'natom': sizes['natom'], 'nsteps': sizes['nsteps']}
+    output = generate_output(sizes['nevents'])
+
+    node = generate_abinit_calc_job_node(parameters={'ecut': 8.0, 'ionmov': 2}, output=output, gsr=gsr, hist=hist)
+    gsr_filepath = generate_gsr_file(str(tmp_path / 'aiidao_GSR.nc'), **gsr)
+    hist_filepath = generate_hist_file(str(tmp_path / 'aiidao_HIST.nc'), **hist)
+    parser_options = get_parser_options()
+
+    functions = {
+        'parse_stdout': lambda: AbinitParser(node)._parse_stdout(
+            'aiida.out', str(tmp_path), error_on_warning=False, report_comments=True, summary={}
+        ),
+        'parse_gsr': lambda: AbinitParser(node)._parse_gsr(gsr_filepath, True, parser_options),
+        'parse_trajectory': lambda: AbinitParser(node)._parse_trajectory(hist_filepath),
+        'parse': lambda: AbinitParser(node).parse(),
+    }
+
+    assert AbinitParser(node).parse().status == 0
+
+    for phase in PHASES:
+        baselines(case, phase, measure(functions[phase]))
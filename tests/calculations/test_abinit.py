@@ -3,7 +3,7 @@
 import pytest
 
 from aiida import orm
-from aiida.common import datastructures
+from aiida.common import datastructures, exceptions
 
 
 def test_abinit_default(fixture_sandbox, generate_calc_job, generate_inputs_abinit, file_regression):
@@ -14,7 +14,7 @@ def test_abinit_default(fixture_sandbox, generate_calc_job, generate_inputs_abin
     calc_info = generate_calc_job(fixture_sandbox, entry_point_name, inputs)
     psp8 = inputs['pseudos']['Si']
 
-    cmdline_params = ['aiida.in', '--timelimit', '30:00']
+    cmdline_params = ['aiida.in', '--timelimit', '28:30']
     local_copy_list = [(psp8.uuid, psp8.filename, './pseudo/Si.psp8')]
     retrieve_list = ['aiida.out', 'aiidao_GSR.nc']
 
@@ -64,12 +64,68 @@ def test_abinit_retrieve(
     file_regression.check(input_written, encoding='utf-8', extension='.in')
 
 
+# yapf: disable
+@pytest.mark.parametrize(
+    'netcdf_retrieval,retrieve_list,retrieve_temporary_list',
+    [('keep', ['aiida.out', 'aiidao_GSR.nc', 'aiidao_HIST.nc'], []),
+     ('temporary', ['aiida.out'], ['aiidao_GSR.nc', 'aiidao_HIST.nc']),
+     ('none', ['aiida.out'], [])]
+)
+# yapf: enable
+def test_abinit_netcdf_retrieval(
+    fixture_sandbox, generate_calc_job, generate_inputs_abinit, netcdf_retrieval, retrieve_list,
+    retrieve_temporary_list
+):
+    """Test the `NETCDF_RETRIEVAL` setting of `AbinitCalculation`."""
+    inputs = generate_inputs_abinit()
+    inputs['parameters']['ionmov'] = 2
+    inputs['settings'] = orm.Dict(dict={'netcdf_retrieval': netcdf_retrieval})
+    calc_info = generate_calc_job(fixture_sandbox, 'abinit', inputs)
+
+    assert sorted(calc_info.retrieve_list) == sorted(retrieve_list)
+    assert sorted(calc_info.retrieve_temporary_list) == sorted(retrieve_temporary_list)
+
+
+def test_abinit_netcdf_retrieval_invalid(fixture_sandbox, generate_calc_job, generate_inputs_abinit):
+    """Test that an unknown `NETCDF_RETRIEVAL` setting raises."""
+    inputs = generate_inputs_abinit()
+    inputs['settings'] = orm.Dict(dict={'NETCDF_RETRIEVAL': 'discard'})
+
+    with pytest.raises(exceptions.InputValidationError):
+        generate_calc_job(fixture_sandbox, 'abinit', inputs)
+
+
+@pytest.mark.parametrize('parser_options', [{'parse_band': False}, {'bands_dtype': 'float16'}, {'parse_bands': 0}])
+def test_abinit_parser_options_invalid(fixture_sandbox, generate_calc_job, generate_inputs_abinit, parser_options):
+    """Test that invalid parser options raise before the calculation is run."""
+    inputs = generate_inputs_abinit()
+    inputs['settings'] = orm.Dict(dict={'parser_options': parser_options})
+
+    with pytest.raises(exceptions.InputValidationError):
+        generate_calc_job(fixture_sandbox, 'abinit', inputs)
+
+
+def test_abinit_profiling(fixture_sandbox, generate_calc_job, generate_inputs_abinit):
+    """Test that the phases of `prepare_for_submission` are stored in the extras if the profiling is enabled."""
+    from aiida_abinit.utils import PROFILING_EXTRA
+
+    inputs = generate_inputs_abinit()
+    inputs['settings'] = orm.Dict(dict={'profiling': {'trace_memory': False}})
+    generate_calc_job(fixture_sandbox, 'abinit', inputs)
+
+    node = orm.QueryBuilder().append(orm.CalcJobNode, tag='calc').order_by({'calc': {'id': 'desc'}}).first()[0]
+    phases = node.base.extras.get(PROFILING_EXTRA)['prepare_for_submission']
+
+    assert {'total', 'validate_inputs', 'generate_inputdata', 'generate_retrieve_list'}.issubset(phases)
+    assert phases['total']['peak_memory'] == 0
+
+
 # yapf: disable
 @pytest.mark.parametrize(
     'settings,cmdline_params',
-    [({'DrY_rUn': True, 'verbose': False}, ['aiida.in', '--timelimit', '30:00', '--dry-run']),
-     ({'dry_run': True, 'verbose': True}, ['aiida.in', '--timelimit', '30:00', '--verbose', '--dry-run']),
-     ({'DRY_RUN': False, 'verbose': True}, ['aiida.in', '--timelimit', '30:00', '--verbose'])]
+    [({'DrY_rUn': True, 'verbose': False}, ['aiida.in', '--timelimit', '28:30', '--dry-run']),
+     ({'dry_run': True, 'verbose': True}, ['aiida.in', '--timelimit', '28:30', '--verbose', '--dry-run']),
+     ({'DRY_RUN': False, 'verbose': True}, ['aiida.in', '--timelimit', '28:30', '--verbose'])]
 )
 # yapf: enable
 def test_abinit_cmdline_params(fixture_sandbox, generate_calc_job, generate_inputs_abinit, settings, cmdline_params):
@@ -81,3 +137,194 @@ def test_abinit_cmdline_params(fixture_sandbox, generate_calc_job, generate_inpu
     calc_info = generate_calc_job(fixture_sandbox, entry_point_name, inputs)
 
     assert calc_info.codes_info[0].cmdline_params == cmdline_params
+
+
+@pytest.mark.parametrize(
+    'timelimit_margin,timelimit', [({'seconds': 0, 'fraction': 0}, '30:00'), ({'seconds': 300}, '25:00'), ({}, '28:30')]
+)
+def test_abinit_timelimit_margin(
+    fixture_sandbox, generate_calc_job, generate_inputs_abinit, timelimit_margin, timelimit
+):
+    """Test that the `--timelimit` leaves the margin of the `TIMELIMIT_MARGIN` setting before the walltime."""
+    inputs = generate_inputs_abinit()
+    inputs['settings'] = orm.Dict(dict={'timelimit_margin': timelimit_margin})
+    calc_info = generate_calc_job(fixture_sandbox, 'abinit', inputs)
+
+    assert calc_info.codes_info[0].cmdline_params == ['aiida.in', '--timelimit', timelimit]
+
+
+@pytest.mark.parametrize('ionmov', [0, 2])
+@pytest.mark.parametrize('explicit_kpoints', [False, True])
+def test_abinit_native_input_writer(
+    fixture_sandbox, generate_calc_job, generate_inputs_abinit, ionmov, explicit_kpoints
+):
+    """Test that the native input writer produces the same input file as `AbinitInput`."""
+    entry_point_name = 'abinit'
+
+    inputs_written = []
+
+    for native_writer in [False, True]:
+        inputs = generate_inputs_abinit()
+        inputs['parameters']['ionmov'] = ionmov
+        inputs['parameters']['shiftk'] = [[0.5, 0.5, 0.5]]
+        inputs['settings'] = orm.Dict(dict={'NATIVE_INPUT_WRITER': native_writer})
+        if explicit_kpoints:
+            inputs['kpoints'] = orm.KpointsData()
+            inputs['kpoints'].set_kpoints([[0.0, 0.0, 0.0], [0.25, 1e-4, 0.5], [0.5, 0.5, 0.0], [0.0, -0.75, 0.25]])
+        generate_calc_job(fixture_sandbox, entry_point_name, inputs)
+
+        with fixture_sandbox.open('aiida.in') as handle:
+            inputs_written.append(handle.read())
+
+    assert inputs_written[0] == inputs_written[1]
+
+
+def test_abinit_native_input_writer_regression(
+    fixture_sandbox, generate_calc_job, generate_inputs_abinit, file_regression
+):
+    """Test that the native input writer reproduces the reference input file of `test_abinit_default`."""
+    entry_point_name = 'abinit'
+
+    inputs = generate_inputs_abinit()
+    inputs['settings'] = orm.Dict(dict={'NATIVE_INPUT_WRITER': True})
+    generate_calc_job(fixture_sandbox, entry_point_name, inputs)
+
+    with fixture_sandbox.open('aiida.in') as handle:
+        input_written = handle.read()
+
+    file_regression.check(input_written, encoding='utf-8', extension='.in', basename='test_abinit_default')
+
+
+def test_abinit_datasets(
+    fixture_sandbox, generate_calc_job, generate_inputs_abinit, generate_structure, file_regression
+):
+    """Test a packed `AbinitCalculation` with several datasets."""
+    entry_point_name = 'abinit'
+
+    structure = generate_structure()
+    strained = generate_structure()
+    strained.reset_cell([[1.02 * value for value in vector] for vector in structure.cell])
+    strained.reset_sites_positions([[1.02 * value for value in site.position] for site in structure.sites])
+
+    inputs = generate_inputs_abinit()
+    inputs['settings'] = orm.Dict(dict={'DATASETS': [{'ecut': 10.0}, {'ecut': 20.0}, {'ecut': 20.0, 'nstep': 30}]})
+    inputs['dataset_structures'] = {'ds3': strained}
+    calc_info = generate_calc_job(fixture_sandbox, entry_point_name, inputs)
+
+    retrieve_list = ['aiida.out', 'aiidao_DS1_GSR.nc', 'aiidao_DS2_GSR.nc', 'aiidao_DS3_GSR.nc']
+    assert sorted(calc_info.retrieve_list) == sorted(retrieve_list)
+
+    with fixture_sandbox.open('aiida.in') as handle:
+        input_written = handle.read()
+
+    file_regression.check(input_written, encoding='utf-8', extension='.in')
+
+
+@pytest.mark.parametrize('datasets', [[], [{'ecut': 10.0}, {'natom': 3}], [{'ecut': 10.0, 'ndtset': 2}]])
+def test_abinit_datasets_invalid(fixture_sandbox, generate_calc_job, generate_inputs_abinit, datasets):
+    """Test that invalid `DATASETS` settings raise an `InputValidationError`."""
+    inputs = generate_inputs_abinit()
+    inputs['settings'] = orm.Dict(dict={'DATASETS': datasets})
+
+    with pytest.raises(exceptions.InputValidationError):
+        generate_calc_job(fixture_sandbox, 'abinit', inputs)
+
+
+def test_abinit_pseudo_remote_cache(fixture_sandbox, generate_calc_job, generate_inputs_abinit, tmp_path):
+    """Test an `AbinitCalculation` symlinking its pseudopotentials staged in a remote cache directory."""
+    from aiida_abinit.utils import stage_pseudos_remote
+
+    entry_point_name = 'abinit'
+    dirpath = str(tmp_path / 'pseudos')
+
+    inputs = generate_inputs_abinit()
+    inputs['settings'] = orm.Dict(dict={'PSEUDO_REMOTE_CACHE': dirpath})
+    psp8 = inputs['pseudos']['Si']
+    remote_path = tmp_path / 'pseudos' / psp8.md5 / psp8.filename
+
+    # Pseudopotentials that are not staged are copied, without opening a transport to stage them
+    calc_info = generate_calc_job(fixture_sandbox, entry_point_name, inputs)
+    assert calc_info.local_copy_list == [(psp8.uuid, psp8.filename, './pseudo/Si.psp8')]
+    assert calc_info.remote_symlink_list == []
+    assert not remote_path.exists()
+
+    stage_pseudos_remote([psp8], inputs['code'].computer, dirpath)
+    calc_info = generate_calc_job(fixture_sandbox, entry_point_name, inputs)
+
+    assert calc_info.local_copy_list == []
+    assert calc_info.remote_symlink_list == [(inputs['code'].computer.uuid, str(remote_path), './pseudo/Si.psp8')]
+
+    with fixture_sandbox.open('aiida.in') as handle:
+        assert 'pp_dirpath "./pseudo/"' in handle.read()
+
+    assert sorted(fixture_sandbox.get_content_list()) == sorted(['aiida.in', 'pseudo'])
+
+
+def test_abinit_pseudo_remote_cache_relative(fixture_sandbox, generate_calc_job, generate_inputs_abinit):
+    """Test that a relative `PSEUDO_REMOTE_CACHE` directory raises an `InputValidationError`."""
+    inputs = generate_inputs_abinit()
+    inputs['settings'] = orm.Dict(dict={'PSEUDO_REMOTE_CACHE': 'pseudos'})
+
+    with pytest.raises(exceptions.InputValidationError):
+        generate_calc_job(fixture_sandbox, 'abinit', inputs)
+
+
+def test_abinit_pseudo_remote_cache_dry_run(fixture_sandbox, generate_calc_job, generate_inputs_abinit, tmp_path):
+    """Test that a dry run copies its pseudopotentials instead of symlinking them from the remote cache directory."""
+    dirpath = tmp_path / 'pseudos'
+
+    inputs = generate_inputs_abinit()
+    inputs['settings'] = orm.Dict(dict={'PSEUDO_REMOTE_CACHE': str(dirpath)})
+    inputs['metadata']['dry_run'] = True
+    calc_info = generate_calc_job(fixture_sandbox, 'abinit', inputs)
+    psp8 = inputs['pseudos']['Si']
+
+    assert calc_info.local_copy_list == [(psp8.uuid, psp8.filename, './pseudo/Si.psp8')]
+    assert calc_info.remote_symlink_list == []
+    assert not dirpath.exists()
+
+
+# yapf: disable
+@pytest.mark.parametrize(
+    'settings,parameters,symlinks,ird_parameters',
+    [({}, {}, [('aiidao_WFK', 'aiidai_WFK')], {'irdwfk': 1}),
+     ({}, {'ionmov': 2}, [('aiidao_WFK', 'aiidai_WFK'), ('aiidao_HIST.nc', 'aiidai_HIST.nc')], {'irdwfk': 1}),
+     ({'PARENT_RESTART_FILES': ['den']}, {'iomode': 3}, [('aiidao_DEN.nc', 'aiidai_DEN.nc')], {'irdden': 1}),
+     ({'PARENT_RESTART_FILES': ['WFK']}, {'getwfk': -1}, [('aiidao_WFK', 'aiidai_WFK')], {}),
+     ({'PARENT_RESTART_FILES': []}, {}, [], {})]
+)
+# yapf: enable
+def test_abinit_restart(
+    fixture_sandbox, generate_calc_job, generate_inputs_abinit, generate_remote_data, fixture_localhost, settings,
+    parameters, symlinks, ird_parameters
+):
+    """Test that only the restart files are staged from the `parent_calc_folder`."""
+    remote_path = '/tmp/parent'
+    inputs = generate_inputs_abinit()
+    inputs['parameters'] = orm.Dict(dict={**inputs['parameters'].get_dict(), **parameters})
+    inputs['settings'] = orm.Dict(dict=settings)
+    inputs['parent_calc_folder'] = generate_remote_data(fixture_localhost, remote_path, 'abinit')
+    calc_info = generate_calc_job(fixture_sandbox, 'abinit', inputs)
+
+    expected = [(fixture_localhost.uuid, f'{remote_path}/{source}', target) for source, target in symlinks]
+    assert sorted(calc_info.remote_symlink_list) == sorted(expected)
+    assert calc_info.remote_copy_list == []
+
+    with fixture_sandbox.open('aiida.in') as handle:
+        input_written = handle.read()
+
+    for name in ['irdwfk', 'irdden']:
+        assert (f' {name} 1\n' in input_written) == (name in ird_parameters)
+
+
+def test_abinit_restart_copy(
+    fixture_sandbox, generate_calc_job, generate_inputs_abinit, generate_remote_data, fixture_localhost
+):
+    """Test that restart files are copied when `PARENT_FOLDER_SYMLINK` is disabled."""
+    inputs = generate_inputs_abinit()
+    inputs['settings'] = orm.Dict(dict={'PARENT_FOLDER_SYMLINK': False})
+    inputs['parent_calc_folder'] = generate_remote_data(fixture_localhost, '/tmp/parent', 'abinit')
+    calc_info = generate_calc_job(fixture_sandbox, 'abinit', inputs)
+
+    assert calc_info.remote_copy_list == [(fixture_localhost.uuid, '/tmp/parent/aiidao_WFK', 'aiidai_WFK')]
+    assert calc_info.remote_symlink_list == []
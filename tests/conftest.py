@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=redefined-outer-name,too-many-statements
 """Initialise a text database and profile for pytest."""
-import collections
+import collections.abc
 import io
 import os
 import pathlib
@@ -13,6 +13,25 @@ import pytest
 pytest_plugins = ['aiida.manage.tests.pytest_fixtures']  # pylint: disable=invalid-name
 
 
+def pytest_addoption(parser):
+    """Add the command line options to run the benchmarks and to update their baselines."""
+    parser.addoption('--run-benchmarks', action='store_true', help='Run the tests marked as `benchmark`.')
+    parser.addoption(
+        '--update-baselines', action='store_true', help='Run the benchmarks and store their results as baselines.'
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip the tests marked as `benchmark` unless the benchmarks are requested."""
+    if config.getoption('--run-benchmarks') or config.getoption('--update-baselines'):
+        return
+
+    skip = pytest.mark.skip(reason='benchmarks only run with `--run-benchmarks`')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
 @pytest.fixture(scope='session')
 def filepath_tests():
     """Return the absolute filepath of the `tests` folder.
@@ -184,7 +203,7 @@ def generate_calc_job_node(fixture_localhost):
         """Flatten inputs recursively like :meth:`aiida.engine.processes.process::Process._flatten_inputs`."""
         flat_inputs = []
         for key, value in inputs.items():
-            if isinstance(value, collections.Mapping):
+            if isinstance(value, collections.abc.Mapping):
                 flat_inputs.extend(flatten_inputs(value, prefix=prefix + key + '__'))
             else:
                 flat_inputs.append((prefix + key, value))
@@ -349,6 +368,242 @@ def generate_kpoints_mesh():
     return _generate_kpoints_mesh
 
 
+@pytest.fixture
+def generate_gsr_file():
+    """Return a function that writes a GSR file of bulk silicon with the variables read by the parser."""
+
+    def _generate_gsr_file(filepath, nkpt=4, nband=8, nsppol=1, natom=2, seed=0):
+        """Write a GSR file of bulk silicon with random eigenvalues, forces, stress and energy terms.
+
+        :param filepath: path of the file to write
+        :param natom: number of atoms, evenly spaced along the diagonal of the cell
+        :param nkpt: number of k-points
+        :param nband: number of bands
+        :param nsppol: number of independent spin polarizations
+        :param seed: seed of the random number generator
+        :returns: the path of the file
+        """
+        import netCDF4
+        import numpy
+
+        from aiida_abinit.parsers import GSR_ENERGY_TERMS
+
+        rng = numpy.random.default_rng(seed)
+
+        with netCDF4.Dataset(filepath, 'w') as dataset:
+            dataset.setncattr('abinit_version', '9.6.2')
+
+            for name, size in (
+                ('number_of_atoms', natom), ('number_of_atom_species', 1), ('number_of_cartesian_directions', 3),
+                ('number_of_reduced_dimensions', 3), ('number_of_vectors', 3), ('number_of_kpoints', nkpt),
+                ('number_of_spins', nsppol), ('number_of_spinor_components', 1), ('number_of_components', nsppol),
+                ('max_number_of_states', nband), ('number_of_symmetry_operations', 1), ('symbol_length', 2),
+                ('character_string_length', 80), ('six', 6), ('nshiftk', 1)
+            ):
+                dataset.createDimension(name, size)
+
+            def create_variable(name, datatype, dimensions, value):
+                dataset.createVariable(name, datatype, dimensions)[...] = value
+
+            bands = ('number_of_spins', 'number_of_kpoints', 'max_number_of_states')
+            occupations = numpy.zeros((nsppol, nkpt, nband))
+            occupations[..., :4] = 2.0 / nsppol
+            if nsppol == 2:
+                occupations[0, :, 4] = 1.0
+
+            create_variable(
+                'primitive_vectors', 'f8', ('number_of_vectors', 'number_of_cartesian_directions'),
+                [[0, 5.13, 5.13], [5.13, 0, 5.13], [5.13, 5.13, 0]]
+            )
+            create_variable(
+                'reduced_atom_positions', 'f8', ('number_of_atoms', 'number_of_reduced_dimensions'),
+                numpy.repeat(numpy.arange(natom)[:, None] / (2 * natom), 3, axis=1)
+            )
+            create_variable('atom_species', 'i4', ('number_of_atoms',), numpy.ones(natom))
+            create_variable('atomic_numbers', 'f8', ('number_of_atom_species',), [14.0])
+            create_variable('chemical_symbols', 'S1', ('number_of_atom_species', 'symbol_length'), [[b'S', b'i']])
+            create_variable(
+                'reduced_symmetry_matrices', 'i4',
+                ('number_of_symmetry_operations', 'number_of_reduced_dimensions', 'number_of_reduced_dimensions'),
+                numpy.eye(3)[None]
+            )
+            create_variable(
+                'reduced_symmetry_translations', 'f8',
+                ('number_of_symmetry_operations', 'number_of_reduced_dimensions'), numpy.zeros((1, 3))
+            )
+            create_variable('symafm', 'i4', ('number_of_symmetry_operations',), [1])
+            create_variable('space_group', 'i4', (), 1)
+            create_variable(
+                'reduced_coordinates_of_kpoints', 'f8', ('number_of_kpoints', 'number_of_reduced_dimensions'),
+                rng.random((nkpt, 3)) - 0.5
+            )
+            create_variable('kpoint_weights', 'f8', ('number_of_kpoints',), numpy.full(nkpt, 1.0 / nkpt))
+            create_variable('kptopt', 'i4', (), 1)
+            create_variable(
+                'kptrlatt', 'i4', ('number_of_reduced_dimensions', 'number_of_reduced_dimensions'), numpy.eye(3) * 2
+            )
+            create_variable('shiftk', 'f8', ('nshiftk', 'number_of_reduced_dimensions'), numpy.zeros((1, 3)))
+            create_variable(
+                'number_of_states', 'i4', ('number_of_spins', 'number_of_kpoints'), numpy.full((nsppol, nkpt), nband)
+            )
+            create_variable('eigenvalues', 'f8', bands, numpy.sort(rng.normal(size=(nsppol, nkpt, nband)), axis=-1))
+            create_variable('occupations', 'f8', bands, occupations)
+            create_variable('fermi_energy', 'f8', (), 0.1)
+            create_variable('number_of_electrons', 'f8', (), 8.0)
+            create_variable('occopt', 'i4', (), 1)
+            create_variable('smearing_scheme', 'S1', ('character_string_length',), list('none'.ljust(80)))
+            create_variable('smearing_width', 'f8', (), 0.01)
+            create_variable('ecut', 'f8', (), 18.0)
+            create_variable('etotal', 'f8', (), -8.5 + rng.normal() * 0.01)
+            create_variable(
+                'cartesian_forces', 'f8', ('number_of_atoms', 'number_of_cartesian_directions'),
+                rng.normal(size=(natom, 3)) * 1e-3
+            )
+            create_variable('cartesian_stress_tensor', 'f8', ('six',), rng.normal(size=6) * 1e-5)
+            for name in GSR_ENERGY_TERMS:
+                create_variable(name, 'f8', (), rng.normal())
+
+        return filepath
+
+    return _generate_gsr_file
+
+
+@pytest.fixture
+def generate_hist_file():
+    """Return a function that writes a HIST file of bulk silicon with the variables read by the parser."""
+
+    def _generate_hist_file(filepath, nsteps=5, natom=2, seed=0):
+        """Write a HIST file of bulk silicon with a cell expanding at every step and random positions and forces.
+
+        :param filepath: path of the file to write
+        :param nsteps: number of steps
+        :param natom: number of atoms
+        :param seed: seed of the random number generator
+        :returns: the path of the file
+        """
+        import netCDF4
+        import numpy
+
+        rng = numpy.random.default_rng(seed)
+        rprimd = numpy.array([[0, 5.13, 5.13], [5.13, 0, 5.13], [5.13, 5.13, 0]])
+
+        with netCDF4.Dataset(filepath, 'w') as dataset:
+            for name, size in (('time', None), ('natom', natom), ('xyz', 3), ('six', 6), ('ntypat', 1), ('npsp', 1)):
+                dataset.createDimension(name, size)
+
+            dataset.createVariable('typat', 'f8', ('natom',))[:] = numpy.ones(natom)
+            dataset.createVariable('znucl', 'f8', ('npsp',))[:] = [14]
+            for name, dimensions in (
+                ('xred', ('time', 'natom', 'xyz')), ('xcart', ('time', 'natom', 'xyz')),
+                ('fcart', ('time', 'natom', 'xyz')), ('rprimd', ('time', 'xyz', 'xyz')), ('strten', ('time', 'six')),
+                ('etotal', ('time',)), ('ekin', ('time',))
+            ):
+                dataset.createVariable(name, 'f8', dimensions)
+
+            for step in range(nsteps):
+                cell = rprimd * (1 + 0.01 * step)
+                positions = rng.random((natom, 3))
+                dataset['rprimd'][step] = cell
+                dataset['xred'][step] = positions
+                dataset['xcart'][step] = positions @ cell
+                dataset['fcart'][step] = rng.normal(size=(natom, 3))
+                dataset['strten'][step] = rng.normal(size=6)
+                dataset['etotal'][step] = -8 - 0.1 * step
+                dataset['ekin'][step] = 0.01 * step
+
+        return filepath
+
+    return _generate_hist_file
+
+
+ABINIT_OUTPUT = """
+ ABINIT 9.6.2
+
+--- !ResultsGS
+comment: Summary of ground state results
+etotal: -8.5
+...
+
+--- !FinalSummary
+program: abinit
+version: 9.6.2
+start_datetime: Mon Jan 10 10:00:00 2022
+end_datetime: Mon Jan 10 10:01:00 2022
+overall_cpu_time: 10.0
+overall_wall_time: 10.0
+exit_requested_by_user: no
+timelimit: 0
+pseudos:
+    Si: 1
+usepaw: 0
+mpi_procs: 1
+omp_threads: 1
+num_warnings: 0
+num_comments: 0
+...
+"""
+
+
+@pytest.fixture
+def generate_abinit_calc_job_node(generate_calc_job_node, generate_gsr_file, generate_hist_file, tmp_path):
+    """Return a function that creates an `AbinitCalculation` node with a retrieved output file and GSR file."""
+
+    def _generate_abinit_calc_job_node(
+        parameters=None, settings=None, output=None, gsr=None, hist=None, datasets=None, retrieved_temporary_folder=None
+    ):
+        """Return an `AbinitCalculation` node whose retrieved folder contains the output file and a GSR file.
+
+        :param parameters: optional input parameters
+        :param settings: optional input settings
+        :param output: optional content of the output file
+        :param gsr: optional keyword arguments of `generate_gsr_file`
+        :param hist: optional keyword arguments of `generate_hist_file`, if given a HIST file is also retrieved
+        :param datasets: optional list of keyword arguments of `generate_gsr_file`, if given the GSR file of each
+            dataset of a packed calculation is retrieved instead of a single GSR file
+        :param retrieved_temporary_folder: optional path of a folder to which the NetCDF files are written instead, as
+            files of the `retrieve_temporary_list`
+        :return: `CalcJobNode` instance with an attached `FolderData` as the `retrieved` node
+        """
+        from aiida import orm
+        from aiida.common import LinkType
+
+        dirpath = tempfile.mkdtemp(dir=tmp_path)
+        with open(os.path.join(dirpath, 'aiida.out'), 'w', encoding='utf-8') as handle:
+            handle.write(output or ABINIT_OUTPUT)
+
+        netcdf_dirpath = retrieved_temporary_folder or dirpath
+        netcdf_list = []
+        if datasets is None:
+            generate_gsr_file(os.path.join(netcdf_dirpath, 'aiidao_GSR.nc'), **(gsr or {}))
+            netcdf_list.append('aiidao_GSR.nc')
+        for index, dataset_gsr in enumerate(datasets or [], start=1):
+            generate_gsr_file(os.path.join(netcdf_dirpath, f'aiidao_DS{index}_GSR.nc'), **dataset_gsr)
+            netcdf_list.append(f'aiidao_DS{index}_GSR.nc')
+        if hist is not None:
+            generate_hist_file(os.path.join(netcdf_dirpath, 'aiidao_HIST.nc'), **hist)
+            netcdf_list.append('aiidao_HIST.nc')
+
+        inputs = {'parameters': orm.Dict(dict=parameters or {'ecut': 8.0})}
+        if settings is not None:
+            inputs['settings'] = orm.Dict(dict=settings)
+        attributes = {'prefix': 'aiida', 'retrieve_list': ['aiida.out']}
+        if retrieved_temporary_folder is None:
+            attributes['retrieve_list'] += netcdf_list
+        else:
+            attributes['retrieve_temporary_list'] = netcdf_list
+
+        node = generate_calc_job_node('abinit', inputs=inputs, attributes=attributes)
+
+        retrieved = orm.FolderData()
+        retrieved.base.repository.put_object_from_tree(dirpath)
+        retrieved.base.links.add_incoming(node, link_type=LinkType.CREATE, link_label='retrieved')
+        retrieved.store()
+
+        return node
+
+    return _generate_abinit_calc_job_node
+
+
 @pytest.fixture(scope='session')
 def generate_parser():
     """Fixture to load a parser class for testing parsers."""
@@ -501,3 +756,45 @@ def generate_workchain_abinit(generate_workchain, generate_inputs_abinit, genera
         return process
 
     return _generate_workchain_abinit
+
+
+@pytest.fixture
+def generate_finished_abinit_calc_job_node(generate_calc_job_node, fixture_localhost, tmp_path):
+    """Return a function that creates a finished `AbinitCalculation` node with output nodes, for work chain tests."""
+
+    def _generate_finished_abinit_calc_job_node(
+        exit_code=None, parameters=None, settings=None, outputs=None, parent_calc_folder=None
+    ):
+        """Return a finished `AbinitCalculation` node with a `remote_folder` and the given outputs.
+
+        :param exit_code: optional `ExitCode` of the calculation, by default it finished successfully
+        :param parameters: optional input parameters
+        :param settings: optional input settings
+        :param outputs: optional dictionary of output nodes with their link label as key
+        :param parent_calc_folder: optional `RemoteData` of the calculation it restarts from
+        :return: `CalcJobNode` instance
+        """
+        from plumpy import ProcessState
+        from aiida import orm
+        from aiida.common import LinkType
+
+        inputs = {'parameters': orm.Dict(dict=parameters or {'ecut': 18.0})}
+        if settings is not None:
+            inputs['settings'] = orm.Dict(dict=settings)
+        if parent_calc_folder is not None:
+            inputs['parent_calc_folder'] = parent_calc_folder
+
+        node = generate_calc_job_node('abinit', inputs=inputs)
+        node.set_process_state(ProcessState.FINISHED)
+        node.set_exit_status(exit_code.status if exit_code is not None else 0)
+
+        remote_folder = orm.RemoteData(computer=fixture_localhost, remote_path=str(tmp_path))
+        outputs = {'remote_folder': remote_folder, **(outputs or {})}
+        for link_label, output in outputs.items():
+            output.base.links.add_incoming(node, link_type=LinkType.CREATE, link_label=link_label)
+            output.store()
+
+        return node
+
+    return _generate_finished_abinit_calc_job_node
+
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access
+"""Tests for the `AbinitParser`."""
+import numpy as np
+import pytest
+
+from aiida_abinit.parsers import AbinitParser
+
+
+@pytest.mark.parametrize('nsppol', [1, 2])
+def test_read_gsr_netcdf(tmp_path, generate_gsr_file, nsppol):
+    """Test that reading the GSR file with `netCDF4` gives the same outputs as reading it with `abipy`."""
+    filepath = generate_gsr_file(str(tmp_path / 'aiidao_GSR.nc'), nsppol=nsppol)
+
+    gsr_data, structure, bands_data = AbinitParser._read_gsr_netcdf(filepath)
+    reference_data, reference_structure, reference_bands = AbinitParser._read_gsr_abipy(filepath)
+
+    assert gsr_data.keys() == reference_data.keys()
+    for key, value in gsr_data.items():
+        if isinstance(value, str):
+            assert value == reference_data[key]
+        else:
+            assert np.allclose(value, reference_data[key], rtol=1e-10, atol=0), key
+
+    assert np.allclose(structure.cell, reference_structure.cell)
+    assert [site.kind_name for site in structure.sites] == [site.kind_name for site in reference_structure.sites]
+    positions = [site.position for site in structure.sites]
+    assert np.allclose(positions, [site.position for site in reference_structure.sites])
+
+    assert bands_data.units == reference_bands.units
+    assert np.allclose(bands_data.get_kpoints(), reference_bands.get_kpoints())
+    assert np.allclose(bands_data.get_bands(), reference_bands.get_bands())
+
+
+def test_read_gsr_fallback(tmp_path, generate_gsr_file, monkeypatch):
+    """Test that the GSR file is read with `abipy` if it cannot be read with `netCDF4`."""
+    filepath = generate_gsr_file(str(tmp_path / 'aiidao_GSR.nc'))
+
+    def read_gsr_netcdf(filepath, *args):  # pylint: disable=unused-argument
+        raise KeyError('number_of_states')
+
+    monkeypatch.setattr(AbinitParser, '_read_gsr_netcdf', staticmethod(read_gsr_netcdf))
+
+    gsr_data, _, _ = AbinitParser._read_gsr(filepath)
+    assert gsr_data['nband'] == 8
+
+
+@pytest.mark.parametrize('arrays_in_output_parameters', [False, True])
+def test_split_gsr_arrays(tmp_path, generate_gsr_file, arrays_in_output_parameters):
+    """Test that the forces and stress are moved to the `ArrayData` and replaced by the maximum force."""
+    from aiida.orm import ArrayData
+
+    filepath = generate_gsr_file(str(tmp_path / 'aiidao_GSR.nc'))
+    gsr_data, _, _ = AbinitParser._read_gsr(filepath)
+    cart_forces = gsr_data['cart_forces']
+
+    output_arrays = ArrayData()
+    AbinitParser._split_gsr_arrays(gsr_data, output_arrays, arrays_in_output_parameters, 'ds1_')
+
+    assert sorted(output_arrays.get_arraynames()) == ['ds1_cart_forces', 'ds1_cart_stress_tensor']
+    assert np.allclose(output_arrays.get_array('ds1_cart_forces'), cart_forces)
+    assert gsr_data['max_force'] == pytest.approx(np.linalg.norm(cart_forces, axis=1).max())
+    assert gsr_data['cart_forces_units'] == 'eV / Angstrom'
+    assert ('cart_forces' in gsr_data) is arrays_in_output_parameters
+    assert ('cart_stress_tensor' in gsr_data) is arrays_in_output_parameters
+
+
+@pytest.mark.parametrize('bands_dtype', [np.float64, np.float32])
+def test_read_gsr_bands(tmp_path, generate_gsr_file, bands_dtype):
+    """Test that the `BandsData` has the occupations and the Fermi energy, and arrays of the requested type."""
+    filepath = generate_gsr_file(str(tmp_path / 'aiidao_GSR.nc'), nsppol=2)
+
+    _, _, bands_data = AbinitParser._read_gsr_netcdf(filepath, bands_dtype)
+    _, _, reference_bands = AbinitParser._read_gsr_abipy(filepath)
+
+    bands, occupations = bands_data.get_bands(also_occupations=True)
+    reference, reference_occupations = reference_bands.get_bands(also_occupations=True)
+
+    assert bands.dtype == bands_dtype
+    assert occupations.dtype == bands_dtype
+    assert np.allclose(bands, reference, rtol=1e-6)
+    assert np.allclose(occupations, reference_occupations)
+    assert bands_data.base.attributes.get('fermi_energy') == pytest.approx(
+        reference_bands.base.attributes.get('fermi_energy')
+    )
+
+
+def test_read_gsr_selection(tmp_path, generate_gsr_file):
+    """Test that the bands and energy terms are skipped if not requested."""
+    filepath = generate_gsr_file(str(tmp_path / 'aiidao_GSR.nc'))
+
+    gsr_data, _, bands_data = AbinitParser._read_gsr_netcdf(filepath, parse_bands=False, parse_energy_terms=False)
+
+    assert bands_data is None
+    assert 'e_ewald' not in gsr_data
+    assert 'energy' in gsr_data
+    assert 'total_magnetization' in gsr_data
+
+
+SCF_CONVERGENCE_OUTPUT = """
+ ABINIT 9.6.2
+
+--- !ScfConvergenceWarning
+message: |
+    nstep=     30 was not enough SCF cycles to converge;
+    maximum residual=  1.226E-04 exceeds tolvrs=  1.000E-10
+src_file: m_scfcv_core.F90
+src_line: 1045
+...
+
+--- !FinalSummary
+program: abinit
+version: 9.6.2
+num_warnings: 1
+num_comments: 0
+...
+"""
+
+
+def test_netcdf_retrieval_temporary(generate_abinit_calc_job_node, tmp_path):
+    """Test that the NetCDF files are parsed from the temporary retrieved folder with `NETCDF_RETRIEVAL='temporary'`."""
+    from aiida_abinit.calculations import AbinitCalculation
+
+    retrieved_temporary_folder = tmp_path / 'retrieved_temporary'
+    retrieved_temporary_folder.mkdir()
+    node = generate_abinit_calc_job_node(
+        parameters={'ecut': 8.0, 'ionmov': 2},
+        settings={'NETCDF_RETRIEVAL': 'temporary'},
+        hist={},
+        retrieved_temporary_folder=str(retrieved_temporary_folder),
+    )
+    assert node.outputs.retrieved.base.repository.list_object_names() == ['aiida.out']
+
+    parser = AbinitParser(node)
+    exit_code = parser.parse(retrieved_temporary_folder=str(retrieved_temporary_folder))
+
+    assert exit_code.status == 0
+    assert 'energy' in parser.outputs.output_parameters.get_dict()
+    assert 'output_trajectory' in parser.outputs
+    # The files of the temporary retrieved folder are read in place
+    assert sorted(path.name for path in retrieved_temporary_folder.iterdir()) == ['aiidao_GSR.nc', 'aiidao_HIST.nc']
+
+    # Without the temporary retrieved folder, the GSR file is missing
+    exit_code = AbinitParser(node).parse()
+    assert exit_code == AbinitCalculation.exit_codes.ERROR_MISSING_GSR_OUTPUT_FILE
+
+
+def test_parse_datasets(generate_abinit_calc_job_node, tmp_path, generate_gsr_file):
+    """Test that each dataset of a packed calculation gets its outputs, and their energies are summarized."""
+    datasets = [{'ecut': 8.0}, {'ecut': 10.0}]
+    node = generate_abinit_calc_job_node(
+        settings={'DATASETS': datasets}, datasets=[{'seed': 1, 'natom': 2}, {'seed': 2, 'natom': 3}]
+    )
+
+    parser = AbinitParser(node)
+    exit_code = parser.parse()
+
+    assert exit_code.status == 0
+    assert 'output_structure' not in parser.outputs
+    # The outputs of the parser are not nested, their namespace is part of their label
+    output_datasets = {
+        label.split('.')[1]: output for label, output in parser.outputs.items() if label.startswith('output_datasets.')
+    }
+    assert sorted(output_datasets) == ['ds1', 'ds2']
+
+    for index, natom in ((1, 2), (2, 3)):
+        filepath = generate_gsr_file(str(tmp_path / f'DS{index}_GSR.nc'), seed=index, natom=natom)
+        reference_data, _, _ = AbinitParser._read_gsr_netcdf(filepath)
+        assert output_datasets[f'ds{index}']['energy'] == pytest.approx(reference_data['energy'])
+        assert parser.outputs['output_arrays'].get_array(f'ds{index}_cart_forces').shape == (natom, 3)
+
+    output_parameters = parser.outputs['output_parameters'].get_dict()
+    assert output_parameters['ndtset'] == 2
+    assert output_parameters['energy'] == [output_datasets['ds1']['energy'], output_datasets['ds2']['energy']]
+    assert output_parameters['energy_units'] == 'eV'
+    assert output_parameters['energy'][0] != output_parameters['energy'][1]
+
+
+def test_parse_datasets_missing(generate_abinit_calc_job_node):
+    """Test that a packed calculation fails if the GSR file of one of its datasets is missing."""
+    from aiida_abinit.calculations import AbinitCalculation
+
+    node = generate_abinit_calc_job_node(settings={'DATASETS': [{'ecut': 8.0}, {'ecut': 10.0}]}, datasets=[{}])
+
+    exit_code = AbinitParser(node).parse()
+
+    assert exit_code == AbinitCalculation.exit_codes.ERROR_MISSING_GSR_OUTPUT_FILE
+
+
+@pytest.mark.parametrize('ionmov,exit_status', [(0, 500), (2, 0)])
+def test_scf_convergence_not_reached(generate_abinit_calc_job_node, ionmov, exit_status):
+    """Test that an unconverged SCF cycle is reported for fixed geometries, after the outputs are parsed."""
+    from aiida_abinit.calculations import AbinitCalculation
+
+    hist = {} if ionmov else None
+    node = generate_abinit_calc_job_node(
+        parameters={'ecut': 8.0, 'ionmov': ionmov}, output=SCF_CONVERGENCE_OUTPUT, hist=hist
+    )
+
+    parser = AbinitParser(node)
+    exit_code = parser.parse()
+
+    assert exit_code.status == exit_status
+    if exit_status:
+        assert exit_code == AbinitCalculation.exit_codes.ERROR_SCF_CONVERGENCE_NOT_REACHED
+    assert 'output_parameters' in parser.outputs
+
+
+OUT_OF_WALLTIME_OUTPUT = """
+ ABINIT 9.6.2
+
+--- !COMMENT
+src_file: m_gstateimg.F90
+src_line: 560
+message: |
+    Approaching time limit 1800.0 [s].
+    Will exit istep loop in mover.
+...
+"""
+
+
+@pytest.mark.parametrize('ionmov', [0, 2])
+def test_out_of_walltime(generate_abinit_calc_job_node, ionmov):
+    """Test that the timings and the trajectory of a relaxation that ran out of walltime are parsed to be continued."""
+    from aiida_abinit.calculations import AbinitCalculation
+
+    hist = {} if ionmov else None
+    node = generate_abinit_calc_job_node(
+        parameters={'ecut': 8.0, 'ionmov': ionmov}, output=OUT_OF_WALLTIME_OUTPUT, hist=hist
+    )
+
+    parser = AbinitParser(node)
+    exit_code = parser.parse()
+
+    assert exit_code == AbinitCalculation.exit_codes.ERROR_OUT_OF_WALLTIME
+    assert parser.outputs.output_parameters['num_scf_iterations'] == 0
+    assert ('output_trajectory' in parser.outputs) == bool(ionmov)
+    assert ('output_structure' in parser.outputs) == bool(ionmov)
+
+
+@pytest.mark.parametrize('reason,exit_code_name', [
+    ('scf_diverged', 'ERROR_SCF_DIVERGED'),
+    ('scf_stalled', 'ERROR_SCF_DIVERGED'),
+    ('relaxation_stalled', 'ERROR_RELAXATION_STALLED'),
+])
+def test_stopped_by_monitor(generate_abinit_calc_job_node, reason, exit_code_name):
+    """Test that the exit code of a calculation killed by the monitor is that of the reason it was stopped."""
+    from aiida_abinit.calculations import AbinitCalculation
+    from aiida_abinit.monitors import MONITOR_EXTRA
+
+    output = ' ABINIT 9.6.2\n\n ETOT  1  -8.5000000000000  -8.500E+00 1.000E-04 1.000E+01\n'
+    node = generate_abinit_calc_job_node(parameters={'ecut': 8.0, 'ionmov': 2}, output=output, hist={})
+    node.base.extras.set(MONITOR_EXTRA, {'reason': reason, 'message': 'stopped'})
+
+    parser = AbinitParser(node)
+    exit_code = parser.parse()
+
+    assert exit_code == getattr(AbinitCalculation.exit_codes, exit_code_name)
+    assert parser.outputs.output_parameters['run_completed'] is False
+    assert 'output_trajectory' in parser.outputs
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 4, 100])
+@pytest.mark.parametrize('stride,start,stop', [
+    (1, None, None),
+    (3, None, None),
+    (2, 1, 8),
+    (4, -6, None),
+    (5, 2, -1),
+])
+def test_read_trajectory(tmp_path, generate_hist_file, chunk_size, stride, start, stop):
+    """Test that strided and chunked reads of the HIST file select the same steps as a full read."""
+    filepath = generate_hist_file(str(tmp_path / 'aiidao_HIST.nc'), nsteps=11)
+    reference, reference_structure = AbinitParser._read_trajectory(filepath)
+    trajectory, structure = AbinitParser._read_trajectory(
+        filepath, stride=stride, start=start, stop=stop, chunk_size=chunk_size
+    )
+
+    selection = slice(start, stop, stride)
+    expected_stepids = np.arange(11)[selection]
+    assert np.array_equal(trajectory.get_stepids(), expected_stepids)
+    assert np.array_equal(reference.get_stepids(), np.arange(11))
+    for arrayname in ('positions', 'cells', 'forces', 'stress', 'energy', 'energy_kin', 'total_force'):
+        assert np.allclose(trajectory.get_array(arrayname), reference.get_array(arrayname)[selection]), arrayname
+    assert 'scalar_stepids' not in trajectory.get_arraynames()
+
+    # The final structure is always that of the last step of the file
+    assert np.allclose(structure.cell, reference_structure.cell)
+    assert np.allclose([site.position for site in structure.sites], reference.get_array('positions')[-1])
+
+
+def read_trajectory_hist_file(filepath):
+    """Return the arrays of the trajectory and the final structure of a HIST file read with the `abipy` `HistFile`.
+
+    This is how the parser read the HIST file before `_read_trajectory`, with the cells and the final structure from
+    the structures of the `HistFile` and the stress tensor built from the Voigt components one step at a time.
+    """
+    import netCDF4
+    from abipy.dynamics.hist import HistFile
+    from pymatgen.core import units
+
+    with HistFile(filepath) as hist_file:
+        structures = hist_file.structures
+
+    with netCDF4.Dataset(filepath, 'r') as data_set:
+        energy_ha = data_set.variables['etotal'][:].data
+        energy_kin_ha = data_set.variables['ekin'][:].data
+        forces_cart_ha_bohr = data_set.variables['fcart'][:, :, :].data
+        positions_cart_bohr = data_set.variables['xcart'][:, :, :].data
+        stress_voigt = data_set.variables['strten'][:, :].data
+
+    stress = []
+    for voigt in stress_voigt:
+        tensor = np.diag(voigt[:3])
+        tensor[1, 2] = tensor[2, 1] = voigt[3]
+        tensor[0, 2] = tensor[2, 0] = voigt[4]
+        tensor[0, 1] = tensor[1, 0] = voigt[5]
+        stress.append(tensor)
+
+    arrays = {
+        'symbols': np.array([specie.symbol for specie in structures[0].species]),
+        'cells': np.array([structure.lattice.matrix for structure in structures]),
+        'positions': positions_cart_bohr * units.bohr_to_ang,
+        'forces': forces_cart_ha_bohr * units.Ha_to_eV / units.bohr_to_ang,
+        'stress': np.array(stress) * units.Ha_to_eV / units.bohr_to_ang**3,
+        'energy': energy_ha * units.Ha_to_eV,
+        'energy_kin': energy_kin_ha * units.Ha_to_eV,
+        'total_force': np.sum(forces_cart_ha_bohr, axis=(1, 2)) * units.Ha_to_eV / units.bohr_to_ang,
+    }
+
+    return arrays, structures[-1]
+
+
+@pytest.mark.parametrize('natom', [1, 2, 5])
+def test_read_trajectory_hist_file(tmp_path, generate_hist_file, natom):
+    """Test that reading the HIST file with `netCDF4` gives the same outputs as reading it with `abipy`."""
+    filepath = generate_hist_file(str(tmp_path / 'aiidao_HIST.nc'), nsteps=7, natom=natom)
+
+    trajectory, structure = AbinitParser._read_trajectory(filepath)
+    reference, reference_structure = read_trajectory_hist_file(filepath)
+
+    assert np.array_equal(trajectory.get_stepids(), np.arange(7))
+    assert list(trajectory.symbols) == list(reference.pop('symbols'))
+    for arrayname, array in reference.items():
+        assert trajectory.get_array(arrayname).shape == array.shape, arrayname
+        assert np.allclose(trajectory.get_array(arrayname), array), arrayname
+
+    assert np.allclose(structure.cell, reference_structure.lattice.matrix)
+    assert np.allclose([site.position for site in structure.sites], reference_structure.cart_coords)
+    assert [site.kind_name for site in structure.sites] == [specie.symbol for specie in reference_structure.species]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 4, 100])
+def test_read_trajectory_full_scalars(tmp_path, generate_hist_file, chunk_size):
+    """Test that with `full_scalars` the scalar arrays are kept for all steps of the window."""
+    filepath = generate_hist_file(str(tmp_path / 'aiidao_HIST.nc'), nsteps=11)
+    reference, _ = AbinitParser._read_trajectory(filepath)
+    trajectory, _ = AbinitParser._read_trajectory(
+        filepath, stride=3, start=1, stop=10, chunk_size=chunk_size, full_scalars=True
+    )
+
+    assert np.array_equal(trajectory.get_stepids(), [1, 4, 7])
+    assert np.array_equal(trajectory.get_array('scalar_stepids'), np.arange(1, 10))
+    for arrayname in ('energy', 'energy_kin', 'total_force'):
+        assert np.allclose(trajectory.get_array(arrayname), reference.get_array(arrayname)[1:10]), arrayname
+    assert np.allclose(trajectory.get_positions(), reference.get_positions()[1:10:3])
+
+
+def test_read_trajectory_empty_selection(tmp_path, generate_hist_file):
+    """Test that a selection without any step raises."""
+    filepath = generate_hist_file(str(tmp_path / 'aiidao_HIST.nc'), nsteps=5)
+
+    with pytest.raises(ValueError, match='No steps'):
+        AbinitParser._read_trajectory(filepath, start=5)
+
+
+@pytest.mark.parametrize('parser_options', [{'trajectory_start': 10}, {'trajectory_start': 2, 'trajectory_stop': 1}])
+def test_parse_trajectory_empty_selection(generate_abinit_calc_job_node, parser_options):
+    """Test that the last step is kept if the trajectory options select none of the steps done by the calculation."""
+    node = generate_abinit_calc_job_node(
+        parameters={'ecut': 8.0, 'ionmov': 2}, settings={'PARSER_OPTIONS': parser_options}, hist={'nsteps': 5}
+    )
+
+    parser = AbinitParser(node)
+    exit_code = parser.parse()
+
+    assert exit_code.status == 0
+    assert np.array_equal(parser.outputs.output_trajectory.get_stepids(), [4])
+    assert np.allclose(parser.outputs.output_trajectory.get_cells()[0], parser.outputs.output_structure.cell)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Tests for the command line interface."""
+from click.testing import CliRunner
+
+from aiida_abinit.cli import cmd_reparse, cmd_stage_pseudos
+
+
+def test_reparse(generate_abinit_calc_job_node):
+    """Test that the `reparse` command re-parses the calculations and skips them when run again with the same tag."""
+    generate_abinit_calc_job_node()
+    runner = CliRunner()
+
+    result = runner.invoke(cmd_reparse, ['--tag', 'v1', '--max-workers', '1'])
+    assert result.exit_code == 0, result.output
+    assert 'Re-parsed' in result.output
+
+    result = runner.invoke(cmd_reparse, ['--tag', 'v1', '--dry-run'])
+    assert result.exit_code == 0, result.output
+    assert '0 calculations to re-parse' in result.output
+
+
+def test_stage_pseudos(generate_psp8_data, fixture_localhost, tmp_path):
+    """Test that the `stage-pseudos` command stages the pseudopotentials of a family, and again once removed."""
+    from aiida_pseudo.groups.family import PseudoPotentialFamily
+    from aiida_abinit.utils import get_staged_pseudo_paths
+
+    psp8 = generate_psp8_data('Si').store()
+    family = PseudoPotentialFamily(label='stage-pseudos').store()
+    family.add_nodes([psp8])
+    dirpath = str(tmp_path / 'pseudos')
+    remote_path = tmp_path / 'pseudos' / psp8.md5 / psp8.filename
+    runner = CliRunner()
+
+    for _ in range(2):
+        result = runner.invoke(cmd_stage_pseudos, [family.label, '-Y', fixture_localhost.label, '-d', dirpath])
+        assert result.exit_code == 0, result.output
+        assert remote_path.read_bytes() == psp8.get_content(mode='rb')
+        assert get_staged_pseudo_paths([psp8], fixture_localhost, dirpath) == {psp8.uuid: str(remote_path)}
+        remote_path.unlink()
+
+    result = runner.invoke(cmd_stage_pseudos, [family.label, '-Y', fixture_localhost.label, '-d', 'pseudos'])
+    assert result.exit_code != 0
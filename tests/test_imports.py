@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Import-time benchmark of the modules loaded through the plugin entry points."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+#: Modules loaded through the `aiida.calculations`, `aiida.calculations.monitors`, `aiida.parsers` and
+#: `aiida.workflows` entry points.
+ENTRY_POINT_MODULES = (
+    'aiida_abinit.calculations', 'aiida_abinit.monitors', 'aiida_abinit.parsers', 'aiida_abinit.workflows.base',
+    'aiida_abinit.workflows.convergence'
+)
+
+#: Modules that `aiida-core` imports anyway and that should not be counted towards the budget of the plugin.
+AIIDA_MODULES = ('aiida.engine', 'aiida.orm', 'aiida.parsers.parser', 'aiida.plugins', 'aiida_pseudo.data.pseudo')
+
+#: Heavy dependencies that should only be imported on the code paths that use them.
+DEFERRED_MODULES = ('abipy', 'pymatgen', 'netCDF4')
+
+#: Maximum time in seconds spent importing the entry point modules on top of `aiida-core`.
+IMPORT_TIME_BUDGET = float(os.environ.get('AIIDA_ABINIT_IMPORT_TIME_BUDGET', 0.5))
+
+MARKER = 'AIIDA_ABINIT_IMPORT_TIME_MARKER'
+
+
+@pytest.fixture(scope='module')
+def import_times():
+    """Return the self import time in seconds of every module imported by the entry point modules.
+
+    The modules are imported in a fresh interpreter with `python -X importtime`, after `aiida-core` itself has been
+    imported, such that only the modules imported because of the plugin are reported.
+    """
+    source = '\n'.join([
+        'import sys',
+        *[f'import {module}' for module in AIIDA_MODULES],
+        f'sys.stderr.write("{MARKER}\\n")',
+        *[f'import {module}' for module in ENTRY_POINT_MODULES],
+    ])
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', source],
+                             capture_output=True,
+                             check=True,
+                             encoding='utf-8')
+    lines = process.stderr.split(MARKER)[-1].splitlines()
+
+    times = {}
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_time, _, module = line[len('import time:'):].split('|')
+        times[module.strip()] = int(self_time) * 1e-6
+
+    return times
+
+
+def test_deferred_imports(import_times):  # pylint: disable=redefined-outer-name
+    """Test that the heavy dependencies are not imported when loading the entry points."""
+    imported = [module for module in import_times if module.split('.')[0] in DEFERRED_MODULES]
+    assert not imported, f'heavy dependencies imported by the entry point modules: {imported}'
+
+
+def test_import_time_budget(import_times):  # pylint: disable=redefined-outer-name
+    """Test that loading the entry points stays within the import time budget."""
+    total = sum(import_times.values())
+    slowest = sorted(import_times.items(), key=lambda item: item[1], reverse=True)[:5]
+    assert total < IMPORT_TIME_BUDGET, f'import took {total:.3f}s > {IMPORT_TIME_BUDGET}s; slowest: {slowest}'
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Tests for the monitors of running calculations."""
+import pytest
+
+from aiida_abinit.monitors import MONITOR_EXTRA, check_progress, monitor_divergence, update_progress
+
+
+def generate_scf_cycle(residuals, etot=-8.5):
+    """Return the `ETOT` lines of an SCF cycle with the given residuals."""
+    return [
+        f' ETOT {index:2d}  {etot:.13f}  -1.000E-05 1.000E-08 {residual:.3E}'
+        for index, residual in enumerate(residuals, start=1)
+    ]
+
+
+def test_update_progress():
+    """Test that the residuals of the current SCF cycle and the energies of the completed ionic steps are read."""
+    lines = generate_scf_cycle([1.0, 0.1], etot=-8.0) + [' some other line'] + generate_scf_cycle([2.0], etot=-8.1)
+
+    progress = update_progress({}, lines[:2])
+    assert progress['residuals'] == [1.0, 0.1]
+    assert progress['energies'] == []
+
+    progress = update_progress(progress, lines[2:])
+    assert progress['residuals'] == [2.0]
+    assert progress['energies'] == [-8.0]
+    assert progress['etot'] == -8.1
+
+    progress = update_progress(progress, ['== DATASET  2 ==========', ' ETOT  1  ***************  -1.0 1.0 NaN'])
+    assert progress['energies'] == []
+    assert progress['residuals'] == []
+    assert progress['diverged']
+    assert check_progress(progress)[0] == 'scf_diverged'
+
+
+@pytest.mark.parametrize('residuals,reason', [
+    ([1.0, 1.0e-2, 1.0e-4, 1.0e-6], None),
+    ([1.0, 1.0e-2, 1.0e-4, 1.0], 'scf_diverged'),
+    ([1.0] + [0.8, 0.9] * 10, 'scf_stalled'),
+    ([1.0] + [0.4] * 20, None),
+])
+def test_check_progress_scf(residuals, reason):
+    """Test the detection of a diverged or stalled SCF cycle."""
+    result = check_progress(update_progress({}, generate_scf_cycle(residuals)), scf_stall_iterations=20)
+    assert (result[0] if result else None) == reason
+
+
+STALLED_ENERGIES = [-8.0, -8.1, -8.2] + [-8.15, -8.19] * 4
+
+
+def generate_ionic_steps(energies):
+    """Return the `ETOT` lines of the SCF cycles of ionic steps with the given energies."""
+    lines = [line for energy in energies for line in generate_scf_cycle([1.0, 1.0e-6], etot=energy)]
+    # The energy of the last ionic step is only recorded when the next SCF cycle starts
+    return lines + generate_scf_cycle([1.0])
+
+
+@pytest.mark.parametrize('energies,reason', [
+    ([-8.0 - 0.01 * index for index in range(10)], None),
+    (STALLED_ENERGIES, 'relaxation_stalled'),
+])
+@pytest.mark.parametrize('max_energies', [None, 9])
+def test_check_progress_relaxation(energies, reason, max_energies):
+    """Test the detection of a relaxation whose energy oscillates, also if only the last energies are kept."""
+    progress = update_progress({}, generate_ionic_steps(energies), max_energies=max_energies)
+    result = check_progress(progress, ionic_stall_steps=8)
+    assert (result[0] if result else None) == reason
+    assert check_progress(progress, ionic_stall_steps=8, check_relaxation=False) is None
+
+
+def test_update_progress_max_energies():
+    """Test that only the last energies are kept, with the minimum of the older ones."""
+    progress = update_progress({}, generate_ionic_steps([-8.0, -8.3, -8.1, -8.2, -8.0]), max_energies=2)
+    assert progress['energies'] == [-8.2, -8.0]
+    assert progress['energy_minimum'] == -8.3
+
+    progress = update_progress(progress, ['== DATASET  2 ==========', *generate_ionic_steps([-7.0])])
+    assert progress['energies'] == [-7.0]
+    assert progress['energy_minimum'] is None
+
+
+def test_monitor_divergence(generate_calc_job_node, fixture_localhost, tmp_path):
+    """Test that the monitor reads the output file incrementally and stops the calculation when the SCF diverges."""
+    node = generate_calc_job_node('abinit')
+    node.set_remote_workdir(str(tmp_path))
+    filepath = tmp_path / 'aiida.out'
+
+    with fixture_localhost.get_transport() as transport:
+        assert monitor_divergence(node, transport) is None
+
+        lines = generate_scf_cycle([1.0, 1.0e-2, 1.0e-3])
+        filepath.write_text('\n'.join(lines) + '\n ETOT  4  -8.5')
+        assert monitor_divergence(node, transport) is None
+        assert node.base.extras.get(MONITOR_EXTRA)['residuals'] == [1.0, 1.0e-2, 1.0e-3]
+
+        # The incomplete line is read again when it is completed
+        filepath.write_text('\n'.join(lines) + '\n' + generate_scf_cycle([1.0, 1.0e-2, 1.0e-3, 10.0])[-1] + '\n')
+        result = monitor_divergence(node, transport)
+
+    assert result is not None
+    assert not result.override_exit_code
+    assert node.base.extras.get(MONITOR_EXTRA)['reason'] == 'scf_diverged'
+    assert node.base.extras.get(MONITOR_EXTRA)['residuals'] == [1.0, 1.0e-2, 1.0e-3, 10.0]
+
+
+@pytest.mark.parametrize('line', [
+    ' ETOT  4  ***************  -1.000E-05 1.000E-08 1.000E-03',
+    ' ETOT  4  -8.5000000000000  -1.000E-05 1.000E-08 NaN',
+])
+def test_monitor_divergence_not_finite(generate_calc_job_node, tmp_path, fixture_localhost, line):
+    """Test that the monitor stops the calculation when a total energy or residual is not finite, and stores only
+    finite values in the extra."""
+    node = generate_calc_job_node('abinit')
+    node.set_remote_workdir(str(tmp_path))
+    lines = generate_scf_cycle([1.0, 1.0e-2, 1.0e-3]) + [line]
+    (tmp_path / 'aiida.out').write_text('\n'.join(lines) + '\n')
+
+    with fixture_localhost.get_transport() as transport:
+        result = monitor_divergence(node, transport)
+
+    progress = node.base.extras.get(MONITOR_EXTRA)
+    assert result is not None
+    assert progress['reason'] == 'scf_diverged'
+    assert progress['diverged']
+    assert progress['residuals'] == [1.0, 1.0e-2, 1.0e-3]
+    assert progress['etot'] == -8.5
+
+
+@pytest.mark.parametrize('ionmov,reason', [(2, 'relaxation_stalled'), (8, None)])
+def test_monitor_divergence_relaxation(generate_calc_job_node, fixture_localhost, tmp_path, ionmov, reason):
+    """Test that only relaxations are stopped when their energy does not decrease, and not molecular dynamics."""
+    from aiida import orm
+
+    node = generate_calc_job_node('abinit', inputs={'parameters': orm.Dict(dict={'ecut': 8.0, 'ionmov': ionmov})})
+    node.set_remote_workdir(str(tmp_path))
+    (tmp_path / 'aiida.out').write_text('\n'.join(generate_ionic_steps(STALLED_ENERGIES)) + '\n')
+
+    with fixture_localhost.get_transport() as transport:
+        result = monitor_divergence(node, transport, ionic_stall_steps=8)
+
+    progress = node.base.extras.get(MONITOR_EXTRA)
+    assert (result is not None) == (reason is not None)
+    assert progress.get('reason', None) == reason
+    assert len(progress['energies']) == 9
+
+
+def test_monitor_entry_point():
+    """Test that the monitor is registered and its keyword arguments are validated."""
+    from aiida.engine.processes.calcjobs.monitors import CalcJobMonitor
+
+    CalcJobMonitor(entry_point='abinit.divergence', kwargs={'scf_stall_iterations': 30})
+
+    with pytest.raises(ValueError):
+        CalcJobMonitor(entry_point='abinit.divergence', kwargs={'unknown': 1})
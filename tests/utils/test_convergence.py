@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Tests for the convergence utility functions."""
+import numpy as np
+import pytest
+
+from aiida_abinit.utils import get_converged_index
+
+
+@pytest.mark.parametrize('energies,expected', [
+    ([-10.0, -10.1, -10.1005, -10.1008], 1),
+    ([-10.0, -10.1, -10.2], None),
+    ([-10.0, None, -10.0005, -10.1, -10.1002], 3),
+    ([-10.0, -10.0005, None], 0),
+    ([-10.0], None),
+])
+def test_get_converged_index(energies, expected):
+    """Test that the coarsest point agreeing with all finer points with results is converged."""
+    points = [None if energy is None else {'energy': energy} for energy in energies]
+    assert get_converged_index(points, energy_tolerance=1.0e-3) == expected
+
+
+@pytest.mark.parametrize('energies,num_finer,expected', [
+    ([-10.0, -10.1, -10.2, -10.2002], 1, 2),
+    ([-10.0, -10.1, -10.2, -10.2002], 2, None),
+    ([-10.0, None, -10.1, -10.1002, -10.1004], 2, 2),
+    ([-10.0, None, -10.1, -10.1002, -10.1004], 3, None),
+])
+def test_get_converged_index_num_finer(energies, num_finer, expected):
+    """Test that a point is only converged if it can be compared with at least `num_finer` finer points."""
+    points = [None if energy is None else {'energy': energy} for energy in energies]
+    assert get_converged_index(points, energy_tolerance=1.0e-3, num_finer=num_finer) == expected
+
+
+def test_get_converged_index_forces():
+    """Test that the forces are only compared if a tolerance is given and both points have forces."""
+    forces = [np.array([[0.0, 0.0, 0.1]]), np.array([[0.0, 0.0, 0.2]]), np.array([[0.0, 0.0, 0.2001]])]
+    points = [{'energy': -10.0, 'forces': force} for force in forces]
+
+    assert get_converged_index(points, energy_tolerance=1.0e-3) == 0
+    assert get_converged_index(points, energy_tolerance=1.0e-3, force_tolerance=1.0e-3) == 1
+    points[1]['forces'] = None
+    assert get_converged_index(points, energy_tolerance=1.0e-3, force_tolerance=1.0e-3) == 1
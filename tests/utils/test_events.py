@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Tests for the event scanning utility functions."""
+import io
+
+import pytest
+
+from aiida_abinit.utils import scan_abinit_events
+
+OUTPUT = """
+ ABINIT 9.6.2
+
+--- Iteration: (1/2) Internal Cycle: (1/1)
+--------------------------------------------------------------------------------
+
+     iter   Etot(hartree)      deltaE(h)  residm     nres2
+ ETOT  1  -8.8429309870000    -8.843E+00 3.142E-04 5.186E+00
+ ETOT  2  -8.8487437070000    -5.813E-03 3.213E-08 2.219E-01
+
+--- Iteration: (2/2) Internal Cycle: (1/1)
+--------------------------------------------------------------------------------
+
+ ETOT  1  -8.8490000000000    -8.849E+00 3.142E-06 5.186E-02
+
+--- !COMMENT
+src_file: m_common.F90
+src_line: 312
+message: |
+    Approaching time limit
+...
+
+--- !WARNING
+src_file: m_kpts.F90
+src_line: 1002
+message: |
+    The number of k-points is not a multiple of the number of processors.
+...
+
+--- !ScfConvergenceWarning
+src_file: m_scfcv_core.F90
+src_line: 1432
+message: |
+    nstep= 20 was not enough SCF cycles to converge.
+...
+
+--- !ResultsGS
+comment: Summary of ground state results
+etotal: -8.5
+...
+{error}
+--- !FinalSummary
+program: abinit
+version: 9.6.2
+start_datetime: Mon Jan 10 10:00:00 2022
+end_datetime: Mon Jan 10 10:01:00 2022
+overall_cpu_time: 10.0
+overall_wall_time: 10.0
+exit_requested_by_user: no
+timelimit: 0
+pseudos:
+    Si: 1
+usepaw: 0
+mpi_procs: 1
+omp_threads: 1
+num_warnings: 2
+num_comments: 1
+...
+"""
+
+ERROR = """
+--- !ERROR
+src_file: m_abi_linalg.F90
+src_line: 10
+message: |
+    Something went wrong.
+...
+"""
+
+
+def test_scan_abinit_events():
+    """Test that `scan_abinit_events` reports the errors, warnings and comments and whether the run completed."""
+    report = scan_abinit_events(io.StringIO(OUTPUT.format(error='')))
+
+    assert report.run_completed
+    assert report.errors == []
+    assert [event.tag for event in report.warnings] == ['!WARNING', '!ScfConvergenceWarning']
+    assert [event.message for event in report.comments] == ['Approaching time limit\n']
+    assert report.comments[0].lineno == 16
+    assert report.num_scf_iterations == 3
+    assert report.num_ionic_steps == 2
+    assert report.wall_time == 10.0
+
+
+@pytest.mark.parametrize('stop_on_error', [True, False])
+def test_scan_abinit_events_error(stop_on_error):
+    """Test that `scan_abinit_events` stops at the first error when requested."""
+    report = scan_abinit_events(io.StringIO(OUTPUT.format(error=ERROR)), stop_on_error=stop_on_error)
+
+    assert [event.message for event in report.errors] == ['Something went wrong.\n']
+    assert len(report.warnings) == 2
+    assert report.run_completed is not stop_on_error
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""Tests for the parser options utility functions."""
+import pytest
+
+from aiida_abinit.utils import PARSER_OPTIONS, get_parser_options
+
+
+def test_get_parser_options_defaults():
+    """Test that the default value of all options is returned if no options are given."""
+    assert get_parser_options() == {name: option.default for name, option in PARSER_OPTIONS.items()}
+
+
+def test_get_parser_options():
+    """Test that the given options override the defaults."""
+    parser_options = get_parser_options({'parse_bands': False, 'trajectory_start': -10, 'parse_trajectory': 'last'})
+
+    assert parser_options['parse_bands'] is False
+    assert parser_options['trajectory_start'] == -10
+    assert parser_options['parse_trajectory'] == 'last'
+    assert parser_options['parse_energy_terms'] is True
+
+
+@pytest.mark.parametrize(
+    'parser_options,match', [
+        ({'parse_band': False}, 'Unknown parser options'),
+        ({'parse_bands': 'no'}, 'should be of type bool'),
+        ({'trajectory_stride': True}, 'should be of type int'),
+        ({'trajectory_stride': 0}, 'positive integer'),
+        ({'parse_trajectory': 'none'}, 'should be one of'),
+    ]
+)
+def test_get_parser_options_invalid(parser_options, match):
+    """Test that unknown options and invalid values raise a `ValueError`."""
+    with pytest.raises(ValueError, match=match):
+        get_parser_options(parser_options)
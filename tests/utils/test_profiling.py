@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Tests for the profiling utility functions."""
+import os
+
+import pytest
+
+from aiida import orm
+
+from aiida_abinit.parsers import AbinitParser
+from aiida_abinit.utils import PROFILING_EXTRA, PhaseProfiler, get_profiling_options, get_profiling_statistics
+
+
+@pytest.mark.parametrize('profiling', [None, False])
+def test_get_profiling_options_disabled(profiling):
+    """Test that the profiling is disabled by default."""
+    assert get_profiling_options(profiling) is None
+    assert not PhaseProfiler(get_profiling_options(profiling)).enabled
+
+
+@pytest.mark.parametrize(
+    'profiling,match', [
+        ('yes', 'boolean or a dictionary'),
+        ({'memory': True}, 'Unknown profiling options'),
+        ({'trace_memory': 1}, 'should be a boolean'),
+        ({'cprofile_dirpath': 'profiles'}, 'absolute path'),
+    ]
+)
+def test_get_profiling_options_invalid(profiling, match):
+    """Test that invalid profiling settings raise."""
+    with pytest.raises(ValueError, match=match):
+        get_profiling_options(profiling)
+
+
+def test_phase_profiler(generate_abinit_calc_job_node, tmp_path):
+    """Test that the phases are recorded, including nested and repeated ones, and stored with the `cProfile` dump."""
+    node = generate_abinit_calc_job_node()
+    profiler = PhaseProfiler(get_profiling_options({'cprofile_dirpath': str(tmp_path)}))
+
+    with profiler.profile(node, 'parse'):
+        with profiler.phase('outer'):
+            for _ in range(2):
+                with profiler.phase('inner'):
+                    data = bytearray(1_000_000)
+                    del data
+
+    phases = node.base.extras.get(PROFILING_EXTRA)['parse']
+
+    assert sorted(phases) == ['inner', 'outer', 'total']
+    assert phases['inner']['count'] == 2
+    assert phases['inner']['peak_memory'] > 900_000
+    assert phases['outer']['peak_memory'] >= phases['inner']['peak_memory']
+    assert phases['total']['wall_time'] >= phases['outer']['wall_time'] >= phases['inner']['wall_time']
+    assert os.path.isfile(tmp_path / f'{node.uuid}_parse.prof')
+
+
+def test_phase_profiler_disabled(generate_abinit_calc_job_node):
+    """Test that a disabled profiler does not record anything."""
+    node = generate_abinit_calc_job_node()
+    profiler = PhaseProfiler()
+
+    with profiler.profile(node, 'parse'):
+        with profiler.phase('phase'):
+            pass
+
+    assert profiler.phases == {}
+    assert PROFILING_EXTRA not in node.base.extras.all
+
+
+def test_get_profiling_statistics(generate_abinit_calc_job_node):
+    """Test the aggregation of the phases of the parser profiled over several calculations."""
+    settings = {'PROFILING': True}
+    nodes = [generate_abinit_calc_job_node(settings=settings) for _ in range(2)]
+    for node in nodes:
+        assert AbinitParser(node).parse().status == 0
+
+    group = orm.Group(label='profiling').store()
+    group.add_nodes(nodes)
+
+    statistics = get_profiling_statistics('parse', group=group)
+
+    assert {'total', 'parse_stdout', 'parse_gsr'}.issubset(statistics)
+    assert statistics['total']['count'] == 2
+    assert statistics['parse_gsr']['max_wall_time_pk'] in [node.pk for node in nodes]
+    assert statistics['total']['mean'] == pytest.approx(statistics['total']['total'] / 2)
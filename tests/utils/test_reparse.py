@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""Tests for the bulk re-parse utility functions."""
+from aiida import orm
+
+from aiida_abinit.utils import REPARSE_EXTRA, get_calculations_to_reparse, reparse_calculations
+
+
+def test_reparse_calculations(generate_abinit_calc_job_node):
+    """Test that the calculations are re-parsed, tagged and skipped when re-parsing with the same tag."""
+    nodes = [generate_abinit_calc_job_node() for _ in range(3)]
+    pks = [node.pk for node in nodes]
+
+    assert set(pks).issubset(get_calculations_to_reparse('v1'))
+
+    results = [result for batch in reparse_calculations(pks, 'v1', max_workers=1, batch_size=2) for result in batch]
+
+    assert sorted(result.pk for result in results) == sorted(pks)
+    assert all(result.exit_status == 0 and result.exception is None for result in results)
+
+    for node in nodes:
+        assert node.base.extras.get(REPARSE_EXTRA) == 'v1'
+        calcfunction = node.outputs.retrieved.base.links.get_outgoing(node_class=orm.CalcFunctionNode).one().node
+        assert 'output_parameters' in calcfunction.outputs
+
+    assert not set(pks).intersection(get_calculations_to_reparse('v1'))
+    assert set(pks).issubset(get_calculations_to_reparse('v2'))
+
+
+def test_get_calculations_to_reparse_group(generate_abinit_calc_job_node):
+    """Test that only the calculations of the group are returned."""
+    node = generate_abinit_calc_job_node()
+    generate_abinit_calc_job_node()
+    group = orm.Group(label='reparse').store()
+    group.add_nodes(node)
+
+    assert get_calculations_to_reparse('v1', group=group) == [node.pk]
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Tests for the resources utility functions."""
+import pytest
+
+from aiida_abinit.utils import resources
+
+CONFIGURATIONS = [
+    {'tot_ncpus': 2, 'mpi_ncpus': 2, 'omp_ncpus': 1, 'efficiency': 0.99, 'vars': {'npkpt': 2}},
+    {'tot_ncpus': 4, 'mpi_ncpus': 4, 'omp_ncpus': 1, 'efficiency': 0.95, 'vars': {'npkpt': 4}},
+    {'tot_ncpus': 8, 'mpi_ncpus': 8, 'omp_ncpus': 1, 'efficiency': 0.60, 'vars': {'npkpt': 4, 'npband': 2}},
+    {'tot_ncpus': 12, 'mpi_ncpus': 6, 'omp_ncpus': 2, 'efficiency': 0.85, 'vars': {'npkpt': 6}},
+]
+
+
+@pytest.mark.parametrize(
+    'max_ncpus,min_efficiency,tot_ncpus', [(12, 0.8, 12), (8, 0.8, 4), (8, 0.0, 8), (8, 0.999, 2), (1, 0.0, None)]
+)
+def test_select_autoparal_configuration(max_ncpus, min_efficiency, tot_ncpus):
+    """Test that `select_autoparal_configuration` selects the efficient configuration with the largest speedup."""
+    configuration = resources.select_autoparal_configuration(CONFIGURATIONS, max_ncpus, min_efficiency)
+
+    if tot_ncpus is None:
+        assert configuration is None
+    else:
+        assert configuration['tot_ncpus'] == tot_ncpus
+
+
+@pytest.mark.parametrize(
+    'mpi_ncpus,omp_ncpus,num_mpiprocs_per_machine,expected', [
+        (4, 1, 8, {'num_machines': 1, 'num_mpiprocs_per_machine': 4, 'num_cores_per_mpiproc': 1}),
+        (16, 2, 8, {'num_machines': 2, 'num_mpiprocs_per_machine': 8, 'num_cores_per_mpiproc': 2}),
+        (10, 1, 4, {'num_machines': 5, 'num_mpiprocs_per_machine': 2, 'num_cores_per_mpiproc': 1}),
+    ]
+)
+def test_get_autoparal_resources(mpi_ncpus, omp_ncpus, num_mpiprocs_per_machine, expected):
+    """Test that `get_autoparal_resources` distributes the MPI processes evenly over the machines."""
+    configuration = {'mpi_ncpus': mpi_ncpus, 'omp_ncpus': omp_ncpus}
+
+    assert resources.get_autoparal_resources(configuration, num_mpiprocs_per_machine) == expected
+
+
+@pytest.mark.parametrize(
+    'mesh,shiftk,kptopt,expected', [
+        ([2, 2, 2], None, 1, 3),
+        ([4, 4, 4], None, 1, 8),
+        ([4, 4, 4], [0.5, 0.5, 0.5], 1, 10),
+        ([4, 4, 4], None, 2, 36),
+        ([4, 4, 4], None, 3, 64),
+        ([4, 4, 4], [[0.0, 0.0, 0.0], [0.5, 0.5, 0.5]], 1, 18),
+    ]
+)
+def test_get_irreducible_kpoints_count(generate_structure, mesh, shiftk, kptopt, expected):
+    """Test the number of irreducible k-points of silicon for various meshes."""
+    structure = generate_structure()
+
+    assert resources.get_irreducible_kpoints_count(structure, mesh, shiftk, kptopt) == expected
+
+
+@pytest.mark.parametrize(
+    'num_kpoints,max_num_machines,num_cores_per_machine,expected', [
+        (8, 1, 8, {'num_machines': 1, 'num_mpiprocs_per_machine': 8, 'num_cores_per_mpiproc': 1}),
+        (10, 2, 8, {'num_machines': 2, 'num_mpiprocs_per_machine': 5, 'num_cores_per_mpiproc': 1}),
+        (10, 2, 36, {'num_machines': 2, 'num_mpiprocs_per_machine': 5, 'num_cores_per_mpiproc': 7}),
+        (6, 1, 8, {'num_machines': 1, 'num_mpiprocs_per_machine': 6, 'num_cores_per_mpiproc': 1}),
+        (4, 2, 8, {'num_machines': 2, 'num_mpiprocs_per_machine': 2, 'num_cores_per_mpiproc': 4}),
+        (24, 3, 4, {'num_machines': 3, 'num_mpiprocs_per_machine': 4, 'num_cores_per_mpiproc': 1}),
+    ]
+)
+def test_get_kpoint_parallel_layouts(num_kpoints, max_num_machines, num_cores_per_machine, expected):
+    """Test that the preferred layout has the most MPI processes dividing the number of k-points, then the fewest
+    OpenMP threads among those using the most cores."""
+    layouts = resources.get_kpoint_parallel_layouts(num_kpoints, max_num_machines, num_cores_per_machine)
+
+    assert layouts[0] == expected
+    for layout in layouts:
+        assert num_kpoints % (layout['num_machines'] * layout['num_mpiprocs_per_machine']) == 0
+
+
+@pytest.mark.parametrize(
+    'max_wallclock_seconds,margin,expected', [
+        (1800, None, 1710),
+        (600, None, 540),
+        (1800, {'fraction': 0.0, 'seconds': 0}, 1800),
+        (100, {'seconds': 300}, 50),
+    ]
+)
+def test_get_timelimit_seconds(max_wallclock_seconds, margin, expected):
+    """Test that `get_timelimit_seconds` leaves the largest margin, but at most half the walltime."""
+    assert resources.get_timelimit_seconds(max_wallclock_seconds, margin) == expected
+
+
+@pytest.mark.parametrize('margin', [{'minutes': 1}, {'fraction': 1.0}, {'seconds': -1}])
+def test_get_timelimit_seconds_invalid(margin):
+    """Test that `get_timelimit_seconds` raises for invalid margins."""
+    with pytest.raises(ValueError):
+        resources.get_timelimit_seconds(1800, margin)
+
+
+def test_estimate_wallclock_seconds():
+    """Test the walltime estimated from the cost of the SCF iterations and ionic steps of previous calculations."""
+    timings = [
+        {'wall_time': 100.0, 'num_scf_iterations': 20, 'num_ionic_steps': 2},
+        {'wall_time': 300.0, 'num_scf_iterations': 60, 'num_ionic_steps': 6},
+        {'num_scf_iterations': 10, 'num_ionic_steps': 0},
+    ]
+    scf_iteration_cost, ionic_step_cost = resources.estimate_step_costs(timings)
+
+    assert scf_iteration_cost == pytest.approx(5.0)
+    assert ionic_step_cost == pytest.approx(50.0)
+
+    margin = {'fraction': 0.0, 'seconds': 0}
+    kwargs = {'safety_factor': 1.0, 'min_wallclock_seconds': 0, 'margin': margin}
+    estimate = resources.estimate_wallclock_seconds
+
+    assert estimate({'nstep': 40}, scf_iteration_cost, ionic_step_cost, **kwargs) == 200
+    assert estimate({'ionmov': 2, 'ntime': 10}, scf_iteration_cost, ionic_step_cost, **kwargs) == 500
+    assert estimate({'ionmov': 2}, scf_iteration_cost, ionic_step_cost, **kwargs) is None
+    assert estimate({}, None, None, **kwargs) is None
+    assert estimate({}, scf_iteration_cost, None, safety_factor=2.0, min_wallclock_seconds=600) == 600
+    assert estimate({'nstep': 1000}, scf_iteration_cost, None, max_wallclock_seconds=3600) == 3600
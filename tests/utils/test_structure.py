@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Tests for the structure utility functions."""
+import numpy as np
+import pytest
+
+from aiida_abinit.utils import structure as structure_utils
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Clear the sanitized structure cache before and after each test."""
+    structure_utils.clear_structure_cache()
+    yield
+    structure_utils.clear_structure_cache()
+
+
+def test_get_sanitized_structure(generate_structure):
+    """Test that `get_sanitized_structure` caches the result of the sanitization."""
+    structure = generate_structure()
+    abi_structure, abivars = structure_utils.get_sanitized_structure(structure)
+
+    assert len(structure_utils._STRUCTURE_CACHE) == 1  # pylint: disable=protected-access
+    assert abivars['natom'] == 2
+    assert list(abivars['znucl']) == [14]
+    assert len(abi_structure) == 2
+
+    # Mutating the returned abivars should not affect the cached entry
+    abivars['xred'][:] = 1.0
+    _, abivars_cached = structure_utils.get_sanitized_structure(structure)
+    assert len(structure_utils._STRUCTURE_CACHE) == 1  # pylint: disable=protected-access
+    assert not np.allclose(abivars_cached['xred'], 1.0)
+
+    # Different sanitization parameters result in a different entry
+    structure_utils.get_sanitized_structure(structure, symprec=1e-4)
+    assert len(structure_utils._STRUCTURE_CACHE) == 2  # pylint: disable=protected-access
+
+
+def test_structure_cache_size(generate_structure, monkeypatch):
+    """Test that the least recently used entries are evicted once the cache is full."""
+    monkeypatch.setattr(structure_utils._STRUCTURE_CACHE, 'maxsize', 1)  # pylint: disable=protected-access
+    structure_utils.get_sanitized_structure(generate_structure('silicon'))
+    structure_utils.get_sanitized_structure(generate_structure('water'))
+    assert len(structure_utils._STRUCTURE_CACHE) == 1  # pylint: disable=protected-access
+
+
+def test_structure_cache_disk(generate_structure, monkeypatch, tmp_path):
+    """Test the on-disk tier of the sanitized structure cache."""
+    monkeypatch.setenv(structure_utils.STRUCTURE_CACHE_DIR_ENV, str(tmp_path))
+    structure = generate_structure()
+    _, abivars = structure_utils.get_sanitized_structure(structure)
+    assert len(list(tmp_path.glob('*.json'))) == 1
+
+    structure_utils.clear_structure_cache()
+    _, abivars_disk = structure_utils.get_sanitized_structure(structure)
+
+    assert abivars_disk.keys() == abivars.keys()
+    for key, value in abivars.items():
+        assert np.array_equal(abivars_disk[key], value)
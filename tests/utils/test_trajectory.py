@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Tests for the trajectory utility functions."""
+import numpy as np
+import pytest
+
+from aiida import orm
+
+from aiida_abinit.utils import get_trajectory_overlap, stitch_trajectories
+
+
+def generate_trajectory(positions, stepids=None):
+    """Return a `TrajectoryData` of a single atom with the given positions along x and an energy per step."""
+    positions = np.array([[[x, 0.0, 0.0]] for x in positions])
+    stepids = np.arange(len(positions)) if stepids is None else np.array(stepids)
+
+    trajectory = orm.TrajectoryData()
+    trajectory.set_trajectory(
+        symbols=['Si'], positions=positions, stepids=stepids, cells=np.array([np.eye(3) * 5.0] * len(positions))
+    )
+    trajectory.set_array('energy', -positions[:, 0, 0])
+    return trajectory
+
+
+@pytest.mark.parametrize(
+    'positions,overlap', [
+        ([0.3, 0.4], 1),
+        ([0.0, 0.1, 0.2, 0.3, 0.4], 4),
+        ([0.0, 0.1, 0.2, 0.3, 0.3, 0.4], 5),
+        ([1.0, 1.1], 0),
+    ]
+)
+def test_get_trajectory_overlap(positions, overlap):
+    """Test the overlap of restarts from the last geometry, with the copied history, or of an unrelated trajectory."""
+    previous = generate_trajectory([0.0, 0.1, 0.2, 0.3])
+
+    assert get_trajectory_overlap(previous, generate_trajectory(positions)) == overlap
+
+
+def test_stitch_trajectories():
+    """Test that the repeated steps are skipped and the step ids follow each other."""
+    trajectories = {
+        'trajectory_0': generate_trajectory([0.0, 0.1, 0.2]),
+        'trajectory_1': generate_trajectory([0.2, 0.3, 0.4]),
+        'trajectory_2': generate_trajectory([0.0, 0.1, 0.2, 0.3, 0.4, 0.5]),
+    }
+
+    stitched = stitch_trajectories(**trajectories)
+
+    assert np.allclose(stitched.get_positions()[:, 0, 0], [0.0, 0.1, 0.2, 0.3, 0.4, 0.5])
+    assert np.array_equal(stitched.get_stepids(), np.arange(6))
+    assert np.allclose(stitched.get_array('energy'), -stitched.get_positions()[:, 0, 0])
+    assert stitched.creator is not None
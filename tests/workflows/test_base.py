@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=redefined-outer-name
+"""Tests for the `AbinitBaseWorkChain`."""
+import numpy as np
+import pytest
+
+from aiida import orm
+
+from aiida_abinit.calculations import AbinitCalculation
+from aiida_abinit.workflows.base import AbinitBaseWorkChain
+
+
+def generate_trajectory(positions):
+    """Return a `TrajectoryData` of a single atom with the given positions along x."""
+    trajectory = orm.TrajectoryData()
+    trajectory.set_trajectory(
+        symbols=['Si'],
+        positions=np.array([[[x, 0.0, 0.0]] for x in positions]),
+        stepids=np.arange(len(positions)),
+        cells=np.array([np.eye(3) * 5.0] * len(positions))
+    )
+    return trajectory
+
+
+def run_validation(process):
+    """Run the setup and validation steps of the work chain, which should all pass."""
+    process.setup()
+    process.validate_parameters()
+    assert process.validate_kpoints() is None
+    assert process.validate_pseudos() is None
+    assert process.validate_resources() is None
+
+
+def test_setup(generate_workchain_abinit):
+    """Test that the validation steps of the work chain prepare the calculation inputs."""
+    process = generate_workchain_abinit()
+    run_validation(process)
+
+    assert isinstance(process.ctx.inputs.kpoints, orm.KpointsData)
+    assert process.ctx.inputs.parameters['ecut'] == 18.0
+
+
+@pytest.mark.parametrize('kpoint_parallelization', [None, False, True])
+def test_kpoint_parallelization(generate_workchain_abinit, monkeypatch, kpoint_parallelization):
+    """Test that the k-points are only distributed over the MPI processes with the `kpoint_parallelization` input, and
+    that more MPI processes are preferred over OpenMP threads."""
+    monkeypatch.setattr(orm.Computer, 'get_default_mpiprocs_per_machine', lambda self: 36)
+    inputs = generate_workchain_abinit(return_inputs=True)
+    inputs['kpoints'] = orm.KpointsData()
+    inputs['kpoints'].set_kpoints(np.linspace(0.0, 0.45, 30).reshape(10, 3))
+    inputs['abinit']['metadata']['options']['resources'] = {'num_machines': 2}
+    if kpoint_parallelization is not None:
+        inputs['kpoint_parallelization'] = orm.Bool(kpoint_parallelization)
+    process = generate_workchain_abinit(inputs=inputs)
+    run_validation(process)
+
+    options = process.ctx.inputs.metadata.options
+    if kpoint_parallelization:
+        assert options.resources == {'num_machines': 2, 'num_mpiprocs_per_machine': 5, 'num_cores_per_mpiproc': 7}
+        assert options.environment_variables['OMP_NUM_THREADS'] == '7'
+    else:
+        assert options.resources == process.inputs.abinit.metadata.options.resources
+        assert 'OMP_NUM_THREADS' not in options.get('environment_variables', {})
+
+
+@pytest.fixture
+def generate_workchain_autoparal(generate_workchain_abinit):
+    """Return an `AbinitBaseWorkChain` with `automatic_parallelization`, stepped up to the `autoparal` calculation."""
+
+    def _generate_workchain_autoparal(automatic_parallelization=None):
+        inputs = generate_workchain_abinit(return_inputs=True)
+        inputs['automatic_parallelization'] = orm.Dict(dict=automatic_parallelization or {'max_ncpus': 8})
+        process = generate_workchain_abinit(inputs=inputs)
+        run_validation(process)
+        assert process.should_run_autoparal()
+        return process
+
+    return _generate_workchain_autoparal
+
+
+def test_run_autoparal(generate_workchain_autoparal, generate_calc_job_node, monkeypatch):
+    """Test that the `autoparal` calculation runs serially with the `autoparal` and `max_ncpus` parameters."""
+    process = generate_workchain_autoparal()
+    submitted = {}
+
+    def submit(process_class, **inputs):
+        submitted.update(inputs, process_class=process_class)
+        return generate_calc_job_node('abinit')
+
+    monkeypatch.setattr(process, 'submit', submit)
+    result = process.run_autoparal()
+
+    assert 'calculation_autoparal' in result
+    assert submitted['process_class'] is AbinitCalculation
+    assert submitted['parameters']['autoparal'] == 1
+    assert submitted['parameters']['max_ncpus'] == 8
+    assert submitted['parameters']['ecut'] == 18.0
+    assert submitted['metadata']['options']['resources'] == {'num_machines': 1, 'num_mpiprocs_per_machine': 1}
+    assert submitted['metadata']['call_link_label'] == 'autoparal'
+    assert 'autoparal' not in process.ctx.inputs.parameters
+
+
+def test_inspect_autoparal(generate_workchain_autoparal, generate_finished_abinit_calc_job_node):
+    """Test that the fastest configuration above the minimum efficiency sets the parameters and resources."""
+    process = generate_workchain_autoparal({'max_ncpus': 8, 'num_mpiprocs_per_machine': 2})
+    configurations = [
+        {'mpi_ncpus': 2, 'omp_ncpus': 1, 'efficiency': 0.99, 'vars': {'npkpt': 2}},
+        {'mpi_ncpus': 4, 'omp_ncpus': 2, 'efficiency': 0.9, 'vars': {'npkpt': 4}},
+        {'mpi_ncpus': 8, 'omp_ncpus': 1, 'efficiency': 0.5, 'vars': {'npkpt': 8}},
+        {'mpi_ncpus': 16, 'omp_ncpus': 1, 'efficiency': 0.95, 'vars': {'npkpt': 16}},
+    ]
+    output_parameters = orm.Dict(dict={'autoparal': {'configurations': configurations}})
+    process.ctx.calculation_autoparal = generate_finished_abinit_calc_job_node(
+        outputs={'output_parameters': output_parameters}
+    )
+
+    assert process.inspect_autoparal() is None
+    assert process.ctx.inputs.parameters['npkpt'] == 4
+    options = process.ctx.inputs.metadata.options
+    assert options.resources == {'num_machines': 2, 'num_mpiprocs_per_machine': 2, 'num_cores_per_mpiproc': 2}
+    assert options.environment_variables['OMP_NUM_THREADS'] == '2'
+
+
+@pytest.mark.parametrize('configurations,exit_code', [
+    ([{'mpi_ncpus': 16, 'efficiency': 1.0}], None),
+    (None, AbinitCalculation.exit_codes.ERROR_OUTPUT_PARSE),
+])
+def test_inspect_autoparal_failed(
+    generate_workchain_autoparal, generate_finished_abinit_calc_job_node, configurations, exit_code
+):
+    """Test that the work chain fails if the `autoparal` calculation failed or proposed no suitable configuration."""
+    process = generate_workchain_autoparal()
+    outputs = {}
+    if configurations is not None:
+        outputs['output_parameters'] = orm.Dict(dict={'autoparal': {'configurations': configurations}})
+    process.ctx.calculation_autoparal = generate_finished_abinit_calc_job_node(exit_code, outputs=outputs)
+
+    result = process.inspect_autoparal()
+
+    assert result == AbinitBaseWorkChain.exit_codes.ERROR_SUB_PROCESS_FAILED_AUTOMATIC_PARALLELIZATION
+    assert result.status == 310
+
+
+def test_exit_codes_unique():
+    """Test that the exit codes of the work chain do not reuse the statuses of the `BaseRestartWorkChain`."""
+    statuses = [exit_code.status for exit_code in AbinitBaseWorkChain.spec().exit_codes.values()]
+    assert len(statuses) == len(set(statuses))
+
+
+def test_handle_scf_convergence_not_reached(generate_workchain_abinit, generate_finished_abinit_calc_job_node):
+    """Test that each restart applies the next SCF strategy and continues from the wavefunctions."""
+    process = generate_workchain_abinit()
+    run_validation(process)
+    exit_code = AbinitCalculation.exit_codes.ERROR_SCF_CONVERGENCE_NOT_REACHED
+
+    expected = [
+        {'nstep': 40},
+        {'nstep': 80, 'diemix': 0.5},
+        {'nstep': 120, 'diemix': 0.25, 'iprcel': 45},
+    ]
+    for attempt, changes in enumerate(expected):
+        calculation = generate_finished_abinit_calc_job_node(exit_code, parameters=process.ctx.inputs.parameters)
+        result = process.handle_scf_convergence_not_reached(calculation)
+
+        assert result.do_break and result.exit_code.status == 0
+        assert {key: process.ctx.inputs.parameters[key] for key in changes} == changes
+        assert process.ctx.inputs.settings['PARENT_RESTART_FILES'] == ['WFK']
+        assert process.ctx.scf_restarts[-1] == {
+            'calculation': calculation.pk,
+            'strategy': attempt,
+            'changes': changes,
+            'restart_files': ['WFK']
+        }
+
+        process.prepare_process()
+        assert process.ctx.inputs.parent_calc_folder.pk == calculation.outputs.remote_folder.pk
+
+    calculation = generate_finished_abinit_calc_job_node(exit_code, parameters=process.ctx.inputs.parameters)
+    result = process.handle_scf_convergence_not_reached(calculation)
+    assert result.exit_code == AbinitBaseWorkChain.exit_codes.ERROR_SCF_CONVERGENCE_NOT_REACHED
+    assert len(process.ctx.scf_restarts) == 3
+
+
+@pytest.mark.parametrize('parameters,restart_files', [
+    ({'prtwf': 0}, ['DEN']),
+    ({'prtwf': 0, 'prtden': 0}, []),
+])
+def test_handle_scf_convergence_not_reached_files(
+    generate_workchain_abinit, generate_finished_abinit_calc_job_node, parameters, restart_files
+):
+    """Test that the density is read if the wavefunctions were not written, and that otherwise nothing is read."""
+    process = generate_workchain_abinit()
+    run_validation(process)
+    exit_code = AbinitCalculation.exit_codes.ERROR_SCF_CONVERGENCE_NOT_REACHED
+    calculation = generate_finished_abinit_calc_job_node(exit_code, parameters={'ecut': 18.0, **parameters})
+
+    process.handle_scf_convergence_not_reached(calculation)
+
+    assert process.ctx.scf_restarts[-1]['restart_files'] == restart_files
+    if restart_files:
+        assert process.ctx.restart_calc.pk == calculation.pk
+        assert process.ctx.inputs.settings['PARENT_RESTART_FILES'] == restart_files
+    else:
+        assert process.ctx.restart_calc is None
+
+
+def test_restart_from_scratch(generate_workchain_abinit, generate_finished_abinit_calc_job_node):
+    """Test that a restart from scratch does not read the restart files of a previous restart."""
+    inputs = generate_workchain_abinit(return_inputs=True)
+    inputs['abinit']['settings'] = orm.Dict(dict={'NATIVE_INPUT_WRITER': True})
+    process = generate_workchain_abinit(inputs=inputs)
+    run_validation(process)
+
+    exit_code = AbinitCalculation.exit_codes.ERROR_SCF_CONVERGENCE_NOT_REACHED
+    calculation = generate_finished_abinit_calc_job_node(exit_code, parameters=process.ctx.inputs.parameters)
+    process.ctx.iteration = 1
+    process.handle_scf_convergence_not_reached(calculation)
+    process.prepare_process()
+    assert process.ctx.inputs.parent_calc_folder.pk == calculation.outputs.remote_folder.pk
+    assert process.ctx.inputs.settings['PARENT_RESTART_FILES'] == ['WFK']
+
+    # The diverged calculation of a fixed geometry is restarted from scratch, not from the previous wavefunctions
+    exit_code = AbinitCalculation.exit_codes.ERROR_SCF_DIVERGED
+    calculation = generate_finished_abinit_calc_job_node(
+        exit_code,
+        parameters=process.ctx.inputs.parameters,
+        parent_calc_folder=process.ctx.inputs.parent_calc_folder,
+    )
+    process.ctx.iteration = 2
+    process.handle_scf_diverged(calculation)
+    process.prepare_process()
+
+    assert process.ctx.restart_calc is None
+    assert process.ctx.inputs.parameters['restartxf'] == 0
+    assert 'parent_calc_folder' not in process.ctx.inputs
+    assert process.ctx.inputs.settings == {'NATIVE_INPUT_WRITER': True}
+
+
+def test_handle_out_of_walltime(
+    generate_workchain_abinit, generate_finished_abinit_calc_job_node, generate_calc_job, fixture_sandbox
+):
+    """Test that a relaxation out of walltime continues from the HIST and WFK with the remaining ionic steps, and that
+    the trajectories of the successive calculations are stitched."""
+    inputs = generate_workchain_abinit(return_inputs=True)
+    inputs['abinit']['parameters'] = orm.Dict(dict={'ecut': 18.0, 'ionmov': 2, 'ntime': 10})
+    process = generate_workchain_abinit(inputs=inputs)
+    run_validation(process)
+    exit_code = AbinitCalculation.exit_codes.ERROR_OUT_OF_WALLTIME
+
+    # The restarts start from the last geometry of the previous calculation, which is repeated in their trajectory
+    trajectories = [[0.0, 0.1, 0.2, 0.3], [0.3, 0.4, 0.5, 0.6], [0.6, 0.7, 0.8]]
+    expected_ntime = [6, 3]
+    parent_calc_folder = None
+    process.ctx.children = []
+
+    for index, positions in enumerate(trajectories):
+        calculation = generate_finished_abinit_calc_job_node(
+            exit_code if index < len(expected_ntime) else None,
+            parameters=process.ctx.inputs.parameters,
+            settings=dict(process.ctx.inputs.settings),
+            outputs={
+                'output_parameters': orm.Dict(dict={'num_ionic_steps': len(positions)}),
+                'output_trajectory': generate_trajectory(positions),
+            },
+            parent_calc_folder=parent_calc_folder,
+        )
+        process.ctx.children.append(calculation)
+        process.ctx.iteration = index + 1
+        if index == len(expected_ntime):
+            break
+
+        result = process.handle_out_of_walltime(calculation)
+
+        assert result.do_break and result.exit_code.status == 0
+        assert process.ctx.inputs.parameters['ntime'] == expected_ntime[index]
+        assert process.ctx.inputs.settings['PARENT_RESTART_FILES'] == ['HIST', 'WFK']
+
+        process.prepare_process()
+        assert process.ctx.inputs.parameters['restartxf'] == -2
+        parent_calc_folder = process.ctx.inputs.parent_calc_folder
+        assert parent_calc_folder.pk == calculation.outputs.remote_folder.pk
+
+    # The calculation of the last restart reads the wavefunctions and the last geometry of the HIST file
+    calc_inputs = process._wrap_bare_dict_inputs(  # pylint: disable=protected-access
+        AbinitCalculation.spec().inputs, process.ctx.inputs
+    )
+    calc_info = generate_calc_job(fixture_sandbox, 'abinit', dict(calc_inputs))
+    with fixture_sandbox.open('aiida.in') as handle:
+        input_written = handle.read()
+    assert ' irdwfk 1\n' in input_written
+    assert ' restartxf -2\n' in input_written
+    assert sorted(target for _, _, target in calc_info.remote_symlink_list) == ['aiidai_HIST.nc', 'aiidai_WFK']
+
+    process.ctx.is_finished = True
+    process.results()
+
+    stitched = process.outputs['output_trajectory']
+    assert np.allclose(stitched.get_positions()[:, 0, 0], np.arange(9) * 0.1)
+    assert np.array_equal(stitched.get_stepids(), np.arange(9))
+    assert stitched.creator is not None
+
+
+@pytest.mark.parametrize('num_ionic_steps,expected_ntime', [(4, 6), (12, 1), (None, 10)])
+def test_handle_out_of_walltime_ntime(
+    generate_workchain_abinit, generate_finished_abinit_calc_job_node, num_ionic_steps, expected_ntime
+):
+    """Test that `ntime` is lowered by the ionic steps reported in the `output_parameters`, whatever the steps of the
+    `output_trajectory` selected by the parser options."""
+    inputs = generate_workchain_abinit(return_inputs=True)
+    inputs['abinit']['parameters'] = orm.Dict(dict={'ecut': 18.0, 'ionmov': 2, 'ntime': 10})
+    process = generate_workchain_abinit(inputs=inputs)
+    run_validation(process)
+
+    summary = {} if num_ionic_steps is None else {'num_ionic_steps': num_ionic_steps}
+    # Only the last step of the trajectory is kept by the parser options
+    calculation = generate_finished_abinit_calc_job_node(
+        AbinitCalculation.exit_codes.ERROR_OUT_OF_WALLTIME,
+        parameters=process.ctx.inputs.parameters,
+        outputs={'output_parameters': orm.Dict(dict=summary), 'output_trajectory': generate_trajectory([0.3])},
+    )
+    process.ctx.children = [calculation]
+
+    result = process.handle_out_of_walltime(calculation)
+    assert result.do_break and result.exit_code.status == 0
+    assert process.ctx.inputs.parameters['ntime'] == expected_ntime
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=redefined-outer-name
+"""Tests for the `AbinitConvergenceWorkChain`."""
+import pytest
+
+from aiida import orm
+
+from aiida_abinit.workflows.base import AbinitBaseWorkChain
+
+
+@pytest.fixture
+def generate_finished_base_workchain_node(generate_finished_abinit_calc_job_node):
+    """Return a function that creates a finished `AbinitBaseWorkChain` node returning the outputs of a calculation."""
+
+    def _generate_finished_base_workchain_node(energy, exit_status=0):
+        """Return a finished `AbinitBaseWorkChain` node with the given total energy.
+
+        The `output_structure` is a single atom primitive cell, unlike the conventional cell of the input structure.
+
+        :param energy: total energy in eV of the `output_parameters`
+        :param exit_status: exit status of the work chain
+        :return: `WorkflowNode` instance
+        """
+        from plumpy import ProcessState
+        from aiida.common import LinkType
+
+        structure = orm.StructureData(cell=[[0.0, 2.715, 2.715], [2.715, 0.0, 2.715], [2.715, 2.715, 0.0]])
+        structure.append_atom(position=(0.0, 0.0, 0.0), symbols='Si')
+
+        calculation = generate_finished_abinit_calc_job_node(
+            outputs={'output_parameters': orm.Dict(dict={'energy': energy}), 'output_structure': structure}
+        )
+
+        node = orm.WorkflowNode(process_type='aiida.workflows:abinit.base')
+        node.set_process_label(AbinitBaseWorkChain.__name__)
+        node.set_process_state(ProcessState.FINISHED)
+        node.set_exit_status(exit_status)
+        node.store()
+
+        if exit_status == 0:
+            for link_label in ('output_parameters', 'output_structure', 'remote_folder'):
+                output = calculation.base.links.get_outgoing(link_label_filter=link_label).one().node
+                output.base.links.add_incoming(node, link_type=LinkType.RETURN, link_label=link_label)
+
+        return node
+
+    return _generate_finished_base_workchain_node
+
+
+@pytest.fixture
+def generate_workchain_convergence(generate_workchain, generate_workchain_abinit):
+    """Return a function that creates an `AbinitConvergenceWorkChain` with the given candidates."""
+
+    def _generate_workchain_convergence(parameters=None, **kwargs):
+        """Return an `AbinitConvergenceWorkChain` converging the base inputs with the given candidates.
+
+        :param parameters: optional input parameters of the candidates
+        :param kwargs: top-level inputs, `List` for lists and `Int` or `Float` for numbers
+        :return: `AbinitConvergenceWorkChain` instance
+        """
+        base = generate_workchain_abinit(return_inputs=True)
+        base.pop('kpoints')
+        if parameters is not None:
+            base['abinit']['parameters'] = orm.Dict(dict=parameters)
+
+        inputs = {'base': base}
+        for key, value in kwargs.items():
+            if isinstance(value, list):
+                inputs[key] = orm.List(list=value)
+            elif isinstance(value, int):
+                inputs[key] = orm.Int(value)
+            else:
+                inputs[key] = orm.Float(value)
+
+        return generate_workchain('abinit.convergence', inputs)
+
+    return _generate_workchain_convergence
+
+
+@pytest.fixture
+def submit_candidates(generate_finished_base_workchain_node, monkeypatch):
+    """Return a function that patches the `submit` of a work chain to return finished candidates."""
+
+    def _submit_candidates(process, energies):
+        """Patch the `submit` of the process to return a finished candidate with the energy of its scanned value.
+
+        :param process: the `AbinitConvergenceWorkChain`
+        :param energies: function returning the total energy in eV of the inputs of a candidate, or `None` if its
+            work chain should fail
+        :return: list of the inputs of the submitted candidates
+        """
+        submitted = []
+
+        def submit(process_class, **inputs):
+            assert process_class is AbinitBaseWorkChain
+            submitted.append(inputs)
+            energy = energies(inputs)
+            if energy is None:
+                return generate_finished_base_workchain_node(0.0, exit_status=300)
+            return generate_finished_base_workchain_node(energy)
+
+        monkeypatch.setattr(process, 'submit', submit)
+        return submitted
+
+    return _submit_candidates
+
+
+def run_scan(process):
+    """Run the steps of the next scan of the work chain and return its exit code."""
+    assert process.should_run_scan()
+    process.setup_scan()
+    while process.should_run_candidates():
+        process.run_candidates()
+        process.inspect_candidates()
+    return process.inspect_scan()
+
+
+def test_scan_order(generate_workchain_convergence, submit_candidates):
+    """Test that `ecut` and then the k-point density are scanned from coarse to fine with the converged values."""
+    process = generate_workchain_convergence(ecuts=[30, 10, 20], kpoints_distances=[0.2, 0.4, 0.3])
+    process.setup()
+
+    # The energy per atom is converged from `ecut` = 20 and `kpoints_distance` = 0.3
+    def energies(inputs):
+        ecut = inputs['abinit']['parameters']['ecut']
+        distance = inputs['kpoints_distance'].value
+        return (-10.0 - 0.1 * (ecut < 20) - 0.1 * (distance > 0.3) - 0.0002 * (ecut > 20))
+
+    submitted = submit_candidates(process, energies)
+
+    assert run_scan(process) is None
+    assert [inputs['abinit']['parameters']['ecut'] for inputs in submitted] == [10, 20, 30]
+    assert [inputs['kpoints_distance'].value for inputs in submitted] == [0.2] * 3
+    assert [inputs['metadata']['call_link_label'] for inputs in submitted] == ['ecut_0', 'ecut_1', 'ecut_2']
+    assert process.ctx.converged == {'ecut': 20}
+
+    submitted.clear()
+    assert run_scan(process) is None
+    assert [inputs['kpoints_distance'].value for inputs in submitted] == [0.4, 0.3, 0.2]
+    assert [inputs['abinit']['parameters']['ecut'] for inputs in submitted] == [20] * 3
+    assert process.ctx.converged == {'ecut': 20, 'kpoints_distance': 0.3}
+    assert not process.should_run_scan()
+
+    process.results()
+    output_convergence = process.outputs['output_convergence'].get_dict()
+    assert output_convergence['ecut'] == 20
+    assert output_convergence['kpoints_distance'] == 0.3
+    assert output_convergence['scans']['ecut']['values'] == [10, 20, 30]
+    assert output_convergence['scans']['ecut']['energies'] == pytest.approx([-10.1, -10.0, -10.0002])
+    assert output_convergence['scans']['kpoints_distance']['converged'] == 0.3
+    assert process.outputs['output_convergence'].creator is not None
+    candidate = orm.load_node(process.ctx.last_candidate)
+    assert process.outputs['converged']['output_parameters'].pk == candidate.outputs.output_parameters.pk
+
+
+@pytest.mark.parametrize('parameters,reuse_density', [
+    ({'ecut': 18.0}, True),
+    ({'ecut': 18.0, 'prtden': 0}, False),
+    ({'ecut': 18.0, 'ionmov': 2}, False),
+])
+def test_reuse_density(generate_workchain_convergence, submit_candidates, parameters, reuse_density):
+    """Test that the candidates submitted after others completed restart from the density of the finest one."""
+    process = generate_workchain_convergence(parameters=parameters, ecuts=[10, 20, 30], max_concurrent=1)
+    process.setup()
+    submitted = submit_candidates(process, lambda inputs: -2 * inputs['abinit']['parameters']['ecut'])
+
+    assert run_scan(process) == process.exit_codes.ERROR_CONVERGENCE_NOT_REACHED
+    assert len(submitted) == 3
+    assert 'parent_calc_folder' not in submitted[0]['abinit']
+
+    for index, inputs in enumerate(submitted[1:]):
+        if reuse_density:
+            candidate = orm.load_node(process.ctx.scan.points[index]['pk'])
+            assert inputs['abinit']['parent_calc_folder'].pk == candidate.outputs.remote_folder.pk
+            assert inputs['abinit']['settings']['PARENT_RESTART_FILES'] == ['DEN']
+        else:
+            assert 'parent_calc_folder' not in inputs['abinit']
+            assert 'settings' not in inputs['abinit']
+
+
+def test_max_concurrent(generate_workchain_convergence, submit_candidates):
+    """Test that with `max_concurrent`, a candidate is only converged if a second finer candidate confirms it."""
+    process = generate_workchain_convergence(ecuts=[10, 20, 30, 40, 50, 60, 70], max_concurrent=2)
+    process.setup()
+    # The first two candidates agree by chance, but not with the third
+    energies = {10: -10.0, 20: -10.0002, 30: -10.1, 40: -10.1001, 50: -10.1002, 60: -10.1003, 70: -10.1004}
+    submitted = submit_candidates(process, lambda inputs: energies[inputs['abinit']['parameters']['ecut']])
+
+    assert run_scan(process) is None
+    assert [inputs['abinit']['parameters']['ecut'] for inputs in submitted] == [10, 20, 30, 40, 50, 60]
+    assert process.ctx.converged == {'ecut': 30}
+
+
+def test_failed_candidate(generate_workchain_convergence, submit_candidates):
+    """Test that failed candidates are skipped when comparing the others."""
+    process = generate_workchain_convergence(ecuts=[10, 20, 30, 40])
+    process.setup()
+    energies = {10: -10.0, 20: None, 30: -10.0001, 40: -10.0002}
+
+    submit_candidates(process, lambda inputs: energies[inputs['abinit']['parameters']['ecut']])
+
+    assert run_scan(process) is None
+    assert process.ctx.converged == {'ecut': 10}
+
+    process.results()
+    energies = process.outputs['output_convergence']['scans']['ecut']['energies']
+    assert energies == pytest.approx([-10.0, None, -10.0001, -10.0002])